@@ -1,38 +1,160 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from import_export.admin  import ImportExportModelAdmin
 from core.models import (
-    CustomUser, UserProfile, Product,
+    CustomUser, UserProfile, Product, ProductVariant,
     Cart, CartItem, Order, OrderItem, CardDetails
 )
-from core.forms import ProductAdminForm
+from core.forms import ProductAdminForm, ProductVariantForm
+from core import exports, search, variants
 
 
 # Register your models here.
 
+# Row count of a table from the database statistics, without scanning it;
+# None when the backend has no cheap estimate
+def estimated_count(queryset):
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+            )
+        elif connection.vendor == 'sqlite':
+            # The largest rowid, read from the end of the primary key; an
+            # overestimate by the number of deleted rows
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for tables that were never analyzed
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+# Paginator that does not count whole large tables: an unfiltered change
+# list of more than ADMIN_EXACT_COUNT_LIMIT rows reports the table's
+# estimated size. Filtered lists are counted exactly, so every matching row
+# can be paged to.
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset.count()
+
+
+# Change list settings for tables too large to count or to render with a
+# query per row: bounded counts, no second count of the unfiltered table,
+# and the foreign keys shown in list_display joined in the page query
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 # Custom admin classes for each model
 
-class CustomUserAdmin(ImportExportModelAdmin):
-    pass
+class CustomUserAdmin(LargeTableAdminMixin, ImportExportModelAdmin):
+    list_display = ['email', 'username', 'is_active', 'is_staff', 'created_at']
+    search_fields = ['email', 'username']
 
 class UserProfileAdmin(ImportExportModelAdmin):
-    pass
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    form = ProductVariantForm
+    extra = 0
 
 
 class ProductAdmin(admin.ModelAdmin):
     form = ProductAdminForm
+    inlines = [ProductVariantInline]
     list_display = ['name', 'brand', 'price', 'stock', 'category']
     search_fields = ['name', 'brand']
     list_filter = ['category']
 
+    # Search through the full-text index instead of icontains table scans
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.filter_matching(queryset, search_term), False
+
+    # Write the variant rows with one delete, one bulk_update and one
+    # bulk_create instead of a statement per row
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductVariant:
+            return super().save_formset(request, form, formset, change)
+        formset.save(commit=False)
+        deleted = [variant.pk for variant in formset.deleted_objects]
+        if deleted:
+            ProductVariant.objects.filter(pk__in=deleted).delete()
+        changed = [variant for variant, _ in formset.changed_objects]
+        if changed:
+            ProductVariant.objects.bulk_update(
+                changed, ['size', 'color', 'size_in_stock', 'color_in_stock', 'stock', 'price_delta']
+            )
+        if formset.new_objects:
+            ProductVariant.objects.bulk_create(formset.new_objects)
+        variants.touch_products([form.instance.pk])
+
+
+class CartItemAdmin(LargeTableAdminMixin, ImportExportModelAdmin):
+    list_display = ['id', 'cart', 'product', 'quantity', 'color', 'size']
+    # Cart.__str__ reads cart.user
+    list_select_related = ['cart__user', 'product']
+    raw_id_fields = ['cart']
+    autocomplete_fields = ['product']
+
+# Export actions that stream the selected rows (or, with "select all",
+# every row matching the current filters) instead of building the
+# import-export dataset in memory; see core.exports
+class StreamingExportMixin:
+    actions = ['export_csv', 'export_jsonl']
+
+    def export_filename(self):
+        return self.model._meta.verbose_name_plural.replace(' ', '_')
+
+    @admin.action(description='Export selected %(verbose_name_plural)s as CSV (streaming)')
+    def export_csv(self, request, queryset):
+        return exports.streaming_export(queryset, 'csv', self.export_filename())
 
-class CartItemAdmin(ImportExportModelAdmin):
-    pass
+    @admin.action(description='Export selected %(verbose_name_plural)s as JSONL (streaming)')
+    def export_jsonl(self, request, queryset):
+        return exports.streaming_export(queryset, 'jsonl', self.export_filename())
 
-class OrderAdmin(ImportExportModelAdmin):
-    pass
+class OrderAdmin(LargeTableAdminMixin, StreamingExportMixin, ImportExportModelAdmin):
+    list_display = ['id', 'user', 'status', 'payment_method', 'item_count', 'total_price', 'placed_at']
+    list_select_related = ['user']
+    # Indexed by order_status_placed_idx
+    list_filter = ['status']
+    search_fields = ['=id']
+    raw_id_fields = ['user', 'card']
+    # Set when the order is placed; cancelling releases the stock only then
+    readonly_fields = ['stock_reserved']
 
-class OrderItemAdmin(ImportExportModelAdmin):
-    pass
+class OrderItemAdmin(LargeTableAdminMixin, StreamingExportMixin, ImportExportModelAdmin):
+    # product_name is the snapshot, so the catalog is not joined
+    list_display = ['id', 'order', 'product_name', 'quantity', 'unit_price', 'status']
+    list_select_related = ['order']
+    # Indexed by orderitem_status_idx
+    list_filter = ['status']
+    search_fields = ['=order__id']
+    raw_id_fields = ['order']
+    autocomplete_fields = ['product']
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# JWT authentication that resolves the token's user from the cache.
+#
+# The stock JWTAuthentication loads the user with a primary key query on
+# every request. This class caches what authentication and permission
+# checks need for AUTH_USER_CACHE_TIMEOUT seconds, keyed by the user id
+# claim: the id, is_active, is_staff and a marker of the password (the hash
+# revoke tokens carry), never the password hash itself. A request gets a
+# user with those fields loaded and the others deferred, loaded in one
+# query on first use. Only users that passed the stock checks (found and
+# active) are cached, and the entry
+# is deleted whenever the user is saved or deleted (see core.signals), so
+# deactivating a user or changing a password takes effect immediately.
+# Bulk QuerySet.update() calls skip the signals and are only picked up
+# once the entry expires.
+#
+# It is a drop-in replacement for
+# rest_framework_simplejwt.authentication.JWTAuthentication in
+# DEFAULT_AUTHENTICATION_CLASSES.
+
+PREFIX = 'auth:user:v2'
+
+# The user fields kept in the cache
+CACHED_FIELDS = ('id', 'is_active', 'is_staff')
+
+
+def timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def user_key(user_id):
+    return f'{PREFIX}:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+def cache_entry(user):
+    return {
+        'fields': {name: getattr(user, name) for name in CACHED_FIELDS},
+        'password': get_md5_hash_password(user.password),
+    }
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            # Let the stock implementation report the invalid token
+            return super().get_user(validated_token)
+
+        key = user_key(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            user = super().get_user(validated_token)
+            cache.set(key, cache_entry(user), timeout())
+            return user
+
+        # The cached user is active; the password check depends on the token
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry['password']:
+                raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        fields = entry['fields']
+        return self.user_model.from_db(None, list(fields), list(fields.values()))
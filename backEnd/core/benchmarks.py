@@ -0,0 +1,61 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+# Helpers shared by the benchmark_* management commands.
+# Benchmarks run against a throwaway test database so they never touch the
+# data of the configured database.
+
+# name places the database in a file on SQLite instead of in memory, for
+# data sets that should not count towards the process memory
+@contextmanager
+def throwaway_database(verbosity=0, name=None):
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name is not None:
+        test_settings['NAME'] = name
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        test_settings['NAME'] = old_test_name
+
+
+# Run fn repeat times and return the timings in milliseconds
+def time_calls(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+# Count the queries run by fn. Unlike CaptureQueriesContext this survives
+# the query log reset done at the start of every request.
+def count_queries(fn):
+    executed = []
+
+    def record(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        fn()
+    return len(executed)
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'min': ordered[0],
+    }
@@ -0,0 +1,135 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import db_routers
+
+
+# Read-through cache for serialized product payloads.
+#
+# Detail payloads are stored under one key per product id, as a dict keyed
+# by the request origin (image URLs are absolute), and that key is deleted
+# when the product changes. List payloads (one per query string, including the cursor) embed
+# a catalog version number in their key; any product change bumps the
+# version, which orphans every cached list page at once without scanning
+# keys. Orphaned entries simply expire.
+#
+# Payloads are always built from the primary database. A replica that lags
+# behind a change would otherwise cache the old rows under the new catalog
+# version, where they would stay until the next change.
+#
+# Hit and miss counters live in the cache too, so they are shared by all
+# workers when a shared backend such as Redis is configured.
+
+PREFIX = 'products'
+VERSION_KEY = f'{PREFIX}:version'
+HITS_KEY = f'{PREFIX}:stats:hits'
+MISSES_KEY = f'{PREFIX}:stats:misses'
+
+
+def timeout():
+    return getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a version lost to eviction is never reused
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+# The URL of a list request with its query parameters sorted, so the same
+# page asked for with the parameters in another order shares its cache
+# entry and validators
+def list_url(request):
+    params = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    query = urlencode(params)
+    return f"{request.scheme}://{request.get_host()}{request.path}{'?' if query else ''}{query}"
+
+
+def list_key(url, version=None):
+    if version is None:
+        version = catalog_version()
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return f'{PREFIX}:list:v{version}:{digest}'
+
+
+def detail_key(product_id):
+    return f'{PREFIX}:detail:{product_id}'
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The key does not exist yet (or was evicted)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+# Return the payload cached under key, or build it with producer() and
+# cache it. producer is expected to raise for anything that should not be
+# cached, e.g. Http404.
+def get_or_set(key, producer):
+    data = cache.get(key)
+    if data is not None:
+        _increment(HITS_KEY)
+        return data
+
+    _increment(MISSES_KEY)
+    with db_routers.primary_reads():
+        data = producer()
+    cache.set(key, data, timeout())
+    return data
+
+
+# Same as get_or_set() for a product detail payload rendered for origin
+def get_or_set_detail(product_id, origin, producer):
+    key = detail_key(product_id)
+    entry = cache.get(key) or {}
+    if origin in entry:
+        _increment(HITS_KEY)
+        return entry[origin]
+
+    _increment(MISSES_KEY)
+    with db_routers.primary_reads():
+        entry[origin] = producer()
+    cache.set(key, entry, timeout())
+    return entry[origin]
+
+
+# Drop the cached detail of a product and every cached list page
+def invalidate_product(product_id):
+    invalidate_products([product_id])
+
+
+def invalidate_products(product_ids):
+    cache.delete_many([detail_key(product_id) for product_id in product_ids])
+    invalidate_lists()
+
+
+def invalidate_lists():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
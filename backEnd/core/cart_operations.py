@@ -0,0 +1,160 @@
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from rest_framework.exceptions import ValidationError
+
+from . import variants
+from .models import Cart, CartItem
+
+
+# Batched cart operations.
+#
+# A batch is a list of operations applied in order:
+#     {"op": "add", "product": 12, "quantity": 1, "color": "Black", "size": "128GB"}
+#     {"op": "increment", "item": 5}
+#     {"op": "decrement", "item": 5}
+#     {"op": "remove", "item": 5}
+#     {"op": "set_quantity", "item": 5, "quantity": 3}
+# Operations are folded in memory over the cart's current items, then the
+# result is written with three statements whatever the size of the batch:
+# - one UPDATE of the existing items. Items the batch only increments or
+#   decrements get the difference added to their quantity in the database,
+#   so a change committed by another request since they were read is kept;
+#   items the batch sets or removes get their new quantity.
+# - one DELETE of the changed items left at zero.
+# - one upsert of the variants the cart did not hold, which increments an
+#   item of the same variant added by another request meanwhile.
+# Quantities that reach zero remove the item.
+
+# Raised by apply_operations() with the body of the 400 response
+class CartOperationError(Exception):
+    def __init__(self, detail):
+        super().__init__(detail["detail"])
+        self.detail = detail
+
+
+OPERATIONS = {'add', 'increment', 'decrement', 'remove', 'set_quantity'}
+MAX_OPERATIONS = 100
+# Largest value of an SQLite integer column, for ids and quantities
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def _positive_int(value, allow_zero=False):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    if number < 0 or (number == 0 and not allow_zero) or number > MAX_INTEGER:
+        return None
+    return number
+
+
+# Check the shape of every operation before anything is read or written
+def validate_operations(operations):
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError({"operations": "Must be a non-empty list."})
+    if len(operations) > MAX_OPERATIONS:
+        raise ValidationError({"operations": f"At most {MAX_OPERATIONS} operations per batch."})
+
+    cleaned = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise ValidationError({"operations": f"Operation {index}: op must be one of {sorted(OPERATIONS)}."})
+        op = operation['op']
+
+        if op == 'add':
+            product_id = _positive_int(operation.get('product'))
+            quantity = _positive_int(operation.get('quantity', 1))
+            if product_id is None or quantity is None:
+                raise ValidationError({"operations": f"Operation {index}: add needs a product and a positive quantity."})
+            cleaned.append({
+                'op': op, 'product': product_id, 'quantity': quantity,
+                'color': operation.get('color') or '', 'size': operation.get('size') or '',
+            })
+            continue
+
+        item_id = _positive_int(operation.get('item'))
+        if item_id is None:
+            raise ValidationError({"operations": f"Operation {index}: {op} needs an item id."})
+        entry = {'op': op, 'item': item_id}
+        if op == 'set_quantity':
+            entry['quantity'] = _positive_int(operation.get('quantity'), allow_zero=True)
+            if entry['quantity'] is None:
+                raise ValidationError({"operations": f"Operation {index}: set_quantity needs a quantity of 0 or more."})
+        cleaned.append(entry)
+    return cleaned
+
+
+# Apply validated operations to the cart. Must run inside
+# transaction.atomic(); raises CartOperationError for unknown items or
+# products, which rolls the whole batch back.
+def apply_operations(cart, operations):
+    item_ids = {op['item'] for op in operations if 'item' in op}
+    product_ids = {op['product'] for op in operations if op['op'] == 'add'}
+
+    # Current items, locked until the batch is written where supported
+    items = {item.pk: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+    unknown = sorted(item_ids - items.keys())
+    if unknown:
+        raise CartOperationError({"detail": "Some items are not in the cart.", "unknown_item_ids": unknown})
+    # The products with their variants, in one query
+    known = variants.variants_by_product(product_ids)
+    missing = sorted(product_ids - known.keys())
+    if missing:
+        raise CartOperationError({"detail": "Some products do not exist.", "missing_product_ids": missing})
+    unknown = sorted({
+        op['product'] for op in operations
+        if op['op'] == 'add' and not variants.is_known_variant(known[op['product']], op['size'], op['color'])
+    })
+    if unknown:
+        raise CartOperationError({
+            "detail": "Some items name a size or color the product does not have.",
+            "unknown_variant_product_ids": unknown,
+        })
+
+    by_variant = {(item.product_id, item.color, item.size): item for item in items.values()}
+    original = {pk: item.quantity for pk, item in items.items()}
+    # Items given a quantity by set_quantity or remove
+    assigned = set()
+    new_items = {}
+
+    for op in operations:
+        if op['op'] == 'add':
+            variant = (op['product'], op['color'], op['size'])
+            item = by_variant.get(variant)
+            if item is None:
+                item = CartItem(cart=cart, product_id=op['product'], color=op['color'], size=op['size'], quantity=0)
+                by_variant[variant] = new_items[variant] = item
+            item.quantity += op['quantity']
+            continue
+
+        item = items[op['item']]
+        if op['op'] == 'increment':
+            item.quantity += 1
+        elif op['op'] == 'decrement':
+            item.quantity = max(item.quantity - 1, 0)
+        elif op['op'] == 'remove':
+            item.quantity = 0
+            assigned.add(item.pk)
+        elif op['op'] == 'set_quantity':
+            item.quantity = op['quantity']
+            assigned.add(item.pk)
+
+    if any(item.quantity > MAX_INTEGER for item in [*items.values(), *new_items.values()]):
+        raise CartOperationError({"detail": "Some quantities are too large."})
+
+    changed = {pk: item.quantity for pk, item in items.items() if pk in assigned or item.quantity != original[pk]}
+    if changed:
+        CartItem.objects.filter(pk__in=list(changed)).update(quantity=Case(
+            *[
+                When(pk=pk, then=Value(quantity) if pk in assigned else Greatest(
+                    F('quantity') + Value(quantity - original[pk]), Value(0)
+                ))
+                for pk, quantity in changed.items()
+            ],
+            output_field=IntegerField(),
+        ))
+        CartItem.objects.filter(pk__in=list(changed), quantity=0).delete()
+    CartItem.objects.add_items(cart.pk, [
+        (item.product_id, item.color, item.size, item.quantity) for item in new_items.values()
+    ])
+    Cart.objects.filter(pk=cart.pk).touch()
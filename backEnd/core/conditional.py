@@ -0,0 +1,33 @@
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+# HTTP conditional requests for API reads.
+# Views compute their validators from a cheap aggregate query (latest
+# updated_at plus a row count) or, for the product list, from the catalog
+# version of core.caching, answer 304 when the client's copy is still
+# current, and only serialize the payload otherwise.
+
+def make_validators(last_updated, *parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in (last_updated, *parts)).encode('utf-8'))
+    etag = quote_etag(digest.hexdigest())
+    last_modified = timegm(last_updated.utctimetuple()) if last_updated else None
+    return etag, last_modified
+
+
+# Return a 304 response if the request's If-None-Match/If-Modified-Since
+# match the validators, otherwise the response built by build_response()
+# with the validators attached
+def conditional(request, etag, last_modified, build_response):
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    response = not_modified if not_modified is not None else build_response()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Let browsers keep the payload but always revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,88 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+
+# Primary/replica routing for reads.
+#
+# Reads go to one of the REPLICA_DATABASES aliases only inside a
+# replica_reads() block, which ReplicaReadsMiddleware opens for safe
+# (GET/HEAD/OPTIONS) requests. Everything else reads from the primary:
+#   - requests with unsafe methods, management commands and tests;
+#   - the rest of a request once it has written anything, so it reads its
+#     own writes;
+#   - reads inside transaction.atomic(), e.g. select_for_update();
+#   - code in a primary_reads() block, or querysets that opt out with
+#     .using(PRIMARY).
+# Writes always go to the primary.
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+_reads = ContextVar('database_reads', default=PRIMARY)
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+@contextmanager
+def replica_reads():
+    token = _reads.set(REPLICA)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    token = _reads.set(PRIMARY)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+# Send the remaining reads of the current block or request to the primary
+def pin_primary():
+    _reads.set(PRIMARY)
+
+
+# True when the hinted instance lives in a database this router does not
+# manage, e.g. one a benchmark set up; Django then keeps it there
+def _unmanaged_instance(hints):
+    instance = hints.get('instance')
+    return instance is not None and instance._state.db not in (None, PRIMARY, *replicas())
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _unmanaged_instance(hints):
+            return None
+        names = replicas()
+        if _reads.get() != REPLICA or not names or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(names)
+
+    def db_for_write(self, model, **hints):
+        if _unmanaged_instance(hints):
+            return None
+        pin_primary()
+        return PRIMARY
+
+    # Replicas hold the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    # Replicas get their schema from the primary
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
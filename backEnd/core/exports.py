@@ -0,0 +1,124 @@
+import csv
+import json
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Order, OrderItem
+from .renderers import orjson
+
+
+# Streaming exports of orders and order items, for the admin and the
+# export_orders command.
+#
+# Rows are read with .iterator() and the foreign keys they show are joined
+# in the same query, so an export holds one chunk of rows at a time and
+# runs one query per chunk however many orders there are. Each row is
+# written out as soon as it is read.
+
+CHUNK_SIZE = 2000
+
+# Column name -> value of the column for a row
+ORDER_COLUMNS = {
+    'id': lambda order: order.id,
+    'placed_at': lambda order: order.placed_at,
+    'user_id': lambda order: order.user_id,
+    'username': lambda order: order.user.username,
+    'email': lambda order: order.user.email,
+    'status': lambda order: order.status,
+    'payment_method': lambda order: order.payment_method,
+    'item_count': lambda order: order.item_count,
+    'total_price': lambda order: order.total_price,
+    'shipping_address': lambda order: order.shipping_address,
+    'billing_address': lambda order: order.billing_address,
+}
+
+ORDER_ITEM_COLUMNS = {
+    'id': lambda item: item.id,
+    'order_id': lambda item: item.order_id,
+    'placed_at': lambda item: item.order.placed_at,
+    'user_id': lambda item: item.order.user_id,
+    'username': lambda item: item.order.user.username,
+    'product_id': lambda item: item.product_id,
+    'product_name': lambda item: item.product_name,
+    'brand': lambda item: item.product.brand,
+    'category': lambda item: item.product.category,
+    'status': lambda item: item.status,
+    'quantity': lambda item: item.quantity,
+    'unit_price': lambda item: item.unit_price,
+    'total_price': lambda item: item.get_total_price(),
+    'color': lambda item: item.color,
+    'size': lambda item: item.size,
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+# The column set and the joins an export of this model needs
+def export_spec(model):
+    if model is Order:
+        return ORDER_COLUMNS, ('user',)
+    if model is OrderItem:
+        return ORDER_ITEM_COLUMNS, ('order__user', 'product')
+    raise ValueError(f'No export for {model.__name__}.')
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    columns, related = export_spec(queryset.model)
+    if not queryset.ordered:
+        queryset = queryset.order_by('pk')
+    for obj in queryset.select_related(*related).iterator(chunk_size=chunk_size):
+        yield {name: value(obj) for name, value in columns.items()}
+
+
+# File-like object for csv.writer that hands back each line instead of
+# storing it
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+# Prices stay exact, as strings, like the API writes them; datetimes are
+# written by DRF's encoder, as in API responses
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return JSONEncoder().default(value)
+
+
+# One JSON object per line
+def jsonl_lines(rows):
+    if orjson is not None:
+        options = orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME
+        for row in rows:
+            yield orjson.dumps(row, default=_json_default, option=options)
+    else:
+        for row in rows:
+            yield json.dumps(row, default=_json_default) + '\n'
+
+
+def export_lines(queryset, file_format, chunk_size=CHUNK_SIZE):
+    rows = export_rows(queryset, chunk_size)
+    if file_format == 'csv':
+        columns, _ = export_spec(queryset.model)
+        return csv_lines(list(columns), rows)
+    if file_format == 'jsonl':
+        return jsonl_lines(rows)
+    raise ValueError(f'Unknown export format {file_format!r}.')
+
+
+def streaming_export(queryset, file_format, filename):
+    response = StreamingHttpResponse(export_lines(queryset, file_format), content_type=FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
@@ -0,0 +1,141 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import ProductVariant
+
+
+# Server-side filtering for the product catalog.
+# Every supported parameter maps onto a column covered by an index
+# declared on Product:
+#   ?category=Headphones or ?category=Headphones,Tablets
+#   ?brand=Apple
+#   ?price_min=100&price_max=500
+#   ?in_stock=true|false
+#   ?size=256GB&color=Blue (either or both: products in stock with a
+#   variant of that size and color offered and in stock, through
+#   variant_available_idx)
+class ProductFilterBackend(BaseFilterBackend):
+    TRUE_VALUES = {'true', '1', 'yes'}
+    FALSE_VALUES = {'false', '0', 'no'}
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        categories = [c.strip() for c in params.get('category', '').split(',') if c.strip()]
+        if len(categories) == 1:
+            queryset = queryset.filter(category=categories[0])
+        elif categories:
+            queryset = queryset.filter(category__in=categories)
+
+        brand = params.get('brand', '').strip()
+        if brand:
+            queryset = queryset.filter(brand=brand)
+
+        price_min = self.parse_price(params, 'price_min')
+        if price_min is not None:
+            queryset = queryset.filter(price__gte=price_min)
+        price_max = self.parse_price(params, 'price_max')
+        if price_max is not None:
+            queryset = queryset.filter(price__lte=price_max)
+
+        in_stock = params.get('in_stock', '').strip().lower()
+        if in_stock in self.TRUE_VALUES:
+            queryset = queryset.filter(stock__gt=0)
+        elif in_stock in self.FALSE_VALUES:
+            queryset = queryset.filter(stock=0)
+        elif in_stock:
+            raise ValidationError({'in_stock': 'Must be true or false.'})
+
+        variant = {name: params.get(name, '').strip() for name in ('size', 'color')}
+        variant = {name: value for name, value in variant.items() if value}
+        if variant:
+            queryset = queryset.filter(
+                stock__gt=0,
+                pk__in=ProductVariant.objects.filter(
+                    size_in_stock=True, color_in_stock=True, stock__gt=0, **variant
+                ).values('product_id'),
+            )
+
+        return queryset
+
+    def parse_price(self, params, name):
+        value = params.get(name, '').strip()
+        if not value:
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'Must be a number.'})
+        if not price.is_finite() or price < 0:
+            raise ValidationError({name: 'Must be a positive number.'})
+        return price
+
+
+# Ordering for the product catalog, e.g. ?ordering=price,-created_at.
+# The id is appended as a tie-breaker so cursor pagination stays stable
+# when several products share the same sort value.
+class ProductOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+
+# Filtering for a customer's order history:
+#   ?status=Cancelled
+#   ?since=2024-01-01&until=2024-01-31 (dates or ISO datetimes; a date
+#   given to until includes that whole day)
+class OrderFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        order_status = params.get('status', '').strip()
+        if order_status:
+            queryset = queryset.filter(status=order_status)
+
+        since = self.parse_moment(params, 'since')
+        if since is not None:
+            queryset = queryset.filter(placed_at__gte=since)
+        until = self.parse_moment(params, 'until', end_of_day=True)
+        if until is not None:
+            queryset = queryset.filter(placed_at__lt=until)
+
+        return queryset
+
+    def parse_moment(self, params, name, end_of_day=False):
+        value = params.get(name, '').strip()
+        if not value:
+            return None
+        try:
+            return parse_moment(value, end_of_day)
+        except ValueError:
+            raise ValidationError({name: 'Must be a date or an ISO 8601 datetime.'})
+
+
+# An aware datetime from a date or an ISO 8601 datetime; with end_of_day,
+# the exclusive upper bound that includes the given day or moment.
+# Raises ValueError for anything else.
+def parse_moment(value, end_of_day=False):
+    # Dates first: parse_datetime() also accepts a bare date
+    day = parse_date(value)
+    if day is not None:
+        if end_of_day:
+            day += datetime.timedelta(days=1)
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'{value!r} is not a date or a datetime.')
+        if end_of_day:
+            # until is inclusive for datetimes too
+            moment += datetime.timedelta(microseconds=1)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
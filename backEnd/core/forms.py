@@ -1,65 +1,85 @@
 from django import forms
-from .models import Product
+from .models import Product, ProductVariant
 import json
 
-class ProductAdminForm(forms.ModelForm):
-    STORAGE_OPTIONS = {"64GB", "128GB", "256GB", "512GB", "1TB"}
-    COLOR_OPTIONS = {"Black", "White", "Silver", "Gold", "Blue"}
 
+# In the order the admin offers them
+STORAGE_OPTIONS = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+COLOR_OPTIONS = ["Black", "White", "Silver", "Gold", "Blue"]
+
+
+# Validation of the storage and colors lists of a product (see
+# core.variants), shared by the API and the import_products command. Both
+# accept a list or its JSON text and return the list.
+
+def validate_storage(raw_value):
+    if isinstance(raw_value, str):
+        try:
+            value = json.loads(raw_value)
+        except Exception:
+            raise forms.ValidationError('Invalid JSON format. Example: [{"size": "128GB", "in_stock": true}]')
+    else:
+        value = raw_value
+
+    if not isinstance(value, list):
+        raise forms.ValidationError("Storage must be a list.")
+
+    for item in value:
+        if not isinstance(item, dict):
+            raise forms.ValidationError("Each item must be a dictionary with keys 'size' and 'in_stock'.")
+        if "size" not in item or "in_stock" not in item:
+            raise forms.ValidationError("Missing 'size' or 'in_stock' in one or more items.")
+        if item["size"] not in STORAGE_OPTIONS:
+            raise forms.ValidationError(f"Invalid size: '{item['size']}'. Allowed: {sorted(STORAGE_OPTIONS)}")
+        if not isinstance(item["in_stock"], bool):
+            raise forms.ValidationError(f"'in_stock' must be true or false for size '{item['size']}'.")
+
+    return value
+
+
+def validate_colors(raw_value):
+    if isinstance(raw_value, str):
+        try:
+            value = json.loads(raw_value)
+        except Exception:
+            raise forms.ValidationError('Invalid JSON format. Example: [{"color": "Black", "in_stock": true}]')
+    else:
+        value = raw_value
+
+    if not isinstance(value, list):
+        raise forms.ValidationError("Colors must be a list.")
+
+    for item in value:
+        if not isinstance(item, dict):
+            raise forms.ValidationError("Each item must be a dictionary with keys 'color' and 'in_stock'.")
+        if "color" not in item or "in_stock" not in item:
+            raise forms.ValidationError("Missing 'color' or 'in_stock' in one or more items.")
+        if item["color"] not in COLOR_OPTIONS:
+            raise forms.ValidationError(f"Invalid color: '{item['color']}'. Allowed: {sorted(COLOR_OPTIONS)}")
+        if not isinstance(item["in_stock"], bool):
+            raise forms.ValidationError(f"'in_stock' must be true or false for color '{item['color']}'.")
+
+    return value
+
+
+class ProductAdminForm(forms.ModelForm):
     class Meta:
         model = Product
         fields = '__all__'
-        help_texts = {
-            'storage': 'Enter a JSON list like: [{"size": "128GB", "in_stock": true}]. Allowed sizes: 64GB, 128GB, 256GB, 512GB, 1TB',
-            'colors': 'Enter a JSON list like: [{"color": "Black", "in_stock": true}]. Allowed colors: Black, White, Silver, Gold, Blue',
-        }
-
-    def clean_storage(self):
-        raw_value = self.cleaned_data.get('storage')
-        if isinstance(raw_value, str):
-            try:
-                value = json.loads(raw_value)
-            except Exception:
-                raise forms.ValidationError('Invalid JSON format. Example: [{"size": "128GB", "in_stock": true}]')
-        else:
-            value = raw_value
-
-        if not isinstance(value, list):
-            raise forms.ValidationError("Storage must be a list.")
-
-        for item in value:
-            if not isinstance(item, dict):
-                raise forms.ValidationError("Each item must be a dictionary with keys 'size' and 'in_stock'.")
-            if "size" not in item or "in_stock" not in item:
-                raise forms.ValidationError("Missing 'size' or 'in_stock' in one or more items.")
-            if item["size"] not in self.STORAGE_OPTIONS:
-                raise forms.ValidationError(f"Invalid size: '{item['size']}'. Allowed: {sorted(self.STORAGE_OPTIONS)}")
-            if not isinstance(item["in_stock"], bool):
-                raise forms.ValidationError(f"'in_stock' must be true or false for size '{item['size']}'.")
-
-        return value
-
-    def clean_colors(self):
-        raw_value = self.cleaned_data.get('colors')
-        if isinstance(raw_value, str):
-            try:
-                value = json.loads(raw_value)
-            except Exception:
-                raise forms.ValidationError('Invalid JSON format. Example: [{"color": "Black", "in_stock": true}]')
-        else:
-            value = raw_value
-
-        if not isinstance(value, list):
-            raise forms.ValidationError("Colors must be a list.")
-
-        for item in value:
-            if not isinstance(item, dict):
-                raise forms.ValidationError("Each item must be a dictionary with keys 'color' and 'in_stock'.")
-            if "color" not in item or "in_stock" not in item:
-                raise forms.ValidationError("Missing 'color' or 'in_stock' in one or more items.")
-            if item["color"] not in self.COLOR_OPTIONS:
-                raise forms.ValidationError(f"Invalid color: '{item['color']}'. Allowed: {sorted(self.COLOR_OPTIONS)}")
-            if not isinstance(item["in_stock"], bool):
-                raise forms.ValidationError(f"'in_stock' must be true or false for color '{item['color']}'.")
-
-        return value
+
+
+# A row of the product admin's variant inline: the size and color come from
+# the same options as the storage and colors lists
+class ProductVariantForm(forms.ModelForm):
+    size = forms.ChoiceField(choices=[('', '---------')] + [(size, size) for size in STORAGE_OPTIONS], required=False)
+    color = forms.ChoiceField(choices=[('', '---------')] + [(color, color) for color in COLOR_OPTIONS], required=False)
+
+    class Meta:
+        model = ProductVariant
+        fields = ['size', 'color', 'size_in_stock', 'color_in_stock', 'stock', 'price_delta']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('size') and not cleaned_data.get('color'):
+            raise forms.ValidationError('Choose a size, a color or both.')
+        return cleaned_data
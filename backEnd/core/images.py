@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import posixpath
+import queue
+import threading
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+# Resized variants of the product images.
+#
+# Every uploaded image gets a WebP and a JPEG copy per variant width,
+# stored next to the original under variants/ with a name derived from the
+# original's, so serializers build the URLs without touching the database.
+# They are generated on upload by a background worker thread (see
+# core.signals) and for existing images by the generate_image_variants
+# command. Their URLs are only returned once they exist: whether they do is
+# checked in the storage once and then remembered in the cache.
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> width in pixels; images are never upscaled
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1024,
+}
+# Format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, variant, image_format):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    extension = FORMATS[image_format][0]
+    return posixpath.join(directory, 'variants', f'{stem}-{variant}.{extension}')
+
+
+def variant_names(name):
+    return [
+        variant_name(name, variant, image_format)
+        for variant in VARIANTS
+        for image_format in FORMATS
+    ]
+
+
+# The images dict returned by the API for an image name: the original, each
+# variant per format and srcset strings per format. None while the
+# variants are not generated yet, as for a product without an image. url
+# turns a storage URL into the one to return, e.g. an absolute URI.
+def image_urls(name, storage, url=lambda path: path):
+    if not name or not variants_ready(name, storage):
+        return None
+    images = {'original': url(storage.url(name))}
+    srcset = {image_format: [] for image_format in FORMATS}
+    for variant, width in VARIANTS.items():
+        images[variant] = {}
+        for image_format in FORMATS:
+            variant_url = url(storage.url(variant_name(name, variant, image_format)))
+            images[variant][image_format] = variant_url
+            srcset[image_format].append(f'{variant_url} {width}w')
+    images['srcset'] = {image_format: ', '.join(entries) for image_format, entries in srcset.items()}
+    return images
+
+
+def has_variants(name, storage):
+    return all(storage.exists(path) for path in variant_names(name))
+
+
+def ready_key(name):
+    return f"images:ready:{hashlib.sha1(name.encode('utf-8')).hexdigest()}"
+
+
+# Whether every variant of the image exists. Variant names are fixed and
+# variants are never deleted, so only a positive answer is remembered.
+def variants_ready(name, storage):
+    if cache.get(ready_key(name)):
+        return True
+    if not has_variants(name, storage):
+        return False
+    mark_ready(name)
+    return True
+
+
+def mark_ready(name):
+    cache.set(ready_key(name), True, timeout=None)
+
+
+def _encode(image, image_format):
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten transparent images onto white
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), **FORMATS[image_format][1])
+    return buffer.getvalue()
+
+
+# Store content under exactly this name. Content-hashed storage would
+# rename the file, so it is asked to keep the name (see core.storage).
+def _save_exact(storage, name, content):
+    if hasattr(storage, 'save_exact'):
+        return storage.save_exact(name, content)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+# Write every variant of the image stored under name. Existing variants are
+# replaced, as the names are fixed.
+def generate_variants(name, storage):
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    for variant, width in VARIANTS.items():
+        resized = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in FORMATS:
+            path = variant_name(name, variant, image_format)
+            _save_exact(storage, path, ContentFile(_encode(resized, image_format)))
+    mark_ready(name)
+
+
+# Background generation: a single daemon thread works through the queue
+# so uploads do not wait for the resizing
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _work():
+    while True:
+        name, storage, on_done = _queue.get()
+        try:
+            generate_variants(name, storage)
+            if on_done is not None:
+                on_done()
+        except Exception:
+            logger.exception('Could not generate the variants of %s', name)
+        finally:
+            _queue.task_done()
+
+
+# on_done runs in the worker once the variants exist, e.g. to drop cached
+# payloads built without them
+def schedule(name, storage, on_done=None):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='image-variants', daemon=True)
+            _worker.start()
+    _queue.put((name, storage, on_done))
+
+
+# Block until every scheduled image has been processed
+def wait():
+    _queue.join()
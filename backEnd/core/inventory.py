@@ -0,0 +1,133 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import caching
+from .models import Product, ProductVariant
+
+
+# Stock reservation for orders.
+#
+# Stock is taken with conditional UPDATEs:
+#     UPDATE core_product SET stock = stock - n WHERE id = %s AND stock >= n
+# The database applies the check and the decrement atomically, so
+# concurrent orders can never drive stock below zero, and no row is locked
+# while the application decides anything. The reserve functions must run
+# inside the caller's transaction.atomic() block so a failed order rolls
+# back every reservation it already made. Ordered variants have their own
+# stock taken the same way (see core.variants).
+
+
+class Shortage(Exception):
+    pass
+
+
+# Sum the quantities of lines given as (product_id, quantity) pairs
+def quantities_by_product(lines):
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return quantities
+
+
+# Take stock for every product. Returns the lines that could not be
+# reserved as dicts with the requested and currently available quantities;
+# an empty list means everything was reserved.
+def reserve_stock(quantities):
+    failed = _reserve(Product.objects.all(), quantities, updated_at=timezone.now())
+    if not failed:
+        _invalidate(quantities)
+        return []
+
+    available = dict(Product.objects.filter(pk__in=failed).values_list('id', 'stock'))
+    return [
+        {"product": product_id, "requested": quantities[product_id], "available": available.get(product_id, 0)}
+        for product_id in failed
+    ]
+
+
+# Give back stock taken by reserve_stock(), e.g. when an order is cancelled
+def release_stock(quantities):
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=list(quantities)).update(
+        stock=F('stock') + _quantity_case(quantities), updated_at=timezone.now()
+    )
+    _invalidate(quantities)
+
+
+# Take stock for every variant, keyed by variant id, the way reserve_stock()
+# does for products. Only offered variants can be taken. The lines that
+# could not be reserved name their product, size and color. The products of
+# the variants are reserved with them, which marks them as changed and
+# drops their cached payloads.
+def reserve_variant_stock(quantities):
+    failed = _reserve(ProductVariant.objects.filter(size_in_stock=True, color_in_stock=True), quantities)
+    if not failed:
+        return []
+
+    variants = ProductVariant.objects.in_bulk(failed)
+    return [
+        {
+            "product": variants[variant_id].product_id,
+            "size": variants[variant_id].size,
+            "color": variants[variant_id].color,
+            "requested": quantities[variant_id],
+            "available": variants[variant_id].stock if variants[variant_id].offered else 0,
+        }
+        for variant_id in failed
+    ]
+
+
+# Give back stock taken by reserve_variant_stock()
+def release_variant_stock(quantities):
+    if not quantities:
+        return
+    ProductVariant.objects.filter(pk__in=list(quantities)).update(stock=F('stock') + _quantity_case(quantities))
+
+
+# Take quantities (pk -> quantity) from the stock of the rows of queryset.
+# Returns the sorted pks that could not be reserved; the others stay
+# reserved, so the caller rolls its transaction back on a shortage.
+def _reserve(queryset, quantities, **changes):
+    if not quantities:
+        return []
+
+    # Fast path: one UPDATE for the whole order, undone through a savepoint
+    # if any row is short
+    requested = _quantity_case(quantities)
+    try:
+        with transaction.atomic():
+            updated = queryset.filter(pk__in=list(quantities), stock__gte=requested).update(
+                stock=F('stock') - requested, **changes
+            )
+            if updated != len(quantities):
+                raise Shortage()
+        return []
+    except Shortage:
+        pass
+
+    # Slow path: reserve row by row to find out which are short
+    failed = []
+    for pk, quantity in sorted(quantities.items()):
+        updated = queryset.filter(pk=pk, stock__gte=quantity).update(stock=F('stock') - quantity, **changes)
+        if not updated:
+            failed.append(pk)
+    return failed
+
+
+# CASE expression mapping each id to its quantity
+def _quantity_case(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+# Queryset updates skip the model signals, so drop the cached payloads here,
+# once the stock change is committed
+def _invalidate(quantities):
+    product_ids = list(quantities)
+    transaction.on_commit(lambda: caching.invalidate_products(product_ids))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import authentication
+from core.benchmarks import count_queries, summarize, throwaway_database, time_calls
+from core.models import Cart, CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Measure the queries and latency saved per request by the cached JWT user lookup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', default='/api/cart/me/,/api/orders/me/', help='Comma-separated API paths.')
+        parser.add_argument('--repeat', type=int, default=200, help='Requests per path and mode.')
+
+    def handle(self, *args, **options):
+        paths = [path for path in options['paths'].split(',') if path]
+
+        with throwaway_database():
+            user = CustomUser.objects.create_user('bench', 'bench@example.com', password='bench-pass-123')
+            Cart.objects.create(user=user)
+
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+
+            self.stdout.write(
+                f"{'path':<20} {'cold queries':>12} {'warm queries':>12} {'cold ms':>8} {'warm ms':>8}"
+            )
+            for path in paths:
+                def warm():
+                    response = client.get(path)
+                    assert response.status_code == 200, response.data
+
+                # A cold request misses the cache and loads the user like
+                # the stock JWTAuthentication does
+                def cold():
+                    authentication.invalidate_user(user.id)
+                    warm()
+
+                cold_queries = count_queries(cold)
+                warm()
+                warm_queries = count_queries(warm)
+                cold_stats = summarize(time_calls(cold, options['repeat']))
+                warm_stats = summarize(time_calls(warm, options['repeat']))
+                self.stdout.write(
+                    f"{path:<20} {cold_queries:>12} {warm_queries:>12} "
+                    f"{cold_stats['median']:>8.2f} {warm_stats['median']:>8.2f}"
+                )
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import throwaway_database
+from core.models import Product
+
+
+CATEGORIES = [value for value, _ in Product.CATEGORY_CHOICES]
+STORAGE = [{"size": "128GB", "in_stock": True}, {"size": "256GB", "in_stock": False}]
+COLORS = [{"color": "Black", "in_stock": True}]
+
+
+def generate_rows(count):
+    for i in range(count):
+        yield {
+            'name': f'Product {i}',
+            'brand': f'Brand {i % 50}',
+            'description': f'Imported product number {i}',
+            'price': f'{10 + i % 990}.99',
+            'stock': i % 100,
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'storage': STORAGE,
+            'colors': COLORS,
+        }
+
+
+# Write the file row by row so generating it does not hold it in memory
+def write_file(path, file_format, count):
+    with path.open('w', newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            writer = csv.DictWriter(file, fieldnames=['name', 'brand', 'description', 'price', 'stock', 'category', 'storage', 'colors'])
+            writer.writeheader()
+            for row in generate_rows(count):
+                writer.writerow({**row, 'storage': json.dumps(row['storage']), 'colors': json.dumps(row['colors'])})
+        else:
+            for row in generate_rows(count):
+                file.write(json.dumps(row) + '\n')
+
+
+def peak_memory_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Measure import_products throughput and peak memory as the file grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,1000000', help='Comma-separated row counts.')
+        parser.add_argument('--formats', default='csv,jsonl', help='Comma-separated file formats.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Passed to import_products.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        formats = [file_format for file_format in options['formats'].split(',') if file_format]
+
+        self.stdout.write(f"{'format':<7} {'rows':>9} {'seconds':>8} {'rows/s':>9} {'peak MB':>8}")
+        with tempfile.TemporaryDirectory() as directory:
+            for file_format in formats:
+                for size in sizes:
+                    path = Path(directory) / f'products.{file_format}'
+                    write_file(path, file_format, size)
+                    # A database file, so the imported rows are not in memory
+                    with throwaway_database(name=str(Path(directory) / 'benchmark.sqlite3')):
+                        start = time.perf_counter()
+                        call_command('import_products', str(path), batch_size=options['batch_size'], stdout=io.StringIO())
+                        elapsed = time.perf_counter() - start
+                        assert Product.objects.count() == size
+                    self.stdout.write(
+                        f"{file_format:<7} {size:>9} {elapsed:>8.1f} {size / elapsed:>9,.0f} {peak_memory_mb():>8.0f}"
+                    )
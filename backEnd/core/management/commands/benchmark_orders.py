@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from core.benchmarks import count_queries, summarize, throwaway_database, time_calls
+from core.models import CustomUser, Product
+
+
+class Command(BaseCommand):
+    help = 'Measure order placement latency and query count as the number of line items grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,30,100', help='Comma-separated line item counts.')
+        parser.add_argument('--repeat', type=int, default=20, help='Orders placed per size.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        with throwaway_database():
+            user = CustomUser.objects.create_user('bench', 'bench@example.com', password='bench-pass-123')
+            products = [
+                Product(
+                    name=f'Product {i}', brand='Bench', description='', price=Decimal('9.99'),
+                    stock=10 ** 6, category='Accessories',
+                )
+                for i in range(max(sizes))
+            ]
+            Product.objects.bulk_create(products)
+            product_ids = list(Product.objects.values_list('id', flat=True))
+
+            client = APIClient()
+            client.force_authenticate(user)
+
+            self.stdout.write(f"{'items':>6} {'queries':>8} {'median ms':>10} {'p95 ms':>8}")
+            for size in sizes:
+                payload = {
+                    'payment_method': 'paypal',
+                    'shipping_address': '1 Bench Street',
+                    'billing_address': '1 Bench Street',
+                    'items': [{'product': pk, 'quantity': 1} for pk in product_ids[:size]],
+                }
+
+                def place_order():
+                    response = client.post('/api/orders/', payload, format='json')
+                    assert response.status_code == 201, response.data
+
+                queries = count_queries(place_order)
+                stats = summarize(time_calls(place_order, options['repeat']))
+                self.stdout.write(f"{size:>6} {queries:>8} {stats['median']:>10.2f} {stats['p95']:>8.2f}")
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarks import summarize, throwaway_database, time_calls
+from core.renderers import FastJSONRenderer, orjson
+from core.models import Product, ProductVariant
+from core.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the stock JSON renderer with the orjson-backed renderer on product lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help='Comma-separated product list sizes.')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders per size and renderer.')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed; both renderers use the stdlib.'))
+
+        self.stdout.write(f"{'products':>9} {'renderer':>10} {'median ms':>10} {'p95 ms':>8} {'bytes':>10}")
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with throwaway_database():
+            products = Product.objects.bulk_create(
+                Product(
+                    name=f'Product {i}', brand='Bench', description='A product used for benchmarking',
+                    price=Decimal('199.99'), stock=10, category='Tablets',
+                )
+                for i in range(max(sizes))
+            )
+            ProductVariant.objects.bulk_create(
+                ProductVariant(product=product, size='128GB', color='Black') for product in products
+            )
+            for size in sizes:
+                self.compare(size, options['repeat'])
+
+    def compare(self, size, repeat):
+        # Serialized once, so only rendering is measured
+        data = ProductSerializer(Product.objects.prefetch_related('variants').order_by('pk')[:size], many=True).data
+
+        for name, renderer in (('stdlib', JSONRenderer()), ('orjson', FastJSONRenderer())):
+            output = renderer.render(data)
+            stats = summarize(time_calls(lambda: renderer.render(data), repeat))
+            self.stdout.write(
+                f"{size:>9} {name:>10} {stats['median']:>10.2f} {stats['p95']:>8.2f} {len(output):>10}"
+            )
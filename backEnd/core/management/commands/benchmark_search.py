@@ -0,0 +1,68 @@
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from core import search
+from core.benchmarks import summarize, throwaway_database, time_calls
+from core.models import Product
+
+
+CATEGORIES = [value for value, _ in Product.CATEGORY_CHOICES]
+BRANDS = ['Apple', 'Samsung', 'Google', 'Sony', 'Bose', 'Anker', 'Nomad', 'Belkin', 'Xiaomi', 'Garmin']
+MODELS = ['Galaxy', 'Pixel', 'iPhone', 'Buds', 'Charger', 'Cable', 'Case', 'Watch', 'Speaker', 'Tablet']
+# Short prefixes that match most of the catalog, a brand, a word and prefix
+# pair, a model number that matches a handful of rows next to a word every
+# row has, and a word of every description
+QUERIES = ['p', 'pro', 'samsung', 'galaxy s', 'model 4242', 'premium']
+# Median search time aimed for on the largest catalog
+TARGET_MS = 10
+
+
+def generate_products(start, count):
+    for i in range(start, start + count):
+        brand = BRANDS[i % len(BRANDS)]
+        model = MODELS[i // len(BRANDS) % len(MODELS)]
+        yield Product(
+            name=f'{brand} {model} Pro {i % 30} Model {i % 5000}',
+            brand=brand,
+            description=f'{model} by {brand}, a premium product for power users. Item {i}',
+            price=Decimal('9.99') + i % 990,
+            stock=i % 100,
+            category=CATEGORIES[i % len(CATEGORIES)],
+        )
+
+
+class Command(BaseCommand):
+    help = 'Measure full-text search latency as the catalog grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50000,500000', help='Comma-separated product counts.')
+        parser.add_argument('--repeat', type=int, default=20, help='Searches per query and size.')
+        parser.add_argument('--limit', type=int, default=24, help='Results per search, as a catalog page.')
+        parser.add_argument('--target-ms', type=float, default=TARGET_MS, help='Median search time aimed for.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+
+        self.stdout.write(f"{'products':>9} {'query':<12} {'matches':>8} {'median ms':>10} {'p95 ms':>8} {'target':>7}")
+        with tempfile.TemporaryDirectory() as directory:
+            # A database file, so the catalog is not in memory
+            with throwaway_database(name=str(Path(directory) / 'benchmark.sqlite3')):
+                created = 0
+                for size in sizes:
+                    for start in range(created, size, 10000):
+                        Product.objects.bulk_create(generate_products(start, min(10000, size - start)))
+                    created = size
+                    search.rebuild_index()
+
+                    for query in QUERIES:
+                        matches = search.filter_matching(Product.objects.all(), query).count()
+                        stats = summarize(time_calls(
+                            lambda: search.search_product_ids(query, options['limit']), options['repeat']
+                        ))
+                        verdict = 'ok' if stats['median'] <= options['target_ms'] else 'over'
+                        self.stdout.write(
+                            f"{size:>9} {query!r:<12} {matches:>8} {stats['median']:>10.2f} {stats['p95']:>8.2f} {verdict:>7}"
+                        )
@@ -0,0 +1,134 @@
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.test.utils import override_settings
+
+from core.models import Cart, CartItem, CustomUser, Product
+
+
+# The connection settings compared by the benchmark: the stock SQLite
+# configuration and the SQLITE_PROFILE=production one
+PROFILES = {
+    'default': {'pragmas': {}, 'options': {}},
+    'production': {
+        'pragmas': settings.SQLITE_PRODUCTION_PRAGMAS,
+        'options': {'transaction_mode': 'IMMEDIATE'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent cart writers on SQLite with the default and the production profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads.')
+        parser.add_argument('--readers', type=int, default=2, help='Concurrent reader threads.')
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions per writer.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<12} {'commits/s':>10} {'committed':>10} {'locked':>8} {'reads/s':>8}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                alias = f'benchmark_{name}'
+                connections.settings[alias] = {
+                    **connections.settings['default'],
+                    'NAME': str(Path(directory) / f'{name}.sqlite3'),
+                    'OPTIONS': profile['options'],
+                }
+                try:
+                    with override_settings(SQLITE_PRAGMAS=profile['pragmas']):
+                        result = self.run_profile(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                self.stdout.write(
+                    f"{name:<12} {result['commits_per_second']:>10.0f} {result['committed']:>10} "
+                    f"{result['locked']:>8} {result['reads_per_second']:>8.0f}"
+                )
+
+    def run_profile(self, alias, options):
+        call_command('migrate', database=alias, verbosity=0)
+        products = Product.objects.using(alias).bulk_create(
+            Product(
+                name=f'Product {i}', brand='Bench', description='', price=Decimal('9.99'),
+                stock=10 ** 6, category='Accessories',
+            )
+            for i in range(20)
+        )
+        carts = []
+        for worker in range(options['writers']):
+            user = CustomUser.objects.db_manager(alias).create_user(
+                f'bench{worker}', f'bench{worker}@example.com', password='bench-pass-123'
+            )
+            carts.append(Cart.objects.using(alias).create(user=user))
+        connections[alias].close()
+
+        counts = {'committed': 0, 'locked': 0, 'reads': 0}
+        lock = threading.Lock()
+        writing = threading.Event()
+        writing.set()
+
+        # Add products to a cart the way the cart endpoints do: upsert the
+        # item with CartItem.objects.add_item() and touch the cart, in one
+        # transaction
+        def writer(cart):
+            committed = locked = 0
+            try:
+                for i in range(options['transactions']):
+                    product = products[i % len(products)]
+                    try:
+                        with transaction.atomic(using=alias):
+                            CartItem.objects.using(alias).add_item(cart.pk, product.pk)
+                            Cart.objects.using(alias).filter(pk=cart.pk).touch()
+                        committed += 1
+                    except OperationalError as error:
+                        if 'locked' not in str(error):
+                            raise
+                        locked += 1
+            finally:
+                connections[alias].close()
+            with lock:
+                counts['committed'] += committed
+                counts['locked'] += locked
+
+        def reader():
+            reads = 0
+            try:
+                while writing.is_set():
+                    try:
+                        list(Cart.objects.using(alias).with_totals().values_list('items_total', flat=True))
+                        reads += 1
+                    except OperationalError:
+                        pass
+            finally:
+                connections[alias].close()
+            with lock:
+                counts['reads'] += reads
+
+        writers = [threading.Thread(target=writer, args=(cart,)) for cart in carts]
+        readers = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        start = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        writing.clear()
+        for thread in readers:
+            thread.join()
+
+        return {
+            'committed': counts['committed'],
+            'locked': counts['locked'],
+            'commits_per_second': counts['committed'] / elapsed,
+            'reads_per_second': counts['reads'] / elapsed,
+        }
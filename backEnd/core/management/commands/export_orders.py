@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+from core.filters import parse_moment
+from core.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or order items placed in a date range to a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', action='store_true', help='One row per order item instead of per order.')
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--since', help='Date or ISO 8601 datetime of the first order to include.')
+        parser.add_argument('--until', help='Date or ISO 8601 datetime of the last order to include; a date includes that day.')
+        parser.add_argument('--status', help='Only orders with this status.')
+        parser.add_argument('--output', help='File to write; standard output by default.')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        # Order items are filtered through their order
+        prefix = 'order__' if options['items'] else ''
+        queryset = (OrderItem if options['items'] else Order).objects.order_by(f'{prefix}placed_at', 'pk')
+        for name, lookup, end_of_day in (('since', 'gte', False), ('until', 'lt', True)):
+            if options[name]:
+                try:
+                    moment = parse_moment(options[name].strip(), end_of_day)
+                except ValueError:
+                    raise CommandError(f'--{name} must be a date or an ISO 8601 datetime.')
+                queryset = queryset.filter(**{f'{prefix}placed_at__{lookup}': moment})
+        if options['status']:
+            queryset = queryset.filter(**{f'{prefix}status': options['status']})
+
+        lines = exports.export_lines(queryset, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as file:
+                count = self.write(file, lines, options['format'])
+            self.stderr.write(f"Exported {count} rows to {options['output']}.")
+        else:
+            self.write(self.stdout, lines, options['format'])
+
+    # Returns the number of rows written, without the CSV header
+    def write(self, file, lines, file_format):
+        count = -1 if file_format == 'csv' else 0
+        for line in lines:
+            # orjson writes bytes
+            if isinstance(line, bytes):
+                line = line.decode()
+            if file is self.stdout:
+                file.write(line, ending='')
+            else:
+                file.write(line)
+            count += 1
+        return count
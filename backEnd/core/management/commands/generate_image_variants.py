@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from core import caching, images
+from core.models import OrderItem, Product
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized variants of existing product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist.')
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field('image').storage
+        # Order items keep the name of the image they were ordered with,
+        # which may since have been replaced on the product
+        names = set(Product.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+        names.update(
+            OrderItem.objects.exclude(product_image='').exclude(product_image__isnull=True)
+            .values_list('product_image', flat=True).distinct()
+        )
+
+        generated, skipped, failed = [], 0, 0
+        for index, name in enumerate(sorted(names), start=1):
+            if not options['force'] and images.has_variants(name, storage):
+                images.mark_ready(name)
+                skipped += 1
+                continue
+            try:
+                images.generate_variants(name, storage)
+                generated.append(name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            if index % 100 == 0:
+                self.stdout.write(f'{index}/{len(names)} images processed')
+
+        # Cached product payloads were built without the new variants
+        for start in range(0, len(generated), 500):
+            names = generated[start:start + 500]
+            caching.invalidate_products(list(Product.objects.filter(image__in=names).values_list('pk', flat=True)))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(generated)} images resized, {skipped} already had variants, {failed} failed.'
+        ))
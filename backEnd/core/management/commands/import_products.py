@@ -0,0 +1,180 @@
+import csv
+import json
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DatabaseError, connection, reset_queries, transaction
+
+from core import caching, search, variants
+from core.forms import validate_colors, validate_storage
+from core.models import Product
+
+
+# Columns of an import file. id is optional: rows with the id of an
+# existing product update it, other rows create a product. storage and
+# colors are the JSON lists of the API and set the product's variants.
+FIELDS = ['name', 'brand', 'description', 'price', 'stock', 'category']
+OPTION_FIELDS = ['storage', 'colors']
+# Written on conflict; created_at keeps its original value
+UPDATE_FIELDS = FIELDS + ['updated_at']
+
+
+class Command(BaseCommand):
+    help = 'Stream products from a CSV or JSONL file and upsert them in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or JSONL with one object per line.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Products written per statement.')
+        parser.add_argument(
+            '--rebuild-index', action='store_true',
+            help='Rebuild the whole search index at the end; imported products are indexed either way.',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Pass --format=csv or --format=jsonl for this file.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        start = time.perf_counter()
+        imported = rejected = 0
+        batch = {}
+        new_products = []
+        explicit_ids = False
+
+        def flush():
+            nonlocal imported, rejected
+            products = list(batch.values()) + new_products
+            written = self.write(products)
+            imported += written
+            rejected += len(products) - written
+            batch.clear()
+            new_products.clear()
+            # With DEBUG on every statement is logged, and a batch's INSERT
+            # is large enough for the log to dominate memory
+            reset_queries()
+
+        with path.open(newline='', encoding='utf-8') as file:
+            if file_format == 'csv':
+                # Line 1 is the header
+                rows = enumerate(csv.DictReader(file), start=2)
+            else:
+                rows = ((line, text) for line, text in enumerate(file, start=1) if text.strip())
+            for line, row in rows:
+                try:
+                    product, option_lists = self.build(self.parse_json_object(row) if isinstance(row, str) else row)
+                except ValidationError as error:
+                    rejected += 1
+                    self.stderr.write(f'line {line}: {self.describe(error)}')
+                    continue
+                # One product per id in a statement; the last row wins
+                if product.pk is None:
+                    new_products.append((product, option_lists))
+                else:
+                    batch[product.pk] = (product, option_lists)
+                    explicit_ids = True
+                if len(batch) + len(new_products) >= options['batch_size']:
+                    flush()
+                    self.report(imported, rejected, start)
+        flush()
+
+        # Rows inserted with their own id do not advance the id sequence of
+        # databases that have one
+        if explicit_ids:
+            with connection.cursor() as cursor:
+                for statement in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                    cursor.execute(statement)
+
+        if options['rebuild_index']:
+            search.rebuild_index()
+        caching.invalidate_lists()
+
+        self.report(imported, rejected, start)
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} products, rejected {rejected} rows.'))
+
+    def parse_json_object(self, text):
+        try:
+            # Decimal keeps prices such as 9.99 exact
+            row = json.loads(text, parse_float=Decimal)
+        except ValueError as error:
+            raise ValidationError(f'Invalid JSON: {error}')
+        if not isinstance(row, dict):
+            raise ValidationError('Each line must be a JSON object.')
+        return row
+
+    # Validate a row the way the admin and the API do: the model field rules
+    # for the scalar columns and the storage and colors list rules. Returns
+    # the product and its (storage, colors).
+    def build(self, row):
+        errors = {}
+        values = {}
+        for name in FIELDS:
+            try:
+                values[name] = Product._meta.get_field(name).clean(row.get(name), None)
+            except ValidationError as error:
+                errors[name] = error.messages
+        options = {}
+        for name, validate in zip(OPTION_FIELDS, (validate_storage, validate_colors)):
+            raw = row.get(name)
+            try:
+                options[name] = validate([] if raw in (None, '') else raw)
+            except ValidationError as error:
+                errors[name] = error.messages
+        product_id = row.get('id')
+        if product_id not in (None, ''):
+            try:
+                # The model field also checks the id fits the column
+                values['id'] = Product._meta.pk.clean(product_id, None)
+            except ValidationError as error:
+                errors['id'] = error.messages
+        if errors:
+            raise ValidationError(errors)
+        return Product(**values), (options['storage'], options['colors'])
+
+    def describe(self, error):
+        if hasattr(error, 'error_dict'):
+            return '; '.join(f"{name}: {' '.join(messages)}" for name, messages in error.message_dict.items())
+        return ' '.join(error.messages)
+
+    # Upsert the products in one statement, then their variants. products
+    # holds (product, (storage, colors)) pairs. A batch the database rejects
+    # is retried one product at a time, so only the failing rows are lost.
+    # Returns how many were written.
+    def write(self, products):
+        if not products:
+            return 0
+        new_products = [product for product, _ in products if product.pk is None]
+        try:
+            with transaction.atomic():
+                # Sets the id of the new products, which their variants need
+                Product.objects.bulk_create(
+                    [product for product, _ in products],
+                    update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+                )
+                variants.replace(dict(products))
+                # Bulk writes skip the model signals that keep the search
+                # index in sync
+                search.index_products([product for product, _ in products])
+        except DatabaseError as error:
+            # The ids given to new products were rolled back
+            for product in new_products:
+                product.pk = None
+            if len(products) > 1:
+                return sum(self.write([entry]) for entry in products)
+            product = products[0][0]
+            self.stderr.write(f'product {product.pk or product.name!r} not written: {error}')
+            return 0
+        caching.invalidate_products([product.pk for product, _ in products])
+        return len(products)
+
+    def report(self, imported, rejected, start):
+        elapsed = time.perf_counter() - start
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(f'{imported} imported, {rejected} rejected, {rate:,.0f} rows/s')
@@ -1,40 +1,96 @@
-from django.core.management.base import BaseCommand
-from core.models import Product  # Import your Product model
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import variants
+from core.models import Product, ProductVariant
+
+
+# Storage and color options given to every product of the target categories
+STORAGE_SIZES = [
+    {"size": "64GB", "in_stock": True},
+    {"size": "128GB", "in_stock": True},
+    {"size": "256GB", "in_stock": False},
+    {"size": "512GB", "in_stock": True},
+    {"size": "1TB", "in_stock": False},
+]
+
+COLORS = [
+    {"color": "Black", "in_stock": True},
+    {"color": "White", "in_stock": False},
+    {"color": "Silver", "in_stock": True},
+    {"color": "Gold", "in_stock": True},
+    {"color": "Blue", "in_stock": True},
+]
+
+DEFAULT_CATEGORIES = ['Budget Phones', 'Flagship Phones', 'Gaming Phones', 'Tablets']
+
 
 class Command(BaseCommand):
-    help = 'Programmatically update storage and colors for phones, tablets, and iPads.'
-
-    def handle(self, *args, **kwargs):
-        # Define lists of storage sizes and colors
-        storage_sizes = [
-            {"size": "64GB", "in_stock": True},
-            {"size": "128GB", "in_stock": True},
-            {"size": "256GB", "in_stock": False},
-            {"size": "512GB", "in_stock": True},
-            {"size": "1TB", "in_stock": False}
-        ]
+    help = 'Programmatically update storage and colors for phones and tablets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--categories', default=','.join(DEFAULT_CATEGORIES),
+            help='Comma-separated categories to update.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per UPDATE.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per database round trip.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing.')
+
+    def handle(self, *args, **options):
+        categories = [c.strip() for c in options['categories'].split(',') if c.strip()]
+        known = {value for value, _ in Product.CATEGORY_CHOICES}
+        unknown = sorted(set(categories) - known)
+        if not categories or unknown:
+            raise CommandError(f"Unknown categories: {', '.join(unknown) or '(none given)'}")
+        if options['batch_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--batch-size and --chunk-size must be positive.')
+
+        # Only the target categories are read, served by product_category_idx
+        products = Product.objects.filter(category__in=categories).order_by('pk')
+        total = products.count()
+        self.stdout.write(f"{total} products in {', '.join(categories)}")
+
+        start = time.perf_counter()
+        seen = changed = 0
+        batch = []
+        for product in products.only('id', 'stock').iterator(chunk_size=options['chunk_size']):
+            seen += 1
+            batch.append(product)
+            if len(batch) >= options['batch_size']:
+                changed += self.write(batch, options['dry_run'])
+                batch = []
+                self.report(seen, total, changed, start)
+        if batch:
+            changed += self.write(batch, options['dry_run'])
+        self.report(seen, total, changed, start)
+
+        verb = 'Would update' if options['dry_run'] else 'Successfully updated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {changed} products.'))
 
-        colors_list = [
-            {"color": "Black", "in_stock": True},
-            {"color": "White", "in_stock": False},
-            {"color": "Silver", "in_stock": True},
-            {"color": "Gold", "in_stock": True},
-            {"color": "Blue", "in_stock": True}
+    # Read the variants of a batch in one query and rewrite those of the
+    # products whose storage and colors differ, with a few bulk statements.
+    # Bulk writes skip the model signals, so the products are touched here.
+    # Search is unaffected: storage and colors are not indexed.
+    def write(self, products, dry_run):
+        current = {}
+        for variant in ProductVariant.objects.filter(product__in=products):
+            current.setdefault(variant.product_id, []).append(variant)
+        outdated = [
+            product for product in products
+            if variants.options(current.get(product.pk, []), 'storage') != STORAGE_SIZES
+            or variants.options(current.get(product.pk, []), 'colors') != COLORS
         ]
+        if dry_run or not outdated:
+            return len(outdated)
+        with transaction.atomic():
+            variants.replace({product: (STORAGE_SIZES, COLORS) for product in outdated})
+            variants.touch_products([product.pk for product in outdated])
+        return len(outdated)
 
-        # Loop through all products and add storage/colors if the product is a phone, tablet, or iPad
-        updated_count = 0
-
-        # Update phones, tablets, and iPads (skip others)
-        for product in Product.objects.all():
-            # Check if the product is a phone, tablet, or iPad based on category
-            print(product.category.id)
-            if product.category.id in [1, 2, 3, 4]:  # Assuming these categories are for phones, tablets, and iPads
-                # Add storage and colors if the product doesn't already have them
-                product.storage = storage_sizes  # Assigning first three sizes for all phones/tablets
-                product.colors = colors_list  # Assigning first three colors for all phones/tablets
-                
-                product.save()
-                updated_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully updated {updated_count} phones, tablets, and iPads.'))
+    def report(self, seen, total, changed, start):
+        elapsed = time.perf_counter() - start
+        rate = seen / elapsed if elapsed else 0
+        self.stdout.write(f'{seen}/{total} scanned, {changed} changed, {rate:,.0f} rows/s')
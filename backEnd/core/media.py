@@ -0,0 +1,47 @@
+import mimetypes
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+
+from .models import Product
+
+
+# Responses for media files the app serves itself.
+#
+# With MEDIA_OFFLOAD set, the response carries no body: the front web
+# server sends the file, told by an X-Accel-Redirect (nginx) or X-Sendfile
+# (Apache, lighttpd) header, so Python workers never stream file bytes.
+# Without it the file is streamed by Django, for development.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def media_response(name):
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404('Not found.')
+
+    offload = settings.MEDIA_OFFLOAD
+    if offload in ('x-accel-redirect', 'x-sendfile'):
+        # The web server sends the body and its length
+        response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + name
+        else:
+            response['X-Sendfile'] = path
+    else:
+        try:
+            response = FileResponse(open(path, 'rb'))
+        except (FileNotFoundError, IsADirectoryError):
+            raise Http404('Not found.')
+
+    if Product._meta.get_field('image').storage.is_immutable(name):
+        response['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def serve_media(request, path):
+    return media_response(path)
@@ -0,0 +1,16 @@
+from . import db_routers
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+# Let safe requests read from the replica databases (see core.db_routers)
+class ReplicaReadsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            return self.get_response(request)
+        with db_routers.replica_reads():
+            return self.get_response(request)
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+
+# Full-text index for product search (see core.search).
+# SQLite gets an FTS5 table filled from the existing catalog, Postgres a
+# generated tsvector column with a GIN index.
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE core_product_fts USING fts5("
+    "name, brand, description, category, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO core_product_fts (rowid, name, brand, description, category) "
+    "SELECT id, name, brand, description, category FROM core_product",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS core_product_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE core_product ADD COLUMN search_document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(brand, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+    ") STORED",
+    "CREATE INDEX core_product_search_idx ON core_product USING GIN (search_document)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_product_search_idx",
+    "ALTER TABLE core_product DROP COLUMN IF EXISTS search_document",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
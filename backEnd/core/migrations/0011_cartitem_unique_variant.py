@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:58
+
+from django.db import migrations, models
+from django.db.models import Min, Sum
+
+
+# Store missing colors and sizes as '' and merge items that become
+# duplicates of the same product variant, so the unique constraint can be
+# added
+def merge_duplicate_items(apps, schema_editor):
+    CartItem = apps.get_model('core', 'CartItem')
+    db = schema_editor.connection.alias
+    CartItem.objects.using(db).filter(color__isnull=True).update(color='')
+    CartItem.objects.using(db).filter(size__isnull=True).update(size='')
+
+    duplicates = (
+        CartItem.objects.using(db).values('cart_id', 'product_id', 'color', 'size')
+        .annotate(keep_id=Min('id'), total=Sum('quantity'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        items = CartItem.objects.using(db).filter(
+            cart_id=group['cart_id'], product_id=group['product_id'],
+            color=group['color'], size=group['size'],
+        )
+        items.filter(pk=group['keep_id']).update(quantity=group['total'])
+        items.exclude(pk=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='color',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='size',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'color', 'size'), name='unique_cart_item_variant'),
+        ),
+    ]
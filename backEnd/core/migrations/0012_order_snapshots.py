@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+# Copy the current product name, image and price into existing order items,
+# then store each order's total and item count. Done with set-based
+# UPDATEs so it does not load the tables into memory.
+def backfill_snapshots(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    db = schema_editor.connection.alias
+
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.using(db).update(
+        unit_price=Subquery(product.values('price')[:1]),
+        product_name=Subquery(product.values('name')[:1]),
+        product_image=Subquery(product.values('image')[:1]),
+    )
+
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).values('order_id')
+    Order.objects.using(db).update(
+        total_price=Coalesce(
+            Subquery(
+                items.annotate(
+                    total=Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+                ).values('total')[:1]
+            ),
+            Decimal('0.00'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        item_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')[:1]), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cartitem_unique_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
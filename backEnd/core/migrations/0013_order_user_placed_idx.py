@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_order_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'placed_at', 'id'], name='order_user_placed_idx'),
+        ),
+    ]
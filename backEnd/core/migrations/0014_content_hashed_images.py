@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:20
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_order_user_placed_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.product_image_storage, upload_to='product_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.product_image_storage, upload_to='product_images/'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_content_hashed_images'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'placed_at'], name='order_status_placed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['status'], name='orderitem_status_idx'),
+        ),
+    ]
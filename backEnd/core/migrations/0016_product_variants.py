@@ -0,0 +1,134 @@
+import json
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+# max_length of ProductVariant.size and color
+OPTION_MAX_LENGTH = 50
+
+
+# The (value, in_stock) options of a storage or colors list, skipping
+# whatever the API would not have accepted: lists stored as JSON text are
+# decoded, entries that are not objects or have no value are left out and a
+# missing flag counts as out of stock
+def list_options(items, key):
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except ValueError:
+            return []
+    if not isinstance(items, list):
+        return []
+    options = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        value = item.get(key)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        options.append((value.strip()[:OPTION_MAX_LENGTH], item.get('in_stock', False) is True))
+    return options
+
+
+# One variant per size and color combination of the storage and colors
+# lists, or per size or color when the product has one kind of option.
+# Each variant keeps the flags of its size and of its color, and starts
+# with the product's stock. Products are read in chunks and the variants
+# written in batches.
+def copy_options_to_variants(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductVariant = apps.get_model('core', 'ProductVariant')
+    db = schema_editor.connection.alias
+
+    batch = []
+    products = Product.objects.using(db).order_by('pk').values_list('pk', 'stock', 'storage', 'colors')
+    for product_id, stock, storage, colors in products.iterator(chunk_size=BATCH_SIZE):
+        sizes = list_options(storage, 'size') or [('', True)]
+        color_options = list_options(colors, 'color') or [('', True)]
+        wanted = {
+            (size, color): (size_in_stock, color_in_stock)
+            for size, size_in_stock in sizes
+            for color, color_in_stock in color_options
+            if size or color
+        }
+        for (size, color), (size_in_stock, color_in_stock) in wanted.items():
+            batch.append(ProductVariant(
+                product_id=product_id, size=size, color=color, size_in_stock=size_in_stock,
+                color_in_stock=color_in_stock, stock=stock or 0,
+            ))
+        if len(batch) >= BATCH_SIZE:
+            ProductVariant.objects.using(db).bulk_create(batch)
+            batch = []
+    ProductVariant.objects.using(db).bulk_create(batch)
+
+
+# Rebuild the lists from the variants, each option with its own flag
+def copy_variants_to_options(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductVariant = apps.get_model('core', 'ProductVariant')
+    db = schema_editor.connection.alias
+
+    def flush(product_id, variants):
+        storage, colors = {}, {}
+        for size, color, size_in_stock, color_in_stock in variants:
+            if size:
+                storage[size] = storage.get(size, False) or size_in_stock
+            if color:
+                colors[color] = colors.get(color, False) or color_in_stock
+        Product.objects.using(db).filter(pk=product_id).update(
+            storage=[{'size': size, 'in_stock': in_stock} for size, in_stock in storage.items()],
+            colors=[{'color': color, 'in_stock': in_stock} for color, in_stock in colors.items()],
+        )
+
+    current, variants = None, []
+    rows = ProductVariant.objects.using(db).order_by('product_id', 'pk').values_list(
+        'product_id', 'size', 'color', 'size_in_stock', 'color_in_stock'
+    )
+    for product_id, *variant in rows.iterator(chunk_size=BATCH_SIZE):
+        if product_id != current and current is not None:
+            flush(current, variants)
+            variants = []
+        current = product_id
+        variants.append(variant)
+    if current is not None:
+        flush(current, variants)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_admin_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(blank=True, default='', max_length=50)),
+                ('color', models.CharField(blank=True, default='', max_length=50)),
+                ('size_in_stock', models.BooleanField(default=True)),
+                ('color_in_stock', models.BooleanField(default=True)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('price_delta', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='core.product')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('color_in_stock', True), ('size_in_stock', True), ('stock__gt', 0)), fields=['size', 'color', 'product'], name='variant_available_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'size', 'color'), name='unique_product_variant')],
+            },
+        ),
+        migrations.RunPython(copy_options_to_variants, copy_variants_to_options),
+        migrations.RemoveField(
+            model_name='product',
+            name='colors',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='storage',
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+# Rebuild the SQLite full-text index of 0010 with prefix indexes, so the
+# prefix query of a partially typed word of up to 8 characters reads one
+# doclist instead of merging those of every word it starts (see
+# core.search). Postgres is left as it is.
+
+FTS_COLUMNS = "name, brand, description, category, tokenize='unicode61 remove_diacritics 2'"
+FILL = (
+    "INSERT INTO core_product_fts (rowid, name, brand, description, category) "
+    "SELECT id, name, brand, description, category FROM core_product"
+)
+
+SQLITE_FORWARD = [
+    "DROP TABLE IF EXISTS core_product_fts",
+    f"CREATE VIRTUAL TABLE core_product_fts USING fts5({FTS_COLUMNS}, prefix='1 2 3 4 5 6 7 8')",
+    FILL,
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS core_product_fts",
+    f"CREATE VIRTUAL TABLE core_product_fts USING fts5({FTS_COLUMNS})",
+    FILL,
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_order_stock_reserved'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connections, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 
+from .storage import product_image_storage
+
 # Create your models here.
 
 class UserManager(BaseUserManager):
@@ -44,6 +51,15 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email
 
+    # A user restored from the authentication cache holds only a few fields
+    # (see core.authentication); the first access to any other one loads
+    # all of them in one query instead of one query per field
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
 
 # User profile model that extends the CustomUser model
 # This allows us to store additional user information
@@ -84,24 +100,214 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
-    image = models.ImageField(upload_to='product_images/', blank=True, null=True)
-    storage = models.JSONField(default=default_list, blank=True, null=True)
-    colors = models.JSONField(default=default_list, blank=True, null=True)
+    image = models.ImageField(upload_to='product_images/', storage=product_image_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) 
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     brand = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog (see core.pagination)
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            # Catalog filters and ordering (see core.filters)
+            models.Index(fields=['category', 'created_at'], name='product_category_idx'),
+            models.Index(fields=['brand', 'created_at'], name='product_brand_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(stock__gt=0),
+                name='product_in_stock_idx',
+            ),
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(stock=0),
+                name='product_out_of_stock_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
+# A purchasable option of a product: a storage size, a color, or both.
+# These rows replace the storage and colors JSON lists of Product; the API
+# still returns the lists, derived from the variants (see core.variants)
+class ProductVariant(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
+    # Empty when the product has no option of that kind, as on CartItem
+    size = models.CharField(max_length=50, blank=True, default='')
+    color = models.CharField(max_length=50, blank=True, default='')
+    # The in_stock flags of the size and of the color in the storage and
+    # colors lists (see core.variants), stored on every variant with them.
+    # The variant is offered when both are set.
+    size_in_stock = models.BooleanField(default=True)
+    color_in_stock = models.BooleanField(default=True)
+    # Units of this variant. Orders take them together with Product.stock:
+    # a variant is available when it is offered and both are left.
+    stock = models.PositiveIntegerField(default=0)
+    # Added to the product price for this variant
+    price_delta = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        # Options are listed in the order they were added
+        ordering = ['id']
+        constraints = [
+            # One row per option; also the index of a product's variants
+            models.UniqueConstraint(fields=['product', 'size', 'color'], name='unique_product_variant'),
+        ]
+        indexes = [
+            # Products available in a size and/or color (see core.filters)
+            models.Index(
+                fields=['size', 'color', 'product'],
+                condition=models.Q(size_in_stock=True, color_in_stock=True, stock__gt=0),
+                name='variant_available_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return ' '.join(filter(None, [self.size, self.color])) or 'Default'
+
+    @property
+    def offered(self):
+        return self.size_in_stock and self.color_in_stock
+
+
+
+# SQL expression for the price delta of the variant a cart item names,
+# through the item fields under prefix; 0 when the product has no such
+# variant
+def variant_price_delta(prefix=''):
+    return Coalesce(
+        Subquery(ProductVariant.objects.filter(
+            product=OuterRef(f'{prefix}product'),
+            size=OuterRef(f'{prefix}size'),
+            color=OuterRef(f'{prefix}color'),
+        ).values('price_delta')[:1]),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+# SQL expression for a cart item's product price plus its variant's delta
+def cart_item_price_expression(prefix=''):
+    return ExpressionWrapper(
+        F(f'{prefix}product__price') + variant_price_delta(prefix),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+# SQL expression for the sum of quantity * price over the related items,
+# 0 when there are no items. price is a field path or an expression.
+def items_total_expression(price='items__product__price'):
+    return Coalesce(
+        Sum(
+            F('items__quantity') * (F(price) if isinstance(price, str) else price),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+# Querysets that eager-load the items of a cart or an order together with
+# their products, so serializers and total computations never hit the
+# database once per item
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related(
+            models.Prefetch('items', CartItem.objects.with_unit_price()), 'items__product'
+        )
+
+    # Annotate each cart with its total computed by the database
+    def with_totals(self):
+        return self.annotate(items_total=items_total_expression(cart_item_price_expression('items__')))
+
+    # Mark the carts as changed without loading them
+    def touch(self):
+        return self.update(updated_at=timezone.now())
+
+
+class CartItemQuerySet(models.QuerySet):
+    # Annotate each item with the price of one unit of its variant
+    def with_unit_price(self):
+        return self.annotate(unit_price=cart_item_price_expression())
+
+    # Total price, number of lines and number of units of the items, in one
+    # aggregate query
+    def summary(self):
+        totals = self.aggregate(
+            total_price=Sum(
+                F('quantity') * cart_item_price_expression(),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            item_count=models.Count('id'),
+            total_quantity=Sum('quantity'),
+        )
+        return {
+            'total_price': totals['total_price'] or Decimal('0.00'),
+            'item_count': totals['item_count'],
+            'total_quantity': totals['total_quantity'] or 0,
+        }
+
+    # Add quantity units of a product variant to a cart in one statement:
+    # insert the item, or increment it in place if the cart already holds
+    # that product with the same color and size. Returns (id, quantity).
+    # Raw SQL bypasses the model signals, so the caller touches the cart.
+    def add_item(self, cart_id, product_id, color='', size='', quantity=1):
+        sql, params = self._add_items_sql(cart_id, [(product_id, color, size, quantity)])
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            if connection.features.can_return_columns_from_insert:
+                cursor.execute(sql + ' RETURNING id, quantity', params)
+                return cursor.fetchone()
+            cursor.execute(sql, params)
+        return self.filter(
+            cart_id=cart_id, product_id=product_id, color=color or '', size=size or ''
+        ).values_list('id', 'quantity').get()
+
+    # Same as add_item() for several variants in one statement; lines are
+    # (product_id, color, size, quantity) with distinct variants
+    def add_items(self, cart_id, lines):
+        if not lines:
+            return
+        sql, params = self._add_items_sql(cart_id, lines)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def _add_items_sql(self, cart_id, lines):
+        table = self.model._meta.db_table
+        sql = (
+            f'INSERT INTO {table} (cart_id, product_id, color, size, quantity) '
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(lines))} "
+            'ON CONFLICT (cart_id, product_id, color, size) '
+            f'DO UPDATE SET quantity = {table}.quantity + excluded.quantity'
+        )
+        params = []
+        for product_id, color, size, quantity in lines:
+            params += [cart_id, product_id, color or '', size or '', quantity]
+        return sql, params
+
+
+class OrderQuerySet(models.QuerySet):
+    # Order items carry a snapshot of their product, so the catalog is not
+    # loaded
+    def with_items(self):
+        return self.select_related('card').prefetch_related('items')
+
+    # Annotate each order with the total of its items computed by the
+    # database; Order.total_price already stores it for placed orders
+    def with_totals(self):
+        return self.annotate(items_total=items_total_expression('items__unit_price'))
+
 
 class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) 
     
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.user.username}'s cart"
     
@@ -109,8 +315,11 @@ class Cart(models.Model):
     def get_items(self):
         return self.items.all()
 
-    # Get the total price of the cart
+    # Get the total price of the cart, using the with_totals() annotation
+    # when the cart was loaded through it
     def get_total_price(self):
+        if hasattr(self, 'items_total'):
+            return self.items_total
         return sum(item.get_total_price() for item in self.get_items())
 
 
@@ -118,15 +327,36 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
-    color = models.CharField(max_length=50, blank=True, null=True)
-    size = models.CharField(max_length=50, blank=True, null=True)
+    # Empty rather than NULL when not chosen, so the unique constraint below
+    # also covers products without variants
+    color = models.CharField(max_length=50, blank=True, default='')
+    size = models.CharField(max_length=50, blank=True, default='')
+    
+    objects = CartItemQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            # One row per product variant in a cart; the target of add_item()
+            models.UniqueConstraint(fields=['cart', 'product', 'color', 'size'], name='unique_cart_item_variant'),
+        ]
     
     def __str__(self):
         return f"{self.cart.user.username}'s cartitem ({self.quantity} {self.product.name})"
     
+    # The price of one unit: the product price plus the delta of the
+    # variant, from the with_unit_price() annotation when the item was
+    # loaded through it
+    def get_unit_price(self):
+        if hasattr(self, 'unit_price'):
+            return self.unit_price
+        delta = ProductVariant.objects.filter(
+            product_id=self.product_id, size=self.size, color=self.color
+        ).values_list('price_delta', flat=True).first()
+        return self.product.price + (delta or 0)
+
     # Get the total price of cart items
     def get_total_price(self):
-        return self.quantity * self.product.price
+        return self.quantity * self.get_unit_price()
 
 
 # In a real-world application, i would use a more secure way for managing payment details
@@ -136,21 +366,40 @@ class CardDetails(models.Model):
     cvv = models.CharField(max_length=4)
 
 class Order(models.Model):
+    STATUS_PLACED = 'Order placed'
+    STATUS_CANCELLED = 'Cancelled'
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
     shipping_address = models.TextField()
     billing_address = models.TextField()
     payment_method = models.CharField(max_length=50, choices=[('card', 'Credit/Debit Card'), ('paypal', 'PayPal')])
     card = models.OneToOneField(CardDetails, on_delete=models.CASCADE, blank=True, null=True)
-    status = models.CharField(max_length=50, default='Order placed')
+    status = models.CharField(max_length=50, default=STATUS_PLACED)
     placed_at = models.DateTimeField(auto_now_add=True)
+    # Whether placing the order took its items from stock, which cancelling
+    # it gives back
+    stock_reserved = models.BooleanField(default=False)
+    # Denormalized at placement time from the item snapshots
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
+    
+    objects = OrderQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # A customer's order history, newest first (see core.pagination)
+            models.Index(fields=['user', 'placed_at', 'id'], name='order_user_placed_idx'),
+            # The admin's status filter and its list of statuses
+            models.Index(fields=['status', 'placed_at'], name='order_status_placed_idx'),
+        ]
     
      # Get all order items related to the user through the order
     def get_items(self):
         return self.items.all()
     
-    # Get the total price of the order
+    # Get the total price of the order as stored when it was placed
     def get_total_price(self):
-        return sum(item.get_total_price() for item in self.get_items())
+        return self.total_price
     
     # def __str__(self):
     #     return str(self.id)
@@ -160,12 +409,30 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    status = models.CharField(max_length=50, default='Order placed')
+    status = models.CharField(max_length=50, default=Order.STATUS_PLACED)
     quantity = models.PositiveIntegerField()
     color = models.CharField(max_length=50, blank=True, null=True)
     size = models.CharField(max_length=50, blank=True, null=True)
+    # Snapshot of the product when the order was placed, so order history
+    # neither joins the catalog nor changes with later price updates
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    product_name = models.CharField(max_length=200, blank=True, default='')
+    product_image = models.ImageField(upload_to='product_images/', storage=product_image_storage, blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            # The admin's status filter and its list of statuses
+            models.Index(fields=['status'], name='orderitem_status_idx'),
+        ]
+    
+    # Copy the product fields the order history needs; the unit price
+    # includes the price delta of the variant ordered
+    def snapshot_product(self, product, variant=None):
+        self.unit_price = product.price + (variant.price_delta if variant is not None else 0)
+        self.product_name = product.name
+        self.product_image = product.image.name if product.image else None
     
     def get_total_price(self):
-        return self.quantity * self.product.price
+        return self.quantity * self.unit_price
 
 
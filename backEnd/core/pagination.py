@@ -0,0 +1,126 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+# Cursor pagination on the whole ordering.
+# DRF's CursorPagination stores only the first ordering field in the cursor
+# and skips rows that share its value with an OFFSET, which grows with the
+# ties (a bulk import gives thousands of products the same created_at).
+# Here the cursor holds the value of every ordering field, and a page
+# starts with a WHERE on all of them:
+#     (a < x) OR (a = x AND id < y)
+# so every page costs the same however many rows tie. Orderings must end
+# with a unique field (the id) for the positions to be unique.
+class KeysetCursorPagination(CursorPagination):
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.after_position(queryset.model, current_position, reverse))
+
+        # The extra row tells whether a page follows
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            # Reverse pages were read backwards
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    # The rows strictly after the position in the direction being read.
+    # Each value is converted by its model field, so a tampered cursor is a
+    # 404 rather than a database error
+    def after_position(self, model, position, reverse):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q(pk__in=[])
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            field = order.lstrip('-')
+            try:
+                value = model._meta.get_field(field).to_python(value)
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+            # (cursor reversed) XOR (field descending)
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field = order.lstrip('-')
+            value = instance[field] if isinstance(instance, dict) else getattr(instance, field)
+            values.append(str(value))
+        return json.dumps(values, separators=(',', ':'))
+
+
+# Keyset pagination for the product catalog, on (created_at, id) by default
+# and on any ProductOrderingFilter ordering, which always ends with the id.
+# The default ordering is served by the composite index declared on Product.
+class ProductCursorPagination(KeysetCursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = getattr(settings, 'PRODUCT_PAGE_SIZE', 24)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PRODUCT_MAX_PAGE_SIZE', 100)
+
+
+# Keyset pagination for a customer's order history, newest first. Served by
+# the (user, placed_at, id) index declared on Order.
+class OrderCursorPagination(KeysetCursorPagination):
+    ordering = ('-placed_at', '-id')
+    page_size = getattr(settings, 'ORDER_PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'ORDER_MAX_PAGE_SIZE', 50)
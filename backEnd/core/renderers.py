@@ -0,0 +1,32 @@
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+# JSON renderer backed by orjson when it is installed.
+# Types orjson does not handle itself (Decimal, lazy translation strings,
+# and datetimes, which are passed through on purpose) go through DRF's
+# JSONEncoder, so the output matches the stock renderer. Without orjson,
+# or when an indented response is requested, it is the stock renderer.
+class FastJSONRenderer(JSONRenderer):
+    orjson_options = (
+        (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # orjson always writes compact UTF-8, so escaped or indented output
+        # is left to the stock renderer
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=JSONEncoder().default, option=self.orjson_options)
@@ -0,0 +1,179 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+# Full-text search over Product.name, brand, description and category.
+#
+# On SQLite the text is indexed in an FTS5 virtual table whose rowid is the
+# product id. It is kept in sync by the post_save/post_delete handlers in
+# core.signals and by index_products() after bulk writes; rebuild_index()
+# repopulates it from scratch.
+# On Postgres the same columns are indexed through the generated tsvector
+# column core_product.search_document and its GIN index, so no syncing is
+# needed there. Both are created by migration 0010; 0018 adds prefix
+# indexes to the FTS5 table.
+#
+# bm25 reads the whole doclist of every word of the query to weigh it, so
+# ranking a word found in most of the catalog costs tens of milliseconds
+# however few results are asked for. Queries with such a word rank their
+# newest SEARCH_RANK_LIMIT matches instead, by the weights of the columns
+# that hold the words.
+
+FTS_TABLE = 'core_product_fts'
+
+# bm25 weights for name, brand, description and category
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Largest number of rows holding a word for the query to be ranked with
+# bm25, and number of newest matches ranked otherwise
+SEARCH_RANK_LIMIT = 1000
+
+
+def is_sqlite():
+    return connection.vendor == 'sqlite'
+
+
+# Turn free text into the terms of an FTS5 query where every word must
+# match, the last one as a prefix so partially typed words still find
+# results. Words are quoted so user input can never be parsed as FTS5
+# syntax.
+def match_terms(text):
+    terms = [f'"{token}"' for token in TOKEN_RE.findall(text or '')]
+    if terms:
+        terms[-1] += '*'
+    return terms
+
+
+def build_match_query(text):
+    return ' '.join(match_terms(text)) or None
+
+
+# Return the ids of the best matching products, most relevant first
+def search_product_ids(text, limit=20):
+    with connection.cursor() as cursor:
+        if is_sqlite():
+            terms = match_terms(text)
+            if not terms:
+                return []
+            if any(_matches_more_than(cursor, term, SEARCH_RANK_LIMIT) for term in terms):
+                return _rank_newest_matches(cursor, ' '.join(terms), limit)
+            weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [' '.join(terms), limit],
+            )
+        else:
+            if not (text or '').strip():
+                return []
+            cursor.execute(
+                "SELECT id FROM core_product, websearch_to_tsquery('english', %s) query "
+                'WHERE search_document @@ query '
+                'ORDER BY ts_rank_cd(search_document, query) DESC LIMIT %s',
+                [text, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Whether more than count rows match the FTS5 query; reads at most count + 1
+def _matches_more_than(cursor, match, count):
+    cursor.execute(
+        f'SELECT count(*) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)',
+        [match, count + 1],
+    )
+    return cursor.fetchone()[0] > count
+
+
+# Rank the newest SEARCH_RANK_LIMIT matches by the bm25 weights of the
+# name, brand and category columns holding every word, newest first among
+# equals; a match found only through the description comes last. The
+# column matches are looked up from the oldest of those matches on, which
+# FTS5 seeks to in each doclist.
+def _rank_newest_matches(cursor, match, limit):
+    cursor.execute(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s',
+        [match, SEARCH_RANK_LIMIT],
+    )
+    scores = {row[0]: 0 for row in cursor.fetchall()}
+    if not scores:
+        return []
+    weights = dict(zip(['name', 'brand', 'description', 'category'], FTS_WEIGHTS))
+    for column in ['name', 'brand', 'category']:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid >= %s',
+            [f'{{{column}}} : ({match})', min(scores)],
+        )
+        # Rows this new match the whole query, so they are all in scores
+        for (pk,) in cursor.fetchall():
+            scores[pk] += weights[column]
+    return sorted(scores, key=lambda pk: (-scores[pk], -pk))[:limit]
+
+
+# Return the best matching products, most relevant first
+def search_products(text, limit=20):
+    ids = search_product_ids(text, limit)
+    products = Product.objects.prefetch_related('variants').in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+# Restrict a Product queryset to the rows matching the text, without ranking.
+# Used where the caller applies its own ordering, e.g. the admin changelist.
+def filter_matching(queryset, text):
+    if is_sqlite():
+        match = build_match_query(text)
+        if match is None:
+            return queryset.none()
+        subquery = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    else:
+        subquery = RawSQL(
+            "SELECT id FROM core_product WHERE search_document @@ websearch_to_tsquery('english', %s)",
+            [text],
+        )
+    return queryset.filter(pk__in=subquery)
+
+
+def index_product(product):
+    index_products([product])
+
+
+# Write the index entries of saved products, e.g. after a bulk write; one
+# prepared statement per table change whatever the number of products
+def index_products(products):
+    if not is_sqlite() or not products:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[product.pk] for product in products])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [
+                [product.pk, product.name, product.brand, product.description, product.category]
+                for product in products
+            ],
+        )
+
+
+def remove_product(product_id):
+    if not is_sqlite():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+# Repopulate the whole index from core_product, e.g. after bulk writes that
+# bypass the model signals
+def rebuild_index():
+    if not is_sqlite():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, category) '
+            'SELECT id, name, brand, description, category FROM core_product'
+        )
@@ -1,8 +1,11 @@
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.formats import date_format
 
+from . import images, variants
+from .forms import validate_colors, validate_storage
 from .models import (
     UserProfile, Product, Cart, CartItem, Order,
     OrderItem, CardDetails
@@ -32,12 +35,75 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
     
 
+# The resized variants of an image field, absolute when the request is known
+# (see core.images)
+def image_variant_urls(serializer, image):
+    request = serializer.context.get('request')
+    url = request.build_absolute_uri if request is not None else (lambda path: path)
+    return images.image_urls(image.name, image.storage, url)
+
+
+# The storage or colors list of a product, read from and written to its
+# variants (see core.variants). Reads use the prefetched variants.
+class VariantOptionsField(serializers.Field):
+    validators_by_name = {'storage': validate_storage, 'colors': validate_colors}
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, product):
+        return variants.options(product.variants.all(), self.field_name, product.stock > 0)
+
+    def to_internal_value(self, data):
+        try:
+            return {self.field_name: self.validators_by_name[self.field_name](data)}
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+    storage = VariantOptionsField()
+    colors = VariantOptionsField()
+
     class Meta:
         model = Product
         fields = "__all__"
         read_only_fields = ['created_at', 'updated_at']
 
+    def get_images(self, obj):
+        return image_variant_urls(self, obj.image)
+
+    def create(self, validated_data):
+        options = self.pop_options(validated_data, None)
+        product = super().create(validated_data)
+        variants.replace({product: options})
+        return product
+
+    def update(self, instance, validated_data):
+        options = self.pop_options(validated_data, instance)
+        product = super().update(instance, validated_data)
+        if options is not None:
+            variants.replace({product: options})
+        return product
+
+    # (storage, colors) to write, None when neither was given; a list left
+    # out of a partial update keeps its stored flags
+    def pop_options(self, validated_data, instance):
+        storage = validated_data.pop('storage', None)
+        colors = validated_data.pop('colors', None)
+        if instance is None:
+            return storage or [], colors or []
+        if storage is None and colors is None:
+            return None
+        current = list(instance.variants.all())
+        if storage is None:
+            storage = variants.options(current, 'storage')
+        if colors is None:
+            colors = variants.options(current, 'colors')
+        return storage, colors
+
         
 class CartItemSerializer(serializers.ModelSerializer):
     # Get the product name and id
@@ -74,22 +140,24 @@ class CartSerializer(serializers.ModelSerializer):
         
         
 class OrderItemSerializer(serializers.ModelSerializer):
-    # Use a SerializerMethodField to get the product name
-    product_name = serializers.CharField(source='product.name', read_only=True)
-    # Use a SerializerMethodField to get the product image
-    product_image = serializers.ImageField(source='product.image', read_only=True)
-    # Use a SerializerMethodField to get the product price
+    # product_name, product_image and unit_price are the snapshot stored on
+    # the item when the order was placed
     total_price = serializers.SerializerMethodField()
+    # Resized variants of product_image
+    images = serializers.SerializerMethodField()
     
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'product_name', 'product_image', 'status', 'quantity', 'total_price', 'color', 'size']
-        read_only_fields = ['id', 'product_name', 'product_image', 'quantity', 'color', 'size']
+        fields = ['id', 'product_name', 'product_image', 'images', 'status', 'quantity', 'unit_price', 'total_price', 'color', 'size']
+        read_only_fields = ['id', 'product_name', 'product_image', 'quantity', 'unit_price', 'color', 'size']
         
     # Method to calculate the total price of the order item
     def get_total_price(self, obj):
         return obj.get_total_price()
+
+    def get_images(self, obj):
+        return image_variant_urls(self, obj.product_image)
     
     
 class CardDetailsSerializer(serializers.ModelSerializer):
@@ -117,6 +185,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'placed_at',
             'status',
             'items',
+            'item_count',
             'total_price'
         ]
         
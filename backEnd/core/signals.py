@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from . import authentication, caching, images, search, sqlite, variants
+from .models import Cart, CartItem, CustomUser, Product, ProductVariant
+
+
+# Keep the product full-text index and the product cache in sync with the
+# catalog. The index is written in the same transaction as the product; the
+# cache is dropped once that commits, so a request running meanwhile cannot
+# cache the old row again.
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, using, **kwargs):
+    search.index_product(instance)
+    product_id = instance.pk
+    transaction.on_commit(lambda: caching.invalidate_product(product_id), using=using)
+
+
+# Resize a newly uploaded product image in the background once it is
+# committed. The product's payloads are cached without the variants until
+# they exist, so they are dropped again once they do.
+@receiver(post_save, sender=Product)
+def schedule_image_variants(sender, instance, using, **kwargs):
+    image = instance.image
+    if image and not images.variants_ready(image.name, image.storage):
+        name, storage, product_id = image.name, image.storage, instance.pk
+        transaction.on_commit(
+            lambda: images.schedule(name, storage, lambda: caching.invalidate_product(product_id)), using=using
+        )
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_on_delete(sender, instance, using, **kwargs):
+    search.remove_product(instance.pk)
+    product_id = instance.pk
+    transaction.on_commit(lambda: caching.invalidate_product(product_id), using=using)
+
+
+# A variant change is a change of its product's storage and colors
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def touch_product_on_variant_change(sender, instance, using, **kwargs):
+    variants.touch_products([instance.product_id], using=using)
+
+
+# Touch the cart whenever one of its items changes, so Cart.updated_at
+# can validate conditional requests for the whole cart
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart_on_item_change(sender, instance, using, **kwargs):
+    Cart.objects.using(using).filter(pk=instance.cart_id).touch()
+
+
+# Drop the cached user whenever it changes, e.g. is_active or the password.
+# Deleted again on commit so a request running meanwhile cannot leave the
+# old row cached.
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    authentication.invalidate_user(user_id)
+    transaction.on_commit(lambda: authentication.invalidate_user(user_id), using=using)
+
+
+# Configure every new database connection with the SQLite pragmas of the
+# active profile
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    sqlite.apply_pragmas(connection)
@@ -0,0 +1,23 @@
+from django.conf import settings
+
+
+# Connection pragmas of the opt-in SQLite production profile
+# (SQLITE_PROFILE=production, see superlian/settings.py).
+#
+# journal_mode=WAL lets readers run alongside the single writer and
+# synchronous=NORMAL is durable enough with WAL while syncing far less.
+# busy_timeout makes a writer wait for the lock instead of failing with
+# "database is locked"; mmap_size and cache_size keep hot pages in memory.
+# The pragmas are applied to every new connection through the
+# connection_created signal (see core.signals).
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def apply_pragmas(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
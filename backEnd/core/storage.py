@@ -0,0 +1,49 @@
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+# File system storage that names uploads after their content.
+#
+# save() stores a file as <directory>/<sha256 prefix><extension>, so a name
+# always refers to the same bytes and can be served with a long-lived,
+# immutable Cache-Control header. Uploading identical content again
+# returns the existing name instead of writing a second copy.
+class ContentHashedStorage(FileSystemStorage):
+    HASH_LENGTH = 32
+
+    def save(self, name, content, max_length=None):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest()[:self.HASH_LENGTH] + extension)
+
+    # Store content under exactly this name, replacing any file there; for
+    # files derived from a hashed original, such as its resized variants
+    # (see core.images)
+    def save_exact(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        return super().save(name, content)
+
+    # Hashed names, and the variants named after them, never change content
+    def is_immutable(self, name):
+        stem = posixpath.splitext(posixpath.basename(name))[0].split('-', 1)[0]
+        return len(stem) == self.HASH_LENGTH and all(c in '0123456789abcdef' for c in stem)
+
+
+def product_image_storage():
+    return ContentHashedStorage()
@@ -1,3 +1,1879 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from base64 import b64encode
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.db import DatabaseError, OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, QuerySet
+from django.test import TransactionTestCase
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import (
+    CustomUser, Product, ProductVariant, Cart, CartItem, Order, OrderItem
+)
+from core import authentication, caching, db_routers, images, inventory, media, renderers, search, sqlite, variants
+from core.admin import OrderAdmin
+from core.management.commands.update_product_fields import STORAGE_SIZES
+from core.middleware import ReplicaReadsMiddleware
+from core.parsers import FastJSONParser
+from core.storage import ContentHashedStorage
+from core.renderers import FastJSONRenderer
+from core.views import ProductViewSet
+
+
+# Shared helpers for building catalog, cart and order fixtures
+
+def make_user(username='buyer', email='buyer@example.com'):
+    return CustomUser.objects.create_user(username, email, password='secret-pass-123')
+
+
+def make_product(index=0, **kwargs):
+    defaults = {
+        'name': f'Product {index}',
+        'brand': 'Acme',
+        'description': 'A test product',
+        'price': Decimal('10.00') + index,
+        'stock': 100,
+        'category': 'Accessories',
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+def make_variants(product, sizes=(), colors=(), in_stock=True):
+    variants.replace({product: (
+        [{'size': size, 'in_stock': in_stock} for size in sizes],
+        [{'color': color, 'in_stock': in_stock} for color in colors],
+    )})
+
+
+class QueryCountMixin:
+    # Count the queries run by a request made with the test client
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, len(ctx.captured_queries)
+
+
+class CartQueryCountTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [make_product(i) for i in range(6)]
+
+    def fill_cart(self, count):
+        self.cart.items.all().delete()
+        for product in self.products[:count]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_get_my_cart_query_count_is_independent_of_item_count(self):
+        self.fill_cart(1)
+        response, small = self.count_queries('get', '/api/cart/me/')
+        self.assertEqual(response.status_code, 200)
+
+        self.fill_cart(6)
+        response, large = self.count_queries('get', '/api/cart/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), 6)
+        self.assertEqual(small, large)
+        # conditional request validators, cart, items and products
+        self.assertEqual(large, 4)
+
+    def test_cart_total_matches_items(self):
+        self.fill_cart(3)
+        response = self.client.get('/api/cart/me/')
+        expected = sum(p.price * 2 for p in self.products[:3])
+        self.assertEqual(Decimal(str(response.data['total_price'])), expected)
+
+    def test_cart_item_mutation_returns_cart_with_fixed_query_budget(self):
+        self.fill_cart(1)
+        item = self.cart.items.first()
+        _, small = self.count_queries('patch', f'/api/cart-item/{item.id}/', {'action': 'increment'})
+
+        self.fill_cart(6)
+        item = self.cart.items.first()
+        response, large = self.count_queries('patch', f'/api/cart-item/{item.id}/', {'action': 'increment'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), 6)
+        self.assertEqual(small, large)
+
+
+class OrderQueryCountTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.products = [make_product(i) for i in range(6)]
+
+    def place_order(self, item_count):
+        order = Order.objects.create(
+            user=self.user,
+            shipping_address='1 Test Street',
+            billing_address='1 Test Street',
+            payment_method='paypal',
+        )
+        for product in self.products[:item_count]:
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=product.price)
+        return order
+
+    def test_get_my_orders_query_count_is_independent_of_item_count(self):
+        self.place_order(1)
+        response, small = self.count_queries('get', '/api/orders/me/')
+        self.assertEqual(response.status_code, 200)
+
+        Order.objects.all().delete()
+        self.place_order(6)
+        self.place_order(6)
+        response, large = self.count_queries('get', '/api/orders/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(small, large)
+
+    def test_get_my_orders_renders_each_page_in_fixed_queries(self):
+        for _ in range(25):
+            self.place_order(2)
+        response, count = self.count_queries('get', '/api/orders/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        # orders and their items; the items do not join the catalog
+        self.assertEqual(count, 2)
+
+        response, count = self.count_queries('get', response.data['next'])
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(count, 2)
+
+
+class TotalsTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.products = [make_product(i) for i in range(3)]
+
+    def test_cart_with_totals_matches_python_total(self):
+        cart = Cart.objects.create(user=self.user)
+        for quantity, product in enumerate(self.products, start=1):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+
+        annotated = Cart.objects.with_totals().get(pk=cart.pk)
+        self.assertEqual(annotated.items_total, Decimal('10.00') + Decimal('22.00') + Decimal('36.00'))
+        self.assertEqual(annotated.get_total_price(), cart.get_total_price())
+
+    def test_with_totals_is_zero_for_empty_cart_and_order(self):
+        cart = Cart.objects.create(user=self.user)
+        order = Order.objects.create(
+            user=self.user, shipping_address='a', billing_address='b', payment_method='card'
+        )
+        self.assertEqual(Cart.objects.with_totals().get(pk=cart.pk).get_total_price(), Decimal('0.00'))
+        self.assertEqual(Order.objects.with_totals().get(pk=order.pk).get_total_price(), Decimal('0.00'))
+
+    def test_order_with_totals_computes_each_order_in_one_query(self):
+        orders = []
+        for count in range(1, 4):
+            order = Order.objects.create(
+                user=self.user, shipping_address='a', billing_address='b', payment_method='card'
+            )
+            for product in self.products[:count]:
+                OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=product.price)
+            orders.append(order)
+
+        with self.assertNumQueries(1):
+            totals = {o.pk: o.items_total for o in Order.objects.with_totals()}
+        for order in orders:
+            self.assertEqual(totals[order.pk], sum(item.get_total_price() for item in order.get_items()))
+
+
+class ProductPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(make_user())
+        self.products = [make_product(i) for i in range(5)]
+
+    def test_cursor_pages_cover_catalog_newest_first(self):
+        seen = []
+        url = '/api/products/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [p.id for p in reversed(self.products)])
+
+    def test_previous_cursor_returns_to_first_page(self):
+        first = self.client.get('/api/products/?page_size=2').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_page_query_uses_composite_index(self):
+        queryset = Product.objects.order_by('-created_at', '-id')[:24]
+        self.assertIn('product_created_id_idx', queryset.explain())
+
+    def test_tied_created_at_pages_by_id_without_offset(self):
+        # As after a bulk import
+        Product.objects.update(created_at=timezone.now())
+        seen, url = [], '/api/products/?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in ctx.captured_queries))
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [p.id for p in reversed(self.products)])
+
+        last = self.client.get('/api/products/?page_size=2').data
+        while last['next']:
+            last = self.client.get(last['next']).data
+        back = self.client.get(last['previous']).data
+        self.assertEqual([item['id'] for item in back['results']], seen[2:4])
+
+    def test_tied_ordering_field_pages_through_every_product(self):
+        Product.objects.update(price=Decimal('10.00'))
+        seen, url = [], '/api/products/?page_size=2&ordering=price'
+        while url:
+            response = self.client.get(url)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [p.id for p in self.products])
+
+    def test_malformed_cursor_is_not_found(self):
+        cursor = b64encode(b'p=not-json').decode()
+        response = self.client.get(f'/api/products/?cursor={cursor}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_values_of_the_wrong_type_is_not_found(self):
+        for url, values in [
+            ('/api/products/', ['abc', 'x']),
+            ('/api/products/?ordering=price', ['abc', '1']),
+            ('/api/orders/me/', [1, 2]),
+        ]:
+            cursor = b64encode(urlencode({'p': json.dumps(values)}).encode()).decode()
+            separator = '&' if '?' in url else '?'
+            response = self.client.get(f'{url}{separator}{urlencode({"cursor": cursor})}')
+            self.assertEqual(response.status_code, 404, (url, values))
+
+
+class ProductFilterTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(make_user())
+        self.speaker = make_product(0, category='Bluetooth Speakers', brand='Sony', price=Decimal('50.00'))
+        self.tablet = make_product(1, category='Tablets', brand='Apple', price=Decimal('400.00'))
+        self.phone = make_product(2, category='Flagship Phones', brand='Apple', price=Decimal('900.00'), stock=0)
+
+    def ids(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.ids('category=Tablets'), [self.tablet.id])
+        self.assertEqual(set(self.ids('category=Tablets,Bluetooth Speakers')), {self.tablet.id, self.speaker.id})
+        self.assertEqual(set(self.ids('brand=Apple')), {self.tablet.id, self.phone.id})
+        self.assertEqual(self.ids('price_min=100&price_max=500'), [self.tablet.id])
+        self.assertEqual(set(self.ids('in_stock=true')), {self.speaker.id, self.tablet.id})
+        self.assertEqual(self.ids('in_stock=false'), [self.phone.id])
+
+    def test_ordering(self):
+        self.assertEqual(self.ids('ordering=price'), [self.speaker.id, self.tablet.id, self.phone.id])
+        self.assertEqual(self.ids('ordering=-price'), [self.phone.id, self.tablet.id, self.speaker.id])
+        self.assertEqual(self.ids('brand=Apple&ordering=price,-created_at'), [self.tablet.id, self.phone.id])
+
+    def test_invalid_values_are_rejected(self):
+        self.assertEqual(self.client.get('/api/products/?price_min=cheap').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?in_stock=maybe').status_code, 400)
+
+    def test_each_filter_uses_an_index(self):
+        expected = {
+            'category=Tablets': 'product_category_idx',
+            'category=Tablets,Headphones': 'product_category_idx',
+            'brand=Apple': 'product_brand_idx',
+            'price_min=10&price_max=500': 'product_price_idx',
+            'in_stock=true': 'product_in_stock_idx',
+            'in_stock=false': 'product_out_of_stock_idx',
+        }
+        for query, index in expected.items():
+            request = Request(APIRequestFactory().get(f'/api/products/?{query}'))
+            view = ProductViewSet(request=request, format_kwarg=None, action='list')
+            plan = view.filter_queryset(view.get_queryset()).explain()
+            with self.subTest(query=query):
+                self.assertIn(f'USING INDEX {index}', plan)
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(make_user())
+        self.earbuds = make_product(0, name='Galaxy Buds Pro', brand='Samsung', category='Wireless Earbuds')
+        self.phone = make_product(1, name='Galaxy S24', brand='Samsung', category='Flagship Phones')
+        self.case = make_product(2, name='Leather case', brand='Nomad', description='Fits the Galaxy S24', category='Phone Cases')
+
+    def ids(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_results_are_ranked_by_relevance(self):
+        # A name match outranks a description match
+        self.assertEqual(self.ids('galaxy s24'), [self.phone.id, self.case.id])
+
+    def test_prefix_and_brand_match(self):
+        self.assertEqual(set(self.ids('sams')), {self.earbuds.id, self.phone.id})
+
+    def test_index_follows_saves_and_deletes(self):
+        self.phone.name = 'Pixel 9'
+        self.phone.save()
+        self.assertEqual(self.ids('pixel'), [self.phone.id])
+        self.assertNotIn(self.phone.id, self.ids('s24'))
+
+        self.phone.delete()
+        self.assertEqual(self.ids('pixel'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.ids('"galaxy" OR NOT *'), [])
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+    def test_broad_queries_rank_the_newest_matches_by_column(self):
+        with mock.patch.object(search, 'SEARCH_RANK_LIMIT', 2):
+            # A name match outranks a description match
+            self.assertEqual(self.ids('galaxy s24'), [self.phone.id, self.case.id])
+            self.assertEqual(self.ids('GALAXY bu'), [self.earbuds.id])
+            # Only the newest matches are ranked, equal ones newest first
+            watch = make_product(3, name='Galaxy Watch', brand='Samsung', category='Smartwatches')
+            self.assertEqual(self.ids('galaxy'), [watch.id, self.case.id])
+            self.assertEqual(self.ids('sams'), [watch.id, self.phone.id])
+
+    def test_filter_matching_and_rebuild(self):
+        Product.objects.filter(pk=self.case.pk).update(name='Silicone cover')
+        search.rebuild_index()
+        matching = search.filter_matching(Product.objects.all(), 'silicone')
+        self.assertEqual(list(matching), [self.case])
+
+
+class ProductCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(make_user())
+        self.product = make_product(0)
+
+    def test_list_is_served_from_cache_until_a_product_changes(self):
+        first = self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/products/')
+        self.assertEqual(cached.data, first.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(1)
+        refreshed = self.client.get('/api/products/')
+        self.assertEqual(len(refreshed.data['results']), 2)
+
+    def test_detail_is_invalidated_on_save_and_delete(self):
+        url = f'/api/products/{self.product.id}/'
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).data['name'], 'Product 0')
+
+        self.product.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(url).data['name'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cache_is_dropped_only_once_the_change_commits(self):
+        url = f'/api/products/{self.product.id}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.name = 'Renamed'
+            self.product.save()
+            # Not committed yet: the cached payload stays
+            self.assertIn(caching.detail_key(self.product.id), cache)
+        for callback in callbacks:
+            callback()
+        self.assertNotIn(caching.detail_key(self.product.id), cache)
+
+    def test_hit_and_miss_counters(self):
+        caching.reset_stats()
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(caching.get_stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 0.3333})
+
+    def test_cache_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/products/cache-stats/').status_code, 403)
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/products/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.data)
+
+
+class ConditionalRequestTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(0)
+
+    def assert_revalidates(self, url, last_modified=True):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertEqual('Last-Modified' in response, last_modified)
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        return response['ETag']
+
+    def test_product_list_and_detail_answer_304_until_changed(self):
+        list_etag = self.assert_revalidates('/api/products/', last_modified=False)
+        detail_url = f'/api/products/{self.product.id}/'
+        detail_etag = self.assert_revalidates(detail_url)
+
+        self.product.price = Decimal('99.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_product_list_etag_changes_on_delete(self):
+        other = make_product(1)
+        etag = self.assert_revalidates('/api/products/', last_modified=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_modified_list_check_skips_the_database(self):
+        etag = self.client.get('/api/products/?brand=Acme&ordering=price')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/?ordering=price&brand=Acme', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cart_answers_304_until_an_item_changes(self):
+        cart = Cart.objects.create(user=self.user)
+        item = CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        etag = self.assert_revalidates('/api/cart/me/')
+
+        self.client.patch(f'/api/cart-item/{item.id}/', {'action': 'increment'}, format='json')
+        response = self.client.get('/api/cart/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'][0]['quantity'], 2)
+
+
+class OrderPlacementTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.products = [make_product(i) for i in range(30)]
+        for product in self.products:
+            make_variants(product, colors=['Black'])
+
+    def payload(self, products, **extra):
+        data = {
+            'payment_method': 'card',
+            'shipping_address': '1 Test Street',
+            'billing_address': '1 Test Street',
+            'card': {'cardNumber': '4242424242424242', 'expiry': '12/30', 'cvv': '123'},
+            'items': [{'product': p.id, 'quantity': 2, 'color': 'Black'} for p in products],
+        }
+        data.update(extra)
+        return data
+
+    def test_order_is_placed_with_all_items(self):
+        response = self.client.post('/api/orders/', self.payload(self.products[:3]), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(Decimal(str(response.data['total_price'])), sum(p.price * 2 for p in self.products[:3]))
+
+    def test_query_count_is_independent_of_line_items(self):
+        _, small = self.count_queries('post', '/api/orders/', self.payload(self.products[:1]))
+        _, large = self.count_queries('post', '/api/orders/', self.payload(self.products))
+        self.assertEqual(small, large)
+
+    def test_missing_products_are_listed_and_nothing_is_written(self):
+        payload = self.payload(self.products[:2])
+        payload['items'] += [{'product': 9999, 'quantity': 1}, {'product': 9998, 'quantity': 1}]
+        response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['missing_product_ids'], [9998, 9999])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_unknown_variants_are_rejected(self):
+        payload = self.payload(self.products[:2])
+        payload['items'][1]['color'] = 'Gold'
+        response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unknown_variant_product_ids'], [self.products[1].id])
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_quantity_is_rejected(self):
+        payload = self.payload(self.products[:1])
+        payload['items'][0]['quantity'] = 0
+        self.assertEqual(self.client.post('/api/orders/', payload, format='json').status_code, 400)
+        payload['items'][0]['quantity'] = 'many'
+        self.assertEqual(self.client.post('/api/orders/', payload, format='json').status_code, 400)
+
+    def test_out_of_range_ids_quantities_and_empty_orders_are_rejected(self):
+        for field, value in [('product', 10 ** 30), ('product', None), ('quantity', 10 ** 30), ('quantity', None)]:
+            payload = self.payload(self.products[:1])
+            payload['items'][0][field] = value
+            self.assertEqual(self.client.post('/api/orders/', payload, format='json').status_code, 400, field)
+        # Two lines of the same product whose total overflows the column
+        payload = self.payload(self.products[:1] * 2)
+        for item in payload['items']:
+            item['quantity'] = 2 ** 62
+        self.assertEqual(self.client.post('/api/orders/', payload, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/orders/', self.payload([]), format='json').status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(0)
+        self.now = timezone.now()
+
+    def place_order(self, days_ago, status='Order placed', user=None):
+        order = Order.objects.create(
+            user=user or self.user,
+            shipping_address='a',
+            billing_address='b',
+            payment_method='paypal',
+            status=status,
+        )
+        # placed_at is auto_now_add, so move it afterwards
+        Order.objects.filter(pk=order.pk).update(placed_at=self.now - datetime.timedelta(days=days_ago))
+        return order
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.data['results']]
+
+    def test_history_is_newest_first_and_only_the_users_orders(self):
+        old = self.place_order(5)
+        new = self.place_order(1)
+        self.place_order(0, user=make_user('other', 'other@example.com'))
+        self.assertEqual(self.ids('/api/orders/me/'), [new.id, old.id])
+
+    def test_pages_follow_the_cursor_without_overlap(self):
+        orders = [self.place_order(days) for days in range(7)]
+        response = self.client.get('/api/orders/me/?page_size=3')
+        seen = [order['id'] for order in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [order['id'] for order in response.data['results']]
+        self.assertEqual(seen, [order.id for order in orders])
+
+    def test_filters_by_status_and_dates(self):
+        cancelled = self.place_order(10, status=Order.STATUS_CANCELLED)
+        recent = self.place_order(2)
+        today = self.place_order(0)
+        self.assertEqual(self.ids(f'/api/orders/me/?status={Order.STATUS_CANCELLED}'), [cancelled.id])
+
+        since = (self.now - datetime.timedelta(days=3)).date().isoformat()
+        self.assertEqual(self.ids(f'/api/orders/me/?since={since}'), [today.id, recent.id])
+
+        until = (self.now - datetime.timedelta(days=2)).date().isoformat()
+        self.assertEqual(self.ids(f'/api/orders/me/?until={until}'), [recent.id, cancelled.id])
+
+    def test_no_orders_is_an_empty_page(self):
+        response = self.client.get('/api/orders/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_date_is_rejected(self):
+        self.assertEqual(self.client.get('/api/orders/me/?since=yesterday').status_code, 400)
+
+
+class OrderSnapshotTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.products = [make_product(i) for i in range(3)]
+
+    def place(self):
+        response = self.client.post('/api/orders/', {
+            'payment_method': 'paypal',
+            'shipping_address': 'a',
+            'billing_address': 'b',
+            'items': [{'product': p.id, 'quantity': 2} for p in self.products],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_placing_stores_snapshot_and_totals(self):
+        response = self.place()
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order.total_price, sum(p.price * 2 for p in self.products))
+        self.assertEqual(response.data['item_count'], 3)
+        item = order.items.get(product=self.products[0])
+        self.assertEqual(item.unit_price, self.products[0].price)
+        self.assertEqual(item.product_name, self.products[0].name)
+
+    def test_history_keeps_prices_after_catalog_changes(self):
+        self.place()
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('999.00'), name='Renamed')
+
+        response = self.client.get('/api/orders/me/')
+        self.assertEqual(response.status_code, 200)
+        order = response.data['results'][0]
+        self.assertEqual(Decimal(str(order['total_price'])), sum(p.price * 2 for p in self.products))
+        item = next(i for i in order['items'] if i['product_name'] == self.products[0].name)
+        self.assertEqual(Decimal(str(item['unit_price'])), self.products[0].price)
+
+    def test_history_does_not_query_products(self):
+        self.place()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/orders/me/').status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'core_product' in q['sql']])
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(0, stock=5)
+        self.other = make_product(1, stock=1)
+
+    def order(self, *lines):
+        return self.client.post('/api/orders/', {
+            'payment_method': 'paypal',
+            'shipping_address': 'a',
+            'billing_address': 'b',
+            'items': [{'product': p.id, 'quantity': q} for p, q in lines],
+        }, format='json')
+
+    def test_placing_an_order_takes_stock(self):
+        self.assertEqual(self.order((self.product, 2), (self.product, 1)).status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+    def test_shortage_is_reported_per_item_and_rolls_back(self):
+        response = self.order((self.product, 2), (self.other, 3))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['unavailable'], [{'product': self.other.id, 'requested': 3, 'available': 1}])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancelling_restores_stock_once(self):
+        order_id = self.order((self.product, 4)).data['id']
+        response = self.client.post(f'/api/orders/{order_id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Order.STATUS_CANCELLED)
+        self.assertEqual(self.client.post(f'/api/orders/{order_id}/cancel/').status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_only_placed_orders_can_be_cancelled(self):
+        order_id = self.order((self.product, 4)).data['id']
+        Order.objects.filter(pk=order_id).update(status='Shipped')
+        response = self.client.post(f'/api/orders/{order_id}/cancel/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'Shipped')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_cancelling_an_order_that_reserved_nothing_keeps_stock(self):
+        order = Order.objects.create(user=self.user, shipping_address='a', billing_address='b', payment_method='paypal')
+        OrderItem.objects.create(order=order, product=self.product, quantity=3, unit_price=self.product.price)
+        self.assertEqual(self.client.post(f'/api/orders/{order.id}/cancel/').status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+
+class StockContentionTests(TransactionTestCase):
+    # Many threads compete for the last units of a product
+    def test_stock_never_goes_negative_under_contention(self):
+        product = make_product(0, stock=25)
+        workers, attempts_per_worker = 8, 10
+        reserved = []
+        lock = threading.Lock()
+
+        def buy():
+            try:
+                for _ in range(attempts_per_worker):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                if inventory.reserve_stock({product.id: 1}):
+                                    transaction.set_rollback(True)
+                                    ok = False
+                                else:
+                                    ok = True
+                            break
+                        except OperationalError:
+                            # SQLite reports a busy database instead of waiting
+                            continue
+                    if ok:
+                        with lock:
+                            reserved.append(1)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(reserved), 25)
+        self.assertEqual(product.stock, 0)
+
+
+class CartItemTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(0)
+        make_variants(self.product, sizes=['128GB'], colors=['Black', 'Blue'])
+
+    def add(self, **data):
+        return self.client.post('/api/cart-item/', {'productId': self.product.id, **data}, format='json')
+
+    def test_adding_the_same_variant_increments_it(self):
+        self.add(color='Black', size='128GB')
+        response = self.add(color='Black', size='128GB')
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2])
+
+    def test_variants_are_kept_apart(self):
+        self.add(color='Black')
+        self.add(color='Blue')
+        response = self.add()
+        self.assertEqual(len(response.data['items']), 3)
+
+    def test_decrement_at_one_removes_the_item(self):
+        item_id = self.add().data['items'][0]['id']
+        response = self.client.patch(f'/api/cart-item/{item_id}/', {'action': 'decrement'}, format='json')
+        self.assertEqual(response.data['items'], [])
+
+    def test_decrement_keeps_an_item_incremented_meanwhile(self):
+        item_id = self.add().data['items'][0]['id']
+        delete = QuerySet.delete
+
+        # Another request increments the item between the two statements
+        def delete_after_increment(queryset):
+            CartItem.objects.filter(pk=item_id).update(quantity=F('quantity') + 1)
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', delete_after_increment):
+            response = self.client.patch(f'/api/cart-item/{item_id}/', {'action': 'decrement'}, format='json')
+        self.assertEqual([item['quantity'] for item in response.data['items']], [1])
+
+    def test_unknown_variants_are_rejected(self):
+        self.assertEqual(self.add(color='Gold').status_code, 400)
+        self.assertEqual(self.add(color='Blue', size='1TB').status_code, 400)
+        self.assertEqual(self.add(size='128GB').status_code, 200)
+        self.assertFalse(CartItem.objects.filter(color='Gold').exists())
+
+    def test_unknown_product_is_rejected(self):
+        self.assertEqual(self.client.post('/api/cart-item/', {'productId': 9999}, format='json').status_code, 404)
+        self.assertEqual(self.client.post('/api/cart-item/', {'productId': 'x'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/cart-item/', {'productId': 10 ** 30}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/cart-item/', {}, format='json').status_code, 400)
+
+    def test_items_of_other_carts_are_not_reachable(self):
+        item_id = self.add().data['items'][0]['id']
+        self.client.force_authenticate(make_user('other', 'other@example.com'))
+        response = self.client.patch(f'/api/cart-item/{item_id}/', {'action': 'increment'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class CartDeltaResponseTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [make_product(i) for i in range(20)]
+
+    def test_delta_contains_only_the_changed_item_and_totals(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=2)
+        response = self.client.post(
+            '/api/cart-item/?response=delta', {'productId': self.products[0].id}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item']['product_id'], self.products[0].id)
+        self.assertEqual(response.data['cart']['item_count'], 2)
+        self.assertEqual(response.data['cart']['total_quantity'], 3)
+        self.assertEqual(response.data['cart']['total_price'], self.products[0].price + self.products[1].price * 2)
+
+    def test_removed_item_is_reported(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0])
+        response = self.client.patch(
+            f'/api/cart-item/{item.id}/?response=delta', {'action': 'remove'}, format='json'
+        )
+        self.assertIsNone(response.data['item'])
+        self.assertEqual(response.data['removed_item_id'], item.id)
+        self.assertEqual(response.data['cart']['item_count'], 0)
+
+    def test_cost_stays_flat_as_the_cart_grows(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0])
+        url = f'/api/cart-item/{item.id}/?response=delta'
+        small, small_queries = self.count_queries('patch', url, {'action': 'increment'})
+
+        for product in self.products[1:]:
+            CartItem.objects.create(cart=self.cart, product=product)
+        large, large_queries = self.count_queries('patch', url, {'action': 'increment'})
+
+        self.assertEqual(small_queries, large_queries)
+        # only the digits of the totals grow
+        self.assertLess(len(large.content) - len(small.content), 16)
+
+
+class CartBatchTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [make_product(i) for i in range(10)]
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(self.cart.items.values_list('product_id', 'quantity'))
+
+    def test_operations_are_applied_in_order(self):
+        keep = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        drop = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=3)
+        response = self.batch(
+            {'op': 'increment', 'item': keep.id},
+            {'op': 'increment', 'item': keep.id},
+            {'op': 'decrement', 'item': keep.id},
+            {'op': 'remove', 'item': drop.id},
+            {'op': 'add', 'product': self.products[2].id, 'quantity': 2},
+            {'op': 'add', 'product': self.products[2].id},
+            {'op': 'add', 'product': self.products[0].id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.products[0].id: 3, self.products[2].id: 3})
+        self.assertEqual(len(response.data['items']), 2)
+
+    def test_set_quantity_to_zero_removes_the_item(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=4)
+        self.batch({'op': 'set_quantity', 'item': item.id, 'quantity': 7})
+        self.assertEqual(self.quantities(), {self.products[0].id: 7})
+        self.batch({'op': 'set_quantity', 'item': item.id, 'quantity': 0})
+        self.assertEqual(self.quantities(), {})
+
+    def test_a_bad_operation_rolls_back_the_batch(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        other_cart = Cart.objects.create(user=make_user('other', 'other@example.com'))
+        foreign = CartItem.objects.create(cart=other_cart, product=self.products[0])
+
+        response = self.batch({'op': 'increment', 'item': item.id}, {'op': 'remove', 'item': foreign.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unknown_item_ids'], [foreign.id])
+        self.assertEqual(self.quantities(), {self.products[0].id: 1})
+
+        self.assertEqual(self.batch({'op': 'add', 'product': 9999}).status_code, 400)
+        self.assertEqual(self.batch({'op': 'explode'}).status_code, 400)
+
+    def test_out_of_range_values_are_rejected(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        huge = 10 ** 30
+        for operation in [
+            {'op': 'add', 'product': huge},
+            {'op': 'add', 'product': self.products[1].id, 'quantity': huge},
+            {'op': 'increment', 'item': huge},
+            {'op': 'set_quantity', 'item': item.id, 'quantity': huge},
+        ]:
+            self.assertEqual(self.batch(operation).status_code, 400, operation)
+        # Quantities that only overflow once folded together
+        response = self.batch(*[{'op': 'add', 'product': self.products[1].id, 'quantity': 2 ** 62}] * 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.products[0].id: 1})
+
+    def test_changes_committed_after_the_read_are_kept(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        read_products = variants.variants_by_product
+
+        # Another request changes the cart after the batch read its items
+        def concurrent_change(product_ids):
+            CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + 5)
+            CartItem.objects.add_item(self.cart.pk, self.products[1].id)
+            return read_products(product_ids)
+
+        with mock.patch('core.cart_operations.variants.variants_by_product', concurrent_change):
+            response = self.batch(
+                {'op': 'increment', 'item': item.id},
+                {'op': 'add', 'product': self.products[1].id, 'quantity': 2},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.products[0].id: 8, self.products[1].id: 3})
+
+    def test_query_count_is_independent_of_batch_size(self):
+        small_ops = [{'op': 'add', 'product': self.products[0].id}]
+        large_ops = [{'op': 'add', 'product': p.id} for p in self.products]
+        _, small = self.count_queries('post', '/api/cart/batch/', {'operations': small_ops})
+        self.cart.items.all().delete()
+        _, large = self.count_queries('post', '/api/cart/batch/', {'operations': large_ops})
+        self.assertEqual(small, large)
+
+
+class CartContentionTests(TransactionTestCase):
+    # Hundreds of parallel adds of the same product must all be counted
+    def test_parallel_adds_are_not_lost(self):
+        user = make_user()
+        product = make_product(0)
+        cart = Cart.objects.create(user=user)
+        workers, adds_per_worker = 10, 30
+
+        def add_many():
+            try:
+                for _ in range(adds_per_worker):
+                    while True:
+                        try:
+                            CartItem.objects.add_item(cart.pk, product.pk)
+                            break
+                        except OperationalError:
+                            # SQLite reports a busy database instead of
+                            # waiting; the statement was not applied
+                            continue
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=add_many) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        item = CartItem.objects.get(cart=cart, product=product)
+        self.assertEqual(item.quantity, workers * adds_per_worker)
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        'price': Decimal('19.99'),
+        'placed_at': datetime.datetime(2025, 6, 19, 11, 57, 3, 123456, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2025, 6, 19),
+        'label': gettext_lazy('Order placed'),
+        'items': [{'name': 'Caf\u00e9 speaker', 'quantity': 2}],
+        1: 'integer key',
+    }
+
+    def test_output_matches_the_stock_renderer(self):
+        fast = FastJSONRenderer().render(self.data)
+        stock = JSONRenderer().render(self.data)
+        self.assertEqual(json.loads(fast), json.loads(stock))
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_indent_uses_the_stock_renderer(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, media_type),
+            JSONRenderer().render(self.data, media_type),
+        )
+
+    def test_parser(self):
+        parser = FastJSONParser()
+        body = '{"items": [{"product": 1, "quantity": 2}], "note": "Caf\u00e9"}'.encode('utf-8')
+        self.assertEqual(
+            parser.parse(io.BytesIO(body)),
+            {'items': [{'product': 1, 'quantity': 2}], 'note': 'Caf\u00e9'},
+        )
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"broken": '))
+
+
+class CachedJWTAuthenticationTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        Cart.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def test_user_lookup_is_served_from_the_cache(self):
+        response, cold = self.count_queries('get', '/api/cart/me/')
+        self.assertEqual(response.status_code, 200)
+        response, warm = self.count_queries('get', '/api/cart/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], self.user.id)
+        self.assertEqual(warm, cold - 1)
+
+    def test_cache_holds_no_password_hash_and_loads_the_rest_lazily(self):
+        self.assertEqual(self.client.get('/api/cart/me/').status_code, 200)
+        entry = cache.get(authentication.user_key(self.user.id))
+        self.assertEqual(entry['fields'], {'id': self.user.id, 'is_active': True, 'is_staff': False})
+        self.assertNotIn(self.user.password, str(entry))
+
+        request = mock.Mock()
+        request.META = {'HTTP_AUTHORIZATION': f'JWT {AccessToken.for_user(self.user)}'}
+        with self.assertNumQueries(0):
+            user, _ = authentication.CachedJWTAuthentication().authenticate(request)
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual((user.email, user.username), (self.user.email, self.user.username))
+
+    def test_revoked_token_is_rejected_from_the_cache(self):
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.client.get('/api/cart/me/').status_code, 200)
+            # The password changes without the signals, e.g. in another process
+            CustomUser.objects.filter(pk=self.user.pk).update(password='changed')
+            cache.set(
+                authentication.user_key(self.user.id),
+                authentication.cache_entry(CustomUser.objects.get(pk=self.user.pk)),
+            )
+            self.assertEqual(self.client.get('/api/cart/me/').status_code, 401)
+
+    def test_deactivating_the_user_takes_effect_immediately(self):
+        self.assertEqual(self.client.get('/api/cart/me/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(authentication.user_key(self.user.id)))
+        self.assertEqual(self.client.get('/api/cart/me/').status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/cart/me/').status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/cart/me/').status_code, 401)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1', 'replica_2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_routers.PrimaryReplicaRouter()
+
+    def handle(self, method, view):
+        middleware = ReplicaReadsMiddleware(lambda request: view())
+        return middleware(getattr(RequestFactory(), method)('/api/products/'))
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertIn(self.handle('get', lambda: self.router.db_for_read(Product)), ['replica_1', 'replica_2'])
+
+    def test_unsafe_requests_and_code_outside_requests_use_the_primary(self):
+        self.assertEqual(self.handle('post', lambda: self.router.db_for_read(Product)), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        def view():
+            self.assertEqual(self.router.db_for_write(Order), 'default')
+            return self.router.db_for_read(Order)
+
+        self.assertEqual(self.handle('get', view), 'default')
+        # The pin ends with the request
+        self.assertNotEqual(self.handle('get', lambda: self.router.db_for_read(Order)), 'default')
+
+    def test_primary_reads_opt_out(self):
+        def view():
+            with db_routers.primary_reads():
+                return self.router.db_for_read(Product)
+
+        self.assertEqual(self.handle('get', view), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.handle('get', lambda: self.router.db_for_read(Product)), 'default')
+
+
+# A replica in its own SQLite file, which lags behind the primary: it is
+# migrated once and never receives the primary's writes
+class LaggingReplicaTests(TransactionTestCase):
+    alias = 'replica_lagging'
+    # Resolved when the class is set up, once the replica is configured
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.settings[cls.alias] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        cache.clear()
+        call_command('migrate', database=self.alias, verbosity=0)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        self.product = make_product(0, name='Old name')
+        Product.objects.using(self.alias).bulk_create([Product.objects.get(pk=self.product.pk)])
+        # Committed on the primary only; the cached payloads are dropped
+        self.product.name = 'New name'
+        self.product.save()
+
+    def test_cached_payloads_are_built_from_the_primary(self):
+        with override_settings(REPLICA_DATABASES=[self.alias]):
+            # Safe requests do read the lagging file
+            with db_routers.replica_reads():
+                self.assertEqual(Product.objects.get(pk=self.product.pk).name, 'Old name')
+
+            response = self.client.get('/api/products/')
+            self.assertEqual([item['name'] for item in response.data['results']], ['New name'])
+            response = self.client.get(f'/api/products/{self.product.pk}/')
+            self.assertEqual(response.data['name'], 'New name')
+            # And so are the payloads served from the cache afterwards
+            self.assertEqual(self.client.get('/api/products/').data['results'][0]['name'], 'New name')
+
+
+class SQLitePragmaTests(APITestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_of_the_profile_are_applied(self):
+        original = {name: self.pragma(name) for name in ('cache_size', 'busy_timeout')}
+        try:
+            with override_settings(SQLITE_PRAGMAS={'cache_size': -1234, 'busy_timeout': 2500}):
+                sqlite.apply_pragmas(connection)
+            self.assertEqual(self.pragma('cache_size'), -1234)
+            self.assertEqual(self.pragma('busy_timeout'), 2500)
+        finally:
+            with override_settings(SQLITE_PRAGMAS=original):
+                sqlite.apply_pragmas(connection)
+
+    def test_default_profile_changes_nothing(self):
+        original = self.pragma('cache_size')
+        sqlite.apply_pragmas(connection)
+        self.assertEqual(self.pragma('cache_size'), original)
+
+    def test_production_profile_leaves_the_replicas_alone(self):
+        # Settings are read once, so load them in a fresh interpreter
+        script = (
+            'import json; from superlian import settings; '
+            'print(json.dumps({alias: [db.get("OPTIONS", {}), db.get("CONN_MAX_AGE", 0)] '
+            'for alias, db in settings.DATABASES.items()}))'
+        )
+        env = {**os.environ, 'SQLITE_PROFILE': 'production', 'DATABASE_REPLICAS': 'replica.sqlite3', 'CONN_MAX_AGE': '600'}
+        output = subprocess.run(
+            [sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        databases = json.loads(output)
+        self.assertEqual(databases['default'], [{'transaction_mode': 'IMMEDIATE'}, 600])
+        self.assertEqual(databases['replica_1'], [{}, 0])
+
+
+class TemporaryMediaMixin:
+    # Store uploads in a directory removed after the test
+    def use_temporary_media(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def png(self, width, height, color=(200, 30, 30, 128)):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (width, height), color).save(buffer, format='PNG')
+        return ContentFile(buffer.getvalue(), name='phone.png')
+
+
+class ImageVariantTests(TemporaryMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(make_user())
+        self.use_temporary_media()
+
+    def test_variants_are_resized_without_upscaling(self):
+        name = default_storage.save('product_images/phone.png', self.png(2000, 1000))
+        images.generate_variants(name, default_storage)
+
+        for variant, width in images.VARIANTS.items():
+            for image_format in images.FORMATS:
+                with default_storage.open(images.variant_name(name, variant, image_format)) as file:
+                    self.assertEqual(Image.open(file).size, (width, width // 2))
+
+        small = default_storage.save('product_images/small.png', self.png(300, 300))
+        images.generate_variants(small, default_storage)
+        with default_storage.open(images.variant_name(small, 'detail', 'webp')) as file:
+            self.assertEqual(Image.open(file).size, (300, 300))
+
+    def test_upload_generates_variants_in_the_background(self):
+        product = make_product(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image.save('phone.png', self.png(800, 600))
+        images.wait()
+        self.assertTrue(images.has_variants(product.image.name, default_storage))
+
+    def test_serializers_return_the_images_dict(self):
+        product = make_product(0)
+        name = default_storage.save('product_images/phone.png', self.png(600, 600))
+        images.generate_variants(name, default_storage)
+        Product.objects.filter(pk=product.pk).update(image=name)
+
+        data = self.client.get(f'/api/products/{product.pk}/').data['images']
+        self.assertEqual(data['original'], 'http://testserver/media/product_images/phone.png')
+        self.assertEqual(data['card']['webp'], 'http://testserver/media/product_images/variants/phone-card.webp')
+        self.assertEqual(
+            data['srcset']['jpeg'],
+            'http://testserver/media/product_images/variants/phone-thumbnail.jpg 160w, '
+            'http://testserver/media/product_images/variants/phone-card.jpg 480w, '
+            'http://testserver/media/product_images/variants/phone-detail.jpg 1024w',
+        )
+        self.assertIsNone(self.client.get(f'/api/products/{make_product(1).pk}/').data['images'])
+
+    def test_variant_urls_appear_once_the_variants_exist(self):
+        product = make_product(0)
+        url = f'/api/products/{product.pk}/'
+        # The commit callbacks run when the inner block exits
+        with mock.patch('core.images.schedule'):
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image.save('phone.png', self.png(800, 600))
+        self.assertIsNone(self.client.get(url).data['images'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        images.wait()
+        self.assertEqual(
+            self.client.get(url).data['images']['original'], f'http://testserver/media/{product.image.name}'
+        )
+
+    def test_detail_etag_changes_once_the_variants_exist(self):
+        product = make_product(0)
+        url = f'/api/products/{product.pk}/'
+        # The commit callbacks run when the inner block exits
+        with mock.patch('core.images.schedule'):
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image.save('phone.png', self.png(800, 600))
+        pending = self.client.get(url)
+        self.assertIsNone(pending.data['images'])
+        self.assertNotIn('Last-Modified', pending)
+
+        # Generated by the worker, which leaves updated_at alone
+        images.generate_variants(product.image.name, product.image.storage)
+        caching.invalidate_product(product.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=pending['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['images'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_backfill_command_resizes_existing_images(self):
+        name = default_storage.save('product_images/phone.png', self.png(1200, 900))
+        product = make_product(0)
+        Product.objects.filter(pk=product.pk).update(image=name)
+        self.assertIsNone(self.client.get(f'/api/products/{product.pk}/').data['images'])
+
+        call_command('generate_image_variants', stdout=io.StringIO())
+        self.assertTrue(images.has_variants(name, default_storage))
+        self.assertIsNotNone(self.client.get(f'/api/products/{product.pk}/').data['images'])
+
+
+class ContentHashedStorageTests(TemporaryMediaMixin, APITestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.storage = ContentHashedStorage()
+
+    def test_names_follow_the_content(self):
+        first = self.storage.save('product_images/phone.PNG', self.png(10, 10))
+        again = self.storage.save('product_images/other-name.png', self.png(10, 10))
+        other = self.storage.save('product_images/phone.png', self.png(10, 10, color=(0, 0, 0, 255)))
+
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^product_images/[0-9a-f]{32}\.png$')
+        self.assertEqual(len(self.storage.listdir('product_images')[1]), 2)
+
+    def test_uploaded_product_images_are_hashed_and_keep_their_variants(self):
+        product = make_product(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image.save('phone.png', self.png(600, 400))
+        images.wait()
+
+        self.assertTrue(product.image.storage.is_immutable(product.image.name))
+        self.assertTrue(images.has_variants(product.image.name, product.image.storage))
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_offloaded_responses_have_no_body(self):
+        name = self.storage.save('product_images/phone.png', self.png(10, 10))
+        response = media.media_response(name)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], media.IMMUTABLE)
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_OFFLOAD='x-sendfile'):
+            response = media.media_response('product_images/legacy.png')
+        self.assertEqual(response['X-Sendfile'], f'{self.media_root}/product_images/legacy.png')
+        self.assertNotIn('Cache-Control', response)
+
+    @override_settings(MEDIA_OFFLOAD='')
+    def test_files_are_streamed_without_offloading(self):
+        name = self.storage.save('product_images/phone.png', self.png(10, 10))
+        response = media.media_response(name)
+        self.assertEqual(b''.join(response.streaming_content), self.storage.open(name).read())
+        response.close()
+
+    def test_paths_outside_media_root_are_not_served(self):
+        with self.assertRaises(Http404):
+            media.media_response('../settings.py')
+
+
+class UpdateProductFieldsCommandTests(APITestCase):
+    def setUp(self):
+        self.phones = [make_product(i, category='Flagship Phones') for i in range(5)]
+        self.tablet = make_product(5, category='Tablets')
+        self.speaker = make_product(6, category='Bluetooth Speakers')
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('update_product_fields', *args, stdout=out)
+        return out.getvalue()
+
+    def test_updates_only_the_target_categories_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_command('--batch-size=2')
+        self.assertIn('Successfully updated 6 products.', output)
+        # One INSERT of the variants per batch of 2
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_productvariant"')]
+        self.assertEqual(len(inserts), 3)
+
+        for product in self.phones + [self.tablet]:
+            product.refresh_from_db()
+            self.assertEqual(variants.options(product.variants.all(), 'colors')[0], {"color": "Black", "in_stock": True})
+            self.assertEqual(variants.options(product.variants.all(), 'storage'), STORAGE_SIZES)
+            self.assertGreater(product.updated_at, self.speaker.updated_at)
+        self.assertFalse(self.speaker.variants.exists())
+
+        self.assertIn('Successfully updated 0 products.', self.run_command())
+
+    def test_sold_out_products_are_not_rewritten(self):
+        Product.objects.filter(pk__in=[p.pk for p in self.phones]).update(stock=0)
+        self.assertIn('Successfully updated 6 products.', self.run_command())
+        self.assertIn('Successfully updated 0 products.', self.run_command())
+
+    def test_dry_run_and_categories(self):
+        output = self.run_command('--dry-run', '--categories=Tablets')
+        self.assertIn('Would update 1 products.', output)
+        self.assertFalse(ProductVariant.objects.exists())
+
+    def test_unknown_categories_are_rejected(self):
+        with self.assertRaises(CommandError):
+            self.run_command('--categories=Phones')
+
+
+class ImportProductsCommandTests(APITestCase):
+    def write_file(self, suffix, text):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with open(handle, 'w', encoding='utf-8') as file:
+            file.write(text)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def run_command(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_rows_are_upserted_and_bad_rows_reported(self):
+        existing = make_product(0)
+        path = self.write_file('.csv', (
+            'id,name,brand,description,price,stock,category,storage,colors\n'
+            f'{existing.pk},Renamed,Apple,Bigger,999.00,3,Tablets,"[{{""size"": ""128GB"", ""in_stock"": true}}]",\n'
+            ',New phone,Google,Fresh,499.50,10,Flagship Phones,,"[{""color"": ""Blue"", ""in_stock"": true}]"\n'
+            ',Bad size,Google,Big,1.00,1,Tablets,"[{""size"": ""2TB"", ""in_stock"": true}]",\n'
+            ',Bad category,Google,Odd,1.00,1,Phones,,\n'
+        ))
+        out, err = self.run_command(path, '--batch-size=1')
+
+        self.assertIn('Imported 2 products, rejected 2 rows.', out)
+        self.assertIn("line 4: storage: Invalid size: '2TB'", err)
+        self.assertIn('line 5: category:', err)
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price, existing.category), ('Renamed', Decimal('999.00'), 'Tablets'))
+        self.assertEqual(variants.options(existing.variants.all(), 'storage'), [{'size': '128GB', 'in_stock': True}])
+        new = Product.objects.get(name='New phone')
+        self.assertEqual(variants.options(new.variants.all(), 'colors'), [{'color': 'Blue', 'in_stock': True}])
+        # The bulk writes were indexed batch by batch
+        self.assertEqual(search.search_product_ids('fresh'), [new.pk])
+        self.assertEqual(search.search_product_ids('bigger'), [existing.pk])
+
+    def test_whole_index_is_rebuilt_only_on_request(self):
+        # Written behind the index's back
+        stale = make_product(0)
+        Product.objects.filter(pk=stale.pk).update(description='Forgotten')
+        path = self.write_file('.jsonl', json.dumps(
+            {'name': 'Tab', 'brand': 'B', 'description': 'Imported', 'price': 5, 'stock': 1, 'category': 'Tablets'}
+        ) + '\n')
+
+        self.run_command(path)
+        self.assertEqual(search.search_product_ids('forgotten'), [])
+        self.assertEqual(len(search.search_product_ids('imported')), 1)
+
+        self.run_command(path, '--rebuild-index')
+        self.assertEqual(search.search_product_ids('forgotten'), [stale.pk])
+
+    def test_jsonl_rows_keep_the_last_duplicate(self):
+        rows = [
+            {'id': 500, 'name': 'First', 'brand': 'B', 'description': 'd', 'price': 5, 'stock': 1, 'category': 'Tablets'},
+            {'id': 500, 'name': 'Second', 'brand': 'B', 'description': 'd', 'price': 6.5, 'stock': 1, 'category': 'Tablets'},
+        ]
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row) for row in rows) + '\n\nnot json\n')
+        out, err = self.run_command(path)
+
+        self.assertIn('Imported 1 products, rejected 1 rows.', out)
+        self.assertIn('line 4: Invalid JSON', err)
+        self.assertEqual(Product.objects.get(pk=500).name, 'Second')
+        # New products still get fresh ids after the explicit one
+        self.assertGreater(make_product(1).pk, 500)
+
+    def test_out_of_range_ids_and_failing_rows_reject_only_their_row(self):
+        row = {'brand': 'B', 'description': 'd', 'price': 5, 'stock': 1, 'category': 'Tablets'}
+        rows = [
+            {**row, 'name': 'Kept'},
+            {**row, 'name': 'Huge id', 'id': 99999999999999999999999},
+            {**row, 'name': 'Broken'},
+            {**row, 'name': 'Also kept', 'id': 700},
+        ]
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row) for row in rows) + '\n')
+        index_products = search.index_products
+
+        def failing_index(products):
+            if any(product.name == 'Broken' for product in products):
+                raise DatabaseError('disk I/O error')
+            index_products(products)
+
+        with mock.patch.object(search, 'index_products', failing_index):
+            out, err = self.run_command(path)
+
+        self.assertIn('Imported 2 products, rejected 2 rows.', out)
+        self.assertIn('line 2: id: Ensure this value is less than or equal to', err)
+        self.assertIn("product 'Broken' not written: disk I/O error", err)
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Also kept', 'Kept'])
+        self.assertTrue(Product.objects.filter(pk=700).exists())
+
+
+class OrderExportTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(0, brand='Apple', category='Tablets')
+        now = timezone.now()
+        self.orders = []
+        for days_ago in (10, 5, 1):
+            order = Order.objects.create(
+                user=self.user, shipping_address='a', billing_address='b', payment_method='paypal',
+                total_price=Decimal('20.00'), item_count=1,
+            )
+            item = OrderItem(order=order, product=self.product, quantity=2, color='Blue')
+            item.snapshot_product(self.product)
+            item.save()
+            Order.objects.filter(pk=order.pk).update(placed_at=now - datetime.timedelta(days=days_ago))
+            self.orders.append(order)
+        self.since = (now - datetime.timedelta(days=6)).date().isoformat()
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('export_orders', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_command_exports_order_items_in_the_date_range(self):
+        with CaptureQueriesContext(connection) as ctx:
+            out = self.run_command('--items', f'--since={self.since}', '--chunk-size=1')
+        lines = out.splitlines()
+
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'order_id', 'placed_at', 'user_id'])
+        self.assertEqual([int(line.split(',')[1]) for line in lines[1:]], [self.orders[1].pk, self.orders[2].pk])
+        self.assertIn(',buyer,', lines[1])
+        self.assertIn(',Product 0,Apple,Tablets,Order placed,2,10.00,20.00,Blue,', lines[1])
+        # The user and product come from the same query as the items
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_command_rejects_bad_dates(self):
+        with self.assertRaises(CommandError):
+            self.run_command('--until=yesterday')
+
+    def test_admin_action_streams_jsonl(self):
+        admin_user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/core/order/', {
+            'action': 'export_jsonl', 'select_across': '1', 'index': '0',
+            '_selected_action': [self.orders[0].pk],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.jsonl"')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(order.pk for order in self.orders))
+        self.assertEqual(rows[0]['total_price'], '20.00')
+        self.assertEqual(rows[0]['email'], 'buyer@example.com')
+
+
+class AdminChangeListTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+        self.created = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            index = self.created = self.created + 1
+            user = make_user(f'user{index}', f'user{index}@example.com')
+            product = make_product(index)
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product)
+            order = Order.objects.create(user=user, shipping_address='a', billing_address='b', payment_method='paypal')
+            item = OrderItem(order=order, product=product, quantity=1)
+            item.snapshot_product(product)
+            item.save()
+
+    def test_change_lists_run_a_fixed_number_of_queries(self):
+        urls = ['/admin/core/cartitem/', '/admin/core/order/', '/admin/core/orderitem/', '/admin/core/customuser/']
+        self.add_rows(2)
+        few = {url: self.count_queries('get', url)[1] for url in urls}
+        self.add_rows(5)
+        for url in urls:
+            response, queries = self.count_queries('get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(queries, few[url], url)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_counts_are_bounded(self):
+        self.add_rows(5)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/admin/core/order/')
+        # The unfiltered table is not counted; its size is estimated
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+
+        # Filtered lists are counted exactly, so the pages past the limit
+        # are reachable
+        with mock.patch.object(OrderAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/core/order/', {'status': 'Order placed', 'p': '3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        self.assertIsNone(response.context['cl'].full_result_count)
+
+    def test_searches(self):
+        self.add_rows(2)
+        self.assertEqual(self.client.get('/admin/core/order/', {'q': 'abc'}).status_code, 200)
+        response = self.client.get('/admin/core/customuser/', {'q': 'user1'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get('/admin/core/customuser/', {'q': 'example.com'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class ProductVariantTests(QueryCountMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.phone = make_product(0, category='Flagship Phones')
+        make_variants(self.phone, sizes=['128GB', '256GB'], colors=['Black', 'Blue'])
+        # 256GB Blue sold out
+        self.phone.variants.filter(size='256GB', color='Blue').update(stock=0)
+
+    def test_api_returns_the_storage_and_colors_lists(self):
+        response = self.client.get(f'/api/products/{self.phone.id}/')
+        self.assertEqual(response.data['storage'], [
+            {'size': '128GB', 'in_stock': True}, {'size': '256GB', 'in_stock': True},
+        ])
+        self.assertEqual(response.data['colors'], [
+            {'color': 'Black', 'in_stock': True}, {'color': 'Blue', 'in_stock': True},
+        ])
+        self.assertEqual(self.client.get(f'/api/products/{make_product(1).id}/').data['storage'], [])
+
+    def test_list_loads_the_variants_in_one_query(self):
+        for index in range(1, 4):
+            make_variants(make_product(index), colors=['Gold'])
+        _, few = self.count_queries('get', '/api/products/?page_size=2')
+        caching.invalidate_lists()
+        _, many = self.count_queries('get', '/api/products/?page_size=4')
+        self.assertEqual(few, many)
+
+    def test_writing_a_list_keeps_the_other_one(self):
+        response = self.client.patch(
+            f'/api/products/{self.phone.id}/', {'storage': [{'size': '512GB', 'in_stock': False}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['storage'], [{'size': '512GB', 'in_stock': False}])
+        self.assertEqual([color['color'] for color in response.data['colors']], ['Black', 'Blue'])
+        self.assertEqual(self.phone.variants.count(), 2)
+
+        response = self.client.patch(
+            f'/api/products/{self.phone.id}/', {'colors': [{'color': 'Pink', 'in_stock': True}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_each_option_keeps_its_own_flag(self):
+        storage, colors = [{'size': '128GB', 'in_stock': True}], [{'color': 'White', 'in_stock': False}]
+        response = self.client.patch(
+            f'/api/products/{self.phone.id}/', {'storage': storage, 'colors': colors}, format='json'
+        )
+        self.assertEqual((response.data['storage'], response.data['colors']), (storage, colors))
+        response = self.client.get(f'/api/products/{self.phone.id}/')
+        self.assertEqual((response.data['storage'], response.data['colors']), (storage, colors))
+
+        # Rewriting one list leaves the other one's flags alone
+        storage = [{'size': '128GB', 'in_stock': False}, {'size': '256GB', 'in_stock': True}]
+        response = self.client.patch(f'/api/products/{self.phone.id}/', {'storage': storage}, format='json')
+        self.assertEqual((response.data['storage'], response.data['colors']), (storage, colors))
+        # No variant is offered while its color is out of stock
+        self.assertEqual(self.client.get('/api/products/?size=256GB').data['results'], [])
+
+    def test_filter_by_size_and_color_in_stock(self):
+        other = make_product(1)
+        make_variants(other, sizes=['256GB'], colors=['Blue'])
+        ids = lambda query: [product['id'] for product in self.client.get(f'/api/products/?{query}').data['results']]
+        self.assertEqual(ids('size=256GB&color=Blue'), [other.id])
+        self.assertEqual(ids('size=128GB'), [self.phone.id])
+        self.assertEqual(sorted(ids('color=Blue')), sorted([self.phone.id, other.id]))
+
+    def test_sold_out_product_shows_every_option_out_of_stock(self):
+        Product.objects.filter(pk=self.phone.pk).update(stock=0)
+        response = self.client.get(f'/api/products/{self.phone.id}/')
+        self.assertEqual({option['in_stock'] for option in response.data['storage'] + response.data['colors']}, {False})
+        self.assertEqual(self.client.get('/api/products/?size=128GB').data['results'], [])
+
+        # The stored flags survive a write and come back with the stock
+        response = self.client.patch(
+            f'/api/products/{self.phone.id}/', {'colors': [{'color': 'Black', 'in_stock': True}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        Product.objects.filter(pk=self.phone.pk).update(stock=3)
+        cache.clear()
+        response = self.client.get(f'/api/products/{self.phone.id}/')
+        self.assertEqual(response.data['storage'], [
+            {'size': '128GB', 'in_stock': True}, {'size': '256GB', 'in_stock': True},
+        ])
+        self.assertEqual(response.data['colors'], [{'color': 'Black', 'in_stock': True}])
+
+    def test_placing_the_last_units_takes_the_variants_out_of_stock(self):
+        self.phone.stock = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.save()
+        self.assertEqual(len(self.client.get('/api/products/?size=256GB&color=Black').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/', {
+                'payment_method': 'paypal', 'shipping_address': 'a', 'billing_address': 'b',
+                'items': [{'product': self.phone.id, 'quantity': 1, 'size': '256GB', 'color': 'Black'}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get('/api/products/?size=256GB&color=Black').data['results'], [])
+        storage = self.client.get(f'/api/products/{self.phone.id}/').data['storage']
+        self.assertFalse(any(option['in_stock'] for option in storage))
+
+    def test_variant_changes_refresh_the_product(self):
+        before = Product.objects.get(pk=self.phone.pk).updated_at
+        self.client.get(f'/api/products/{self.phone.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.variants.filter(color='Black').delete()
+        self.assertGreater(Product.objects.get(pk=self.phone.pk).updated_at, before)
+        response = self.client.get(f'/api/products/{self.phone.id}/')
+        self.assertEqual([color['color'] for color in response.data['colors']], ['Blue'])
+
+    def order(self, *items):
+        return self.client.post('/api/orders/', {
+            'payment_method': 'paypal', 'shipping_address': 'a', 'billing_address': 'b', 'items': list(items),
+        }, format='json')
+
+    def test_orders_take_and_cancelling_gives_back_variant_stock(self):
+        self.phone.variants.filter(size='128GB', color='Black').update(stock=3)
+        response = self.order({'product': self.phone.id, 'quantity': 2, 'size': '128GB', 'color': 'Black'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.phone.variants.get(size='128GB', color='Black').stock, 1)
+        self.assertEqual(Product.objects.get(pk=self.phone.pk).stock, 98)
+
+        # More than the variant has left, though the product has plenty
+        response = self.order({'product': self.phone.id, 'quantity': 2, 'size': '128GB', 'color': 'Black'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['unavailable'], [
+            {'product': self.phone.id, 'size': '128GB', 'color': 'Black', 'requested': 2, 'available': 1},
+        ])
+        self.assertEqual(Product.objects.get(pk=self.phone.pk).stock, 98)
+
+        # Nor can a variant whose color is out of stock
+        self.phone.variants.filter(color='Blue').update(color_in_stock=False)
+        response = self.order({'product': self.phone.id, 'quantity': 1, 'size': '128GB', 'color': 'Blue'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['unavailable'][0]['available'], 0)
+
+        self.assertEqual(self.client.post(f"/api/orders/{Order.objects.get().pk}/cancel/").status_code, 200)
+        self.assertEqual(self.phone.variants.get(size='128GB', color='Black').stock, 3)
+        self.assertEqual(Product.objects.get(pk=self.phone.pk).stock, 100)
+
+    def test_a_partial_choice_takes_a_variant_with_stock(self):
+        self.phone.variants.filter(color='Black').update(stock=0)
+        self.phone.variants.filter(size='128GB', color='Blue').update(stock=1)
+        self.phone.variants.filter(size='256GB', color='Blue').update(stock=5)
+        response = self.order(
+            {'product': self.phone.id, 'quantity': 1, 'color': 'Blue'},
+            {'product': self.phone.id, 'quantity': 1, 'color': 'Blue'},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(item['size'], item['color']) for item in response.data['items']], [
+            ('128GB', 'Blue'), ('256GB', 'Blue'),
+        ])
+        self.assertEqual(sorted(self.phone.variants.filter(color='Blue').values_list('stock', flat=True)), [0, 4])
+
+    def test_price_deltas_apply_to_the_cart_and_the_order(self):
+        self.phone.variants.filter(size='256GB').update(price_delta=Decimal('100.00'))
+        self.client.post('/api/cart-item/', {'productId': self.phone.id, 'size': '256GB', 'color': 'Black'}, format='json')
+        response = self.client.post(
+            '/api/cart-item/?response=delta', {'productId': self.phone.id, 'size': '128GB', 'color': 'Black'}, format='json'
+        )
+        self.assertEqual(response.data['item']['total_price'], Decimal('10.00'))
+        self.assertEqual(response.data['cart']['total_price'], Decimal('120.00'))
+
+        cart = self.client.get('/api/cart/me/').data
+        self.assertEqual(cart['total_price'], Decimal('120.00'))
+        self.assertEqual(sorted(item['total_price'] for item in cart['items']), [Decimal('10.00'), Decimal('110.00')])
+
+        response = self.order({'product': self.phone.id, 'quantity': 2, 'size': '256GB', 'color': 'Black'})
+        self.assertEqual(response.data['items'][0]['unit_price'], '110.00')
+        self.assertEqual(Order.objects.get().total_price, Decimal('220.00'))
+
+    def test_admin_inline_saves_variants_in_bulk(self):
+        admin_user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.force_login(admin_user)
+        current = list(self.phone.variants.all())
+        data = {
+            'name': self.phone.name, 'brand': self.phone.brand, 'description': self.phone.description,
+            'price': self.phone.price, 'stock': self.phone.stock, 'category': self.phone.category,
+            'variants-TOTAL_FORMS': len(current) + 1, 'variants-INITIAL_FORMS': len(current),
+            'variants-MIN_NUM_FORMS': 0, 'variants-MAX_NUM_FORMS': 1000,
+        }
+        for index, variant in enumerate(current):
+            data.update({
+                f'variants-{index}-id': variant.pk, f'variants-{index}-product': self.phone.pk,
+                f'variants-{index}-size': variant.size, f'variants-{index}-color': variant.color,
+                f'variants-{index}-size_in_stock': 'on', f'variants-{index}-color_in_stock': 'on',
+                f'variants-{index}-stock': variant.stock,
+                f'variants-{index}-price_delta': variant.price_delta,
+            })
+        data['variants-0-DELETE'] = 'on'
+        # Restock 256GB Blue
+        data['variants-3-stock'] = 10
+        new = len(current)
+        data.update({
+            f'variants-{new}-product': self.phone.pk, f'variants-{new}-size': '1TB',
+            f'variants-{new}-color': 'Gold', f'variants-{new}-stock': 7, f'variants-{new}-price_delta': '50.00',
+        })
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f'/admin/core/product/{self.phone.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(self.phone.variants.values_list('size', 'color', 'size_in_stock', 'color_in_stock', 'stock')),
+            [
+                ('128GB', 'Blue', True, True, 100), ('1TB', 'Gold', False, False, 7),
+                ('256GB', 'Black', True, True, 100), ('256GB', 'Blue', True, True, 10),
+            ],
+        )
+        self.assertEqual(self.phone.variants.get(size='1TB').price_delta, Decimal('50.00'))
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_productvariant"')]), 1)
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_productvariant"')]), 1)
+
+
+class ProductVariantMigrationTests(TransactionTestCase):
+    migrate_from = [('core', '0015_admin_list_filter_indexes')]
+    migrate_to = [('core', '0016_product_variants')]
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_json_lists_become_variants_and_back(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldProduct = old_apps.get_model('core', 'Product')
+        phone = OldProduct.objects.create(
+            name='Phone', brand='Acme', description='d', price=1, stock=5, category='Tablets',
+            storage=[{'size': '128GB', 'in_stock': True}, {'size': '256GB', 'in_stock': False}],
+            colors=[{'color': 'Black', 'in_stock': True}],
+        )
+        case = OldProduct.objects.create(
+            name='Case', brand='Acme', description='d', price=1, stock=5, category='Phone Cases',
+            storage=[], colors=[{'color': 'Blue', 'in_stock': True}],
+        )
+        white = OldProduct.objects.create(
+            name='White', brand='Acme', description='d', price=1, stock=5, category='Tablets',
+            storage=[{'size': '128GB', 'in_stock': True}], colors=[{'color': 'White', 'in_stock': False}],
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        NewVariant = executor.loader.project_state(self.migrate_to).apps.get_model('core', 'ProductVariant')
+        self.assertEqual(
+            list(NewVariant.objects.filter(product_id=phone.pk).values_list(
+                'size', 'color', 'size_in_stock', 'color_in_stock', 'stock'
+            )),
+            [('128GB', 'Black', True, True, 5), ('256GB', 'Black', False, True, 5)],
+        )
+        self.assertEqual(list(NewVariant.objects.filter(product_id=case.pk).values_list('size', 'color')), [('', 'Blue')])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        OldProduct = executor.loader.project_state(self.migrate_from).apps.get_model('core', 'Product')
+        self.assertEqual(OldProduct.objects.get(pk=phone.pk).storage, [
+            {'size': '128GB', 'in_stock': True}, {'size': '256GB', 'in_stock': False},
+        ])
+        self.assertEqual(OldProduct.objects.get(pk=case.pk).colors, [{'color': 'Blue', 'in_stock': True}])
+        self.assertEqual(OldProduct.objects.get(pk=white.pk).storage, [{'size': '128GB', 'in_stock': True}])
+        self.assertEqual(OldProduct.objects.get(pk=white.pk).colors, [{'color': 'White', 'in_stock': False}])
+
+    def test_malformed_lists_are_skipped(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        OldProduct = executor.loader.project_state(self.migrate_from).apps.get_model('core', 'Product')
+        values = {'brand': 'Acme', 'description': 'd', 'price': 1, 'stock': 5, 'category': 'Tablets'}
+        odd = OldProduct.objects.create(
+            name='Odd', **values,
+            storage=['128GB', {'in_stock': True}, {'size': '256GB'}, {'size': '512GB', 'in_stock': True}, None],
+            colors={'color': 'Black'},
+        )
+        text = OldProduct.objects.create(
+            name='Text', **values, storage='[{"size": "64GB", "in_stock": true}]', colors='not json',
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        NewVariant = executor.loader.project_state(self.migrate_to).apps.get_model('core', 'ProductVariant')
+        self.assertEqual(
+            list(NewVariant.objects.filter(product_id=odd.pk).values_list('size', 'color', 'size_in_stock')),
+            [('256GB', '', False), ('512GB', '', True)],
+        )
+        self.assertEqual(
+            list(NewVariant.objects.filter(product_id=text.pk).values_list('size', 'color', 'size_in_stock')),
+            [('64GB', '', True)],
+        )
@@ -0,0 +1,179 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Product, ProductVariant
+
+
+# Product variants and the storage/colors lists of the API.
+#
+# A product's options used to be two JSON lists:
+#     storage: [{"size": "128GB", "in_stock": true}, ...]
+#     colors:  [{"color": "Blue", "in_stock": false}, ...]
+# They are now ProductVariant rows, one per size and color combination
+# (or per size, or per color, when the product has only one kind of
+# option). The lists are still what the API reads and writes: they are
+# derived from the variants, and writing them updates the variants.
+#
+# A variant stores the in_stock flags of its size and of its color, set
+# through the lists, and its own stock and price delta, set in the admin.
+# It is offered when both flags are set. Orders take a variant's stock
+# together with Product.stock (see core.inventory). The API shows an option
+# in stock when its flag is set, a variant with it has stock left and the
+# product is in stock, while writes compare against the stored flags, so a
+# sold-out variant keeps its options for when it is restocked.
+
+# List name -> (ProductVariant field, its in_stock flag field, key of the
+# list entries)
+OPTIONS = {
+    'storage': ('size', 'size_in_stock', 'size'),
+    'colors': ('color', 'color_in_stock', 'color'),
+}
+
+
+# The option list of the variants, in the order the options were added,
+# with their stored in_stock flags. Pass product_in_stock to get the
+# availability the API shows: a variant with the option must also have
+# stock left, and every option of a product out of stock is out of stock.
+def options(variants, name, product_in_stock=None):
+    field, flag, key = OPTIONS[name]
+    in_stock = {}
+    for variant in variants:
+        value = getattr(variant, field)
+        if value:
+            available = getattr(variant, flag)
+            if product_in_stock is not None:
+                available = available and variant.stock > 0 and product_in_stock
+            in_stock[value] = in_stock.get(value, False) or available
+    return [{key: value, 'in_stock': available} for value, available in in_stock.items()]
+
+
+# (size, color, size_in_stock, color_in_stock) of every variant described
+# by the two lists
+def combinations(storage, colors):
+    sizes = [(item['size'], item['in_stock']) for item in storage or []] or [('', True)]
+    color_options = [(item['color'], item['in_stock']) for item in colors or []] or [('', True)]
+    return [
+        (size, color, size_in_stock, color_in_stock)
+        for size, size_in_stock in sizes
+        for color, color_in_stock in color_options
+        if size or color
+    ]
+
+
+# Set the variants of products from their lists. options_by_product maps a
+# saved Product to its (storage, colors). Existing variants keep their id,
+# stock and price delta; new ones start with the product's stock. One read
+# and at most three writes for any number of products.
+def replace(options_by_product):
+    if not options_by_product:
+        return
+    products = {product.pk: product for product in options_by_product}
+    existing = {}
+    for variant in ProductVariant.objects.filter(product_id__in=products):
+        existing[(variant.product_id, variant.size, variant.color)] = variant
+
+    keep, created, changed = set(), [], []
+    for product, (storage, colors) in options_by_product.items():
+        # A repeated option counts once, with its last stock flag
+        wanted = {(size, color): flags for size, color, *flags in combinations(storage, colors)}
+        for (size, color), (size_in_stock, color_in_stock) in wanted.items():
+            key = (product.pk, size, color)
+            keep.add(key)
+            variant = existing.get(key)
+            if variant is None:
+                created.append(ProductVariant(
+                    product=product, size=size, color=color, size_in_stock=size_in_stock,
+                    color_in_stock=color_in_stock, stock=product.stock,
+                ))
+            elif (variant.size_in_stock, variant.color_in_stock) != (size_in_stock, color_in_stock):
+                variant.size_in_stock, variant.color_in_stock = size_in_stock, color_in_stock
+                changed.append(variant)
+
+    removed = [variant.pk for key, variant in existing.items() if key not in keep]
+    with transaction.atomic():
+        if removed:
+            ProductVariant.objects.filter(pk__in=removed).delete()
+        if changed:
+            ProductVariant.objects.bulk_update(changed, ['size_in_stock', 'color_in_stock'])
+        if created:
+            ProductVariant.objects.bulk_create(created)
+
+
+# Bulk variant writes skip the model signals: mark the products as changed
+# for conditional requests and drop them from the product cache once the
+# change is committed
+def touch_products(product_ids, using=None):
+    product_ids = list(product_ids)
+    Product.objects.using(using).filter(pk__in=product_ids).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: caching.invalidate_products(product_ids), using=using)
+
+
+# Product id -> the (size, color) of its variants, for the products that
+# exist; one query
+def variants_by_product(product_ids):
+    variants = {}
+    for product_id, size, color in Product.objects.filter(pk__in=product_ids).values_list(
+        'pk', 'variants__size', 'variants__color'
+    ):
+        combos = variants.setdefault(product_id, set())
+        # A product without variants comes back once, with NULLs
+        if size is not None:
+            combos.add((size, color))
+    return variants
+
+
+# Whether a size and color chosen for a cart or an order item name a
+# variant of the product. Either may be left out; a product without
+# variants takes neither.
+def is_known_variant(combos, size, color):
+    size, color = size or '', color or ''
+    if size and color:
+        return (size, color) in combos
+    if size:
+        return any(size == known for known, _ in combos)
+    if color:
+        return any(color == known for _, known in combos)
+    return True
+
+
+# The variant an order line takes, among the variants of its product. A
+# line that names both options takes that variant; one that names a single
+# option or none takes the first offered variant matching it with enough
+# stock left after the lines before it (taken counts the units of each
+# variant already chosen), or the first matching one when none has.
+# None for a product without variants.
+def choose_variant(product_variants, size, color, quantity, taken):
+    size, color = size or '', color or ''
+    matching = [
+        variant for variant in product_variants
+        if (not size or variant.size == size) and (not color or variant.color == color)
+    ]
+    if not matching:
+        return None
+    exact = [variant for variant in matching if (variant.size, variant.color) == (size, color)]
+    if exact:
+        return exact[0]
+    for variant in matching:
+        if variant.offered and variant.stock - taken[variant.pk] >= quantity:
+            return variant
+    return matching[0]
+
+
+# Variant id -> quantity for order lines given as (product_id, size, color,
+# quantity), each line counted for the variant with its size and color;
+# lines of products without that variant are left out. One query.
+def quantities_by_variant(lines):
+    lines = list(lines)
+    ids = {
+        (variant.product_id, variant.size, variant.color): variant.pk
+        for variant in ProductVariant.objects.filter(product_id__in={line[0] for line in lines})
+    }
+    quantities = Counter()
+    for product_id, size, color, quantity in lines:
+        variant_id = ids.get((product_id, size or '', color or ''))
+        if variant_id is not None:
+            quantities[variant_id] += quantity
+    return quantities
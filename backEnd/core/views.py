@@ -1,8 +1,17 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Max
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.response import Response
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 
+from . import caching, cart_operations, db_routers, images, inventory, search, variants
+from .conditional import conditional, make_validators
+from .filters import OrderFilterBackend, ProductFilterBackend, ProductOrderingFilter
+from .pagination import OrderCursorPagination, ProductCursorPagination
 from .serializers import (
     CustomTokenObtainPairSerializer, UserProfileSerializer, UserSerializer, ProductSerializer, CartSerializer, CartItemSerializer,
     OrderSerializer, OrderItemSerializer
@@ -13,10 +22,28 @@ from .models import (
     )
 
 
+# A product id from a request body, cleaned by the primary key field, which
+# also checks that it fits the column
+def clean_product_id(value):
+    if value is None:
+        raise ValidationError('A product id is required.')
+    return Product._meta.pk.clean(value, None)
+
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+
+
+# Read from the primary database even for safe requests: the user expects
+# to see their own writes from the previous request, which a replica may
+# not have yet (see core.db_routers)
+class PrimaryReadsMixin:
+    def initial(self, request, *args, **kwargs):
+        db_routers.pin_primary()
+        super().initial(request, *args, **kwargs)
+
     
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(PrimaryReadsMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -46,38 +73,134 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     
     
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    # The variants give the storage and colors of every product of a page
+    queryset = Product.objects.prefetch_related('variants')
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilterBackend, ProductOrderingFilter]
+    ordering_fields = ['price', 'created_at', 'name']
+    ordering = ['-created_at', '-id']
+
+    # List and detail payloads are served through the product cache,
+    # invalidated by the Product signal handlers in core.signals
+    # Both also answer conditional requests (ETag / Last-Modified) from a
+    # single aggregate query before touching the payload
+    # The list validators come from the catalog version, which every product
+    # change bumps, so cache hits and 304s do not touch the database
+    def list(self, request, *args, **kwargs):
+        version = caching.catalog_version()
+        url = caching.list_url(request)
+        etag, last_modified = make_validators(None, version, url)
+
+        def build_response():
+            key = caching.list_key(url, version)
+            data = caching.get_or_set(key, lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data)
+            return Response(data)
+
+        return conditional(request, etag, last_modified, build_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not lookup.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        row = Product.objects.filter(pk=lookup).values_list('updated_at', 'image').first()
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        last_updated, image = row
+        # The image variants are generated after the save, without changing
+        # updated_at, so whether they exist is part of the ETag. No
+        # Last-Modified is sent while they are pending, so clients cannot
+        # revalidate the payload without them by date
+        storage = Product._meta.get_field('image').storage
+        variants_ready = bool(image) and images.variants_ready(image, storage)
+        etag, last_modified = make_validators(last_updated, lookup, variants_ready)
+        if image and not variants_ready:
+            last_modified = None
+
+        def build_response():
+            origin = f"{request.scheme}://{request.get_host()}"
+            data = caching.get_or_set_detail(
+                int(lookup), origin, lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data
+            )
+            return Response(data)
+
+        return conditional(request, etag, last_modified, build_response)
+
+    # Hit/miss counters of the product cache
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        return Response(caching.get_stats())
+
+    # Ranked full-text search over name, brand, description and category
+    @action(detail=False, methods=['get'], url_path='search')
+    def search_catalog(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "The q parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = self.paginator.get_page_size(request)
+        products = search.search_products(query, limit=limit)
+        serializer = self.get_serializer(products, many=True)
+        return Response({"results": serializer.data})
     
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(PrimaryReadsMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        # Get the cart for the authenticated user
-        cart = Cart.objects.filter(user=self.request.user).first()
-
-        if not cart:
-            return Cart.objects.none()
-        
-        return [cart]  # Return the cart object in a list
+        # Only the cart of the authenticated user, with its items and products
+        # loaded up front
+        return Cart.objects.filter(user=self.request.user).with_totals().with_items()
     
     # This action will be called when the user wants to get their cart
+    # It answers conditional requests from one aggregate query: the cart is
+    # touched by every item change, and product updates change the totals
     @action(detail=False, methods=['get'], url_path='me')
     def get_my_cart(self, request):
-        # Get the cart for the authenticated user
-        cart = Cart.objects.filter(user=request.user).first()
-
-        if not cart:
+        stats = Cart.objects.filter(user=request.user).aggregate(
+            cart_updated=Max('updated_at'),
+            products_updated=Max('items__product__updated_at'),
+            count=Count('items'),
+        )
+        if stats['cart_updated'] is None:
             return Response({"detail": "No cart found for this user"}, status=404)
 
-        # Serialize the cart using the CartSerializer
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        last_updated = max(filter(None, [stats['cart_updated'], stats['products_updated']]))
+        etag, last_modified = make_validators(last_updated, stats['cart_updated'], stats['count'])
+
+        def build_response():
+            # Get the cart for the authenticated user
+            cart = self.get_queryset().first()
+            if not cart:
+                return Response({"detail": "No cart found for this user"}, status=404)
+
+            # Serialize the cart using the CartSerializer
+            serializer = CartSerializer(cart)
+            return Response(serializer.data)
+
+        return conditional(request, etag, last_modified, build_response)
 
     
+    # Apply a list of add/increment/decrement/remove/set_quantity operations
+    # in one transaction and return the resulting cart
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        operations = request.data.get("operations") if isinstance(request.data, dict) else None
+        operations = cart_operations.validate_operations(operations)
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+
+        try:
+            with transaction.atomic():
+                cart_operations.apply_operations(cart, operations)
+        except cart_operations.CartOperationError as error:
+            return Response(error.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = self.get_queryset().first()
+        return Response(CartSerializer(cart).data)
+
     # This action will be called when the user wants to clear their cart
     # It will delete all items in the cart and return a success message
     @action(detail=False, methods=['post'], url_path='clear')
@@ -90,64 +213,95 @@ class CartViewSet(viewsets.ModelViewSet):
         return Response({"detail": "Cart cleared."})
 
     
-class CartItemViewSet(viewsets.ModelViewSet):
-    queryset = CartItem.objects.all()
+class CartItemViewSet(PrimaryReadsMixin, viewsets.ModelViewSet):
+    queryset = CartItem.objects.select_related('product').with_unit_price()
     serializer_class = CartItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    # Only the items of the authenticated user's cart
+    def get_queryset(self):
+        return super().get_queryset().filter(cart__user=self.request.user)
+
+    # Quantities are changed with single UPDATE/DELETE statements evaluated
+    # by the database, so concurrent taps never overwrite each other
     def partial_update(self, request, *args, **kwargs):
         cart_item = self.get_object()
         action_type = request.data.get("action")
+        item = CartItem.objects.filter(pk=cart_item.pk)
 
         if action_type == "increment":
-            cart_item.quantity += 1
-            cart_item.save()
+            item.update(quantity=F('quantity') + 1)
         elif action_type == "decrement":
-            cart_item.quantity -= 1
-            if cart_item.quantity <= 0:
-                cart_item.delete()
-                return self._return_full_cart()
-            cart_item.save()
+            # Decrement above one, otherwise the item goes away. The delete
+            # is conditional too: an item incremented in between is
+            # decremented instead.
+            if not item.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+                deleted, _ = item.filter(quantity__lte=1).delete()
+                if deleted:
+                    return self._return_cart(cart_item.cart_id, cart_item.pk)
+                item.filter(quantity__gt=1).update(quantity=F('quantity') - 1)
         elif action_type == "remove":
-            cart_item.delete()
-            return self._return_full_cart()
+            item.delete()
+            return self._return_cart(cart_item.cart_id, cart_item.pk)
         else:
             return Response({"detail": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return self._return_full_cart()
+        Cart.objects.filter(pk=cart_item.cart_id).touch()
+        return self._return_cart(cart_item.cart_id, cart_item.pk)
 
     def create(self, request, *args, **kwargs):
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        product_id = request.data.get('productId')
-
-        # Check if the product exists
-        existing_item = CartItem.objects.filter(cart=cart, product_id=product_id).first()
+        try:
+            product_id = clean_product_id(request.data.get('productId'))
+        except ValidationError:
+            return Response({"detail": "productId must be a number."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Increment quantity if item exists
-        if existing_item:
-            existing_item.quantity += 1
-            existing_item.save()
-        else:
-            # Create new cart item if it doesn't exist
-            CartItem.objects.create(
-                cart=cart,
-                product_id=product_id,
-                quantity=1,
-                color=request.data.get('color'),
-                size=request.data.get('size')
+        # Check if the product exists, and has the chosen size and color
+        known = variants.variants_by_product([product_id])
+        if product_id not in known:
+            return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        if not variants.is_known_variant(known[product_id], request.data.get('size'), request.data.get('color')):
+            return Response(
+                {"detail": "The product has no such size and color."}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Insert the item or increment the existing one of the same variant
+        item_id, _ = CartItem.objects.add_item(
+            cart.pk,
+            product_id,
+            color=request.data.get('color'),
+            size=request.data.get('size'),
+        )
+        Cart.objects.filter(pk=cart.pk).touch()
+
+        return self._return_cart(cart.pk, item_id)
+
+    # Mutations answer with the full cart, or with ?response=delta only with
+    # the changed item and the new cart totals
+    def _return_cart(self, cart_id, item_id):
+        if self.request.query_params.get("response") == "delta":
+            return self._return_delta(cart_id, item_id)
         return self._return_full_cart()
 
     # This method returns the full cart details after any operation
     def _return_full_cart(self):
-        cart = Cart.objects.filter(user=self.request.user).first()
+        cart = Cart.objects.filter(user=self.request.user).with_totals().with_items().first()
         if not cart:
             return Response({"items": [], "totalQuantity": 0}, status=status.HTTP_200_OK)
 
         serializer = CartSerializer(cart)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    # This method returns the changed item (None once removed) and the cart
+    # totals, with a fixed number of queries whatever the size of the cart
+    def _return_delta(self, cart_id, item_id):
+        item = CartItem.objects.select_related('product').with_unit_price().filter(pk=item_id).first()
+        return Response({
+            "item": CartItemSerializer(item).data if item else None,
+            "removed_item_id": None if item else item_id,
+            "cart": {"id": cart_id, **CartItem.objects.filter(cart_id=cart_id).summary()},
+        }, status=status.HTTP_200_OK)
+
 
     def perform_destroy(self, instance):
         # Delete the cart item
@@ -157,63 +311,172 @@ class CartItemViewSet(viewsets.ModelViewSet):
 
     
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_items()
     serializer_class = OrderSerializer
     
+    # Order history of the authenticated user, one cursor page at a time,
+    # filtered with ?status=, ?since= and ?until= (see core.filters)
     @action(detail=False, methods=['get'], url_path='me')
     def get_my_orders(self, request):
-        # Get all orders for the authenticated user
-        orders = Order.objects.filter(user=request.user)
-        if not orders:
-            return Response({"detail": "No orders found for this user"}, status=404)
+        orders = OrderFilterBackend().filter_queryset(
+            request, Order.objects.filter(user=request.user).with_items(), self
+        )
 
-        # Serialize the orders using the OrderSerializer
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        # The items of the page are prefetched in one query
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
   
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
-        print("data", data)
         items = data.pop("items", [])
         card_data = data.pop("card", None)
         payment_method = data.get("payment_method")
 
-        # Create card if card data exists
-        card = None
-        if payment_method == "card" and card_data:
-            card = CardDetails.objects.create(
-                card_number=card_data.get("cardNumber"),
-                expiry=card_data.get("expiry"),
-                cvv=card_data.get("cvv")
+        # Validate the line items before writing anything. The model fields
+        # also check that ids and quantities fit their columns
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "An order needs at least one item."}, status=status.HTTP_400_BAD_REQUEST)
+        quantity_field = OrderItem._meta.get_field('quantity')
+        try:
+            lines = [
+                (
+                    clean_product_id(item["product"]),
+                    quantity_field.clean(item["quantity"], None),
+                    item.get("color"),
+                    item.get("size"),
+                )
+                for item in items
+            ]
+            quantities = inventory.quantities_by_product((product_id, quantity) for product_id, quantity, _, _ in lines)
+            for quantity in quantities.values():
+                quantity_field.clean(quantity, None)
+        except (KeyError, TypeError, ValidationError):
+            return Response(
+                {"detail": "Each item needs a valid product and quantity."},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        if any(quantity < 1 for _, quantity, _, _ in lines):
+            return Response({"detail": "Quantities must be at least 1."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            shipping_address=data.get("shipping_address"),
-            billing_address=data.get("billing_address"),
-            payment_method=payment_method,
-            card=card,
-        )
+        # Place the order in one transaction: it is written completely or not at all
+        with transaction.atomic():
+            # Fetch every product of the order, with its variants, in two queries
+            products = Product.objects.prefetch_related('variants').in_bulk({product_id for product_id, _, _, _ in lines})
+            missing = sorted({product_id for product_id, _, _, _ in lines if product_id not in products})
+            if missing:
+                return Response(
+                    {"detail": "Some products do not exist.", "missing_product_ids": missing},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            unknown = sorted({
+                product_id for product_id, _, color, size in lines
+                if not variants.is_known_variant(
+                    {(variant.size, variant.color) for variant in products[product_id].variants.all()}, size, color
+                )
+            })
+            if unknown:
+                return Response(
+                    {"detail": "Some items name a size or color the product does not have.", "unknown_variant_product_ids": unknown},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # The variant each line takes, and the units taken of each
+            taken = Counter()
+            chosen = []
+            for product_id, quantity, color, size in lines:
+                variant = variants.choose_variant(products[product_id].variants.all(), size, color, quantity, taken)
+                if variant is not None:
+                    taken[variant.pk] += quantity
+                chosen.append(variant)
+
+            # Reserve stock of the products and their variants; any
+            # shortage rolls the whole order back
+            unavailable = inventory.reserve_stock(quantities) or inventory.reserve_variant_stock(taken)
+            if unavailable:
+                transaction.set_rollback(True)
+                return Response(
+                    {"detail": "Some items are out of stock.", "unavailable": unavailable},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            # Create card if card data exists
+            card = None
+            if payment_method == "card" and card_data:
+                card = CardDetails.objects.create(
+                    card_number=card_data.get("cardNumber"),
+                    expiry=card_data.get("expiry"),
+                    cvv=card_data.get("cvv")
+                )
 
-        # Create order items
-        for item in items:
-            product_id = item.get("product")
-            print("product id", product_id)
-            product = Product.objects.get(id=product_id)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item["quantity"],
-                color=item.get("color"),
-                size=item.get("size")
+            # Build the order items with a snapshot of their product and the
+            # options of their variant
+            order_items = []
+            for (product_id, quantity, color, size), variant in zip(lines, chosen):
+                if variant is not None:
+                    color, size = variant.color or None, variant.size or None
+                order_item = OrderItem(product=products[product_id], quantity=quantity, color=color, size=size)
+                order_item.snapshot_product(products[product_id], variant)
+                order_items.append(order_item)
+
+            # Create order with its totals denormalized from the items
+            order = Order.objects.create(
+                user=request.user,
+                shipping_address=data.get("shipping_address"),
+                billing_address=data.get("billing_address"),
+                payment_method=payment_method,
+                card=card,
+                total_price=sum(order_item.get_total_price() for order_item in order_items),
+                item_count=len(order_items),
+                stock_reserved=True,
             )
 
+            # Create order items
+            for order_item in order_items:
+                order_item.order = order
+            OrderItem.objects.bulk_create(order_items)
+
+        # Reload the order with its items so the response is serialized
+        # without a query per item
+        order = Order.objects.with_items().get(pk=order.pk)
         serializer = self.get_serializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)  
     
     
 
+    # Cancel a placed order of the authenticated user and put its items back
+    # in stock if placing it took them
+    @action(detail=True, methods=['post'], url_path='cancel')
+    def cancel(self, request, pk=None):
+        order = Order.objects.filter(pk=pk, user=request.user).first()
+        if not order:
+            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            # Only the request that actually flips the status releases the
+            # stock, and only orders that reserved it release any
+            cancelled = Order.objects.filter(pk=order.pk, status=Order.STATUS_PLACED).update(
+                status=Order.STATUS_CANCELLED, stock_reserved=False
+            )
+            if not cancelled:
+                return Response(
+                    {"detail": "Only placed orders can be cancelled."}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            order.items.update(status=Order.STATUS_CANCELLED)
+            if order.stock_reserved:
+                lines = list(order.items.values_list('product_id', 'size', 'color', 'quantity'))
+                inventory.release_stock(
+                    inventory.quantities_by_product((product_id, quantity) for product_id, _, _, quantity in lines)
+                )
+                inventory.release_variant_stock(variants.quantities_by_variant(lines))
+
+        order = Order.objects.with_items().get(pk=order.pk)
+        serializer = self.get_serializer(order)
+        return Response(serializer.data)
+
+
 class OrderItemViewSet(viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
\ No newline at end of file
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaReadsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,6 +95,52 @@ DATABASES = {
     }
 }
 
+# Read replicas, as a comma-separated list of SQLite files in
+# DATABASE_REPLICAS. They must be kept in sync with the primary; locally a
+# copy of db.sqlite3 will do:
+#   cp db.sqlite3 replica.sqlite3
+#   DATABASE_REPLICAS=replica.sqlite3 python manage.py runserver
+# Safe requests read from them, see core.db_routers.
+replica_files = [name.strip() for name in os.getenv("DATABASE_REPLICAS", "").split(",") if name.strip()]
+REPLICA_DATABASES = []
+for index, name in enumerate(replica_files, start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name,
+        # Tests read the replicas through the test database
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['core.db_routers.PrimaryReplicaRouter']
+
+# Opt-in SQLite production profile for concurrent writers, enabled with
+# SQLITE_PROFILE=production:
+#   - the pragmas below on every connection (see core.sqlite);
+#   - on the primary, write transactions start with BEGIN IMMEDIATE, so they
+#     queue on the busy timeout instead of failing to upgrade a read lock;
+#   - persistent connections to the primary, reused for CONN_MAX_AGE
+#     seconds.
+# The replicas are only read: an immediate transaction there would take
+# the write lock of the replica file for nothing.
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+    'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative sizes are in KiB
+    'cache_size': -int(os.getenv("SQLITE_CACHE_KB", "65536")),
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+SQLITE_PRAGMAS = {}
+if SQLITE_PROFILE == "production":
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    primary = DATABASES['default']
+    primary.setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+    primary['CONN_MAX_AGE'] = int(os.getenv("CONN_MAX_AGE", "600"))
+    primary['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -154,18 +201,74 @@ AUTH_USER_MODEL = 'core.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with the user lookup cached; swap back to
+        # 'rest_framework_simplejwt.authentication.JWTAuthentication' to
+        # load the user on every request
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON when installed, the stock implementation otherwise
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
+# Cache
+# Local memory by default; set REDIS_URL to share the cache between workers
+# (requires the redis package)
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a serialized product payload stays in the cache
+PRODUCT_CACHE_TIMEOUT = int(os.getenv("PRODUCT_CACHE_TIMEOUT", "300"))
+
+# Page sizes for the cursor-paginated product catalog
+PRODUCT_PAGE_SIZE = int(os.getenv("PRODUCT_PAGE_SIZE", "24"))
+PRODUCT_MAX_PAGE_SIZE = int(os.getenv("PRODUCT_MAX_PAGE_SIZE", "100"))
+
+# Page sizes for the cursor-paginated order history
+ORDER_PAGE_SIZE = int(os.getenv("ORDER_PAGE_SIZE", "10"))
+ORDER_MAX_PAGE_SIZE = int(os.getenv("ORDER_MAX_PAGE_SIZE", "50"))
+
+# Unfiltered admin change lists of tables larger than this show the
+# database's row estimate instead of a COUNT(*); filtered lists are always
+# counted exactly (see core.admin)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", "10000"))
+
+# Media the app serves itself (see core.media) is handed to the front web
+# server instead of being streamed by Python: set MEDIA_OFFLOAD to
+# "x-accel-redirect" for nginx, with MEDIA_ACCEL_REDIRECT_PREFIX an internal
+# location aliased to MEDIA_ROOT, or to "x-sendfile" for Apache/lighttpd.
+# Product images have content-hashed names (see core.storage), so the web
+# server may serve them with "Cache-Control: public, max-age=31536000,
+# immutable".
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+
+# Seconds an authenticated user stays cached by CachedJWTAuthentication
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "60"))
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),  
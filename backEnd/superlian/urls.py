@@ -14,7 +14,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from core.media import serve_media
 from core.views import CustomTokenObtainPairView
 from django.conf import settings
 from django.conf.urls.static import static
@@ -27,6 +28,11 @@ urlpatterns = [
     path('auth/', include('djoser.urls.jwt')),
 ]
 
+# With MEDIA_OFFLOAD the web server sends the media files for the app
+if settings.MEDIA_OFFLOAD:
+    urlpatterns += [re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$', serve_media)]
+
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    if not settings.MEDIA_OFFLOAD:
+        urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
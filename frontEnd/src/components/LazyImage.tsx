@@ -3,6 +3,9 @@ import { useState, useEffect, useRef } from "react";
 interface LazyImageProps {
   src: string;
   alt: string;
+  // Resized variants; when they fail to load the image falls back to src
+  srcSet?: string;
+  sizes?: string;
   className?: string;
   placeholderSrc?: string;
 }
@@ -20,11 +23,14 @@ interface LazyImageProps {
 const LazyImage: React.FC<LazyImageProps> = ({
   src,
   alt,
+  srcSet,
+  sizes,
   className = "",
   placeholderSrc = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 400 300'%3E%3Crect fill='%23f3f4f6' width='400' height='300'/%3E%3C/svg%3E",
 }) => {
   const [isLoaded, setIsLoaded] = useState(false);
   const [isInView, setIsInView] = useState(false);
+  const [useSrcSet, setUseSrcSet] = useState(true);
   const imgRef = useRef<HTMLImageElement>(null);
 
   useEffect(() => {
@@ -68,11 +74,14 @@ const LazyImage: React.FC<LazyImageProps> = ({
     <img
       ref={imgRef}
       src={isInView ? src : placeholderSrc}
+      srcSet={isInView && useSrcSet ? srcSet : undefined}
+      sizes={srcSet ? sizes : undefined}
       alt={alt}
       className={`transition-opacity duration-300 ${
         isLoaded ? "opacity-100" : "opacity-0"
       } ${className}`}
       onLoad={handleImageLoad}
+      onError={() => setUseSrcSet(false)}
       loading="lazy"
     />
   );
@@ -1,6 +1,6 @@
-import { useEffect } from "react";
+import { useEffect, useMemo } from "react";
 import { useAppDispatch } from "@/utils/hooks";
-import { setProducts } from "@/store/slices/productSlice";
+import { setProductsPage } from "@/store/slices/productSlice";
 import { setUserProfile } from "@/store/slices/authSlice";
 import { useGetCurrrentUserProfileQuery } from "../../services/userApi";
 import { useGetProductsQuery } from "../../services/productApi";
@@ -9,16 +9,19 @@ import { Product } from "@/utils/types";
 import ProductGridSkeleton from "@/components/skeletons/ProductGridSkeleton";
 
 const HomePage = () => {
-  const { data: products = [], error, isLoading } = useGetProductsQuery({});
+  const { data, error, isLoading } = useGetProductsQuery({});
+  const products = useMemo(() => data?.results ?? [], [data]);
   const { data: userProfile } = useGetCurrrentUserProfileQuery({});
   const dispatch = useAppDispatch();
 
   useEffect(() => {
-    // console.log("products", products);
-    // Set products, categories, and user profile in the Redux store
-    dispatch(setProducts(products));
+    // Set the first catalog page, its next cursor and the user profile in
+    // the Redux store; the catalog page loads the following pages
+    if (data) {
+      dispatch(setProductsPage({ results: data.results, next: data.next }));
+    }
     dispatch(setUserProfile(userProfile));
-  }, [products, userProfile, dispatch]);
+  }, [data, userProfile, dispatch]);
 
   if (isLoading) {
     return (
@@ -42,9 +42,13 @@ const OrderSummary = () => {
                   item.product_image?.trim() ||
                   "https://placehold.co/200x300?text=No+Image"
                 }
+                // A 64px image only needs the thumbnail variant
+                srcSet={item.images?.srcset.webp}
+                sizes="64px"
                 onError={(e) => {
                   const target = e.currentTarget;
                   target.onerror = null;
+                  target.srcset = "";
                   target.src = "https://placehold.co/200x300?text=No+Image";
                 }}
                 alt={item.product_name || "Product image"}
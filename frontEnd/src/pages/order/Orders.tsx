@@ -4,28 +4,19 @@ import { setOrders } from "@/store/slices/productSlice";
 import { useEffect, useState } from "react";
 import { useDispatch } from "react-redux";
 import { OrderType } from "@/utils/types";
-import ReactPaginate from "react-paginate";
 
 const Orders: React.FC = () => {
-  const { data: orders = [], isLoading, error } = useGetOrdersByUserQuery({});
+  // The orders are paginated by the server; the cursor is the URL of the
+  // page to show, null for the first one
+  const [cursor, setCursor] = useState<string | null>(null);
+  const { data, isLoading, error } = useGetOrdersByUserQuery({ cursor });
+  const orders = data?.results ?? [];
   const dispatch = useDispatch();
 
-  // Pagination state
-  const [currentPage, setCurrentPage] = useState(0);
-  const ordersPerPage = 10;
-
   // Dispatch the fetched orders to the Redux store
   useEffect(() => {
-    dispatch(setOrders(orders));
-  }, [orders, dispatch]);
-
-  const offset = currentPage * ordersPerPage;
-  const currentOrders = orders.slice(offset, offset + ordersPerPage);
-  const pageCount = Math.ceil(orders.length / ordersPerPage);
-
-  const handlePageClick = ({ selected }: { selected: number }) => {
-    setCurrentPage(selected);
-  };
+    dispatch(setOrders(data?.results ?? []));
+  }, [data, dispatch]);
 
   if (isLoading)
     return (
@@ -35,6 +26,14 @@ const Orders: React.FC = () => {
     );
 
   if (error) {
+    return (
+      <div className="rounded-md border border-red-300 bg-red-100 p-4 text-red-700 shadow-sm">
+        <strong>Failed to load orders!</strong>
+      </div>
+    );
+  }
+
+  if (!cursor && orders.length === 0) {
     return (
       <div className="rounded-md border border-red-300 bg-red-100 p-4 text-red-700 shadow-sm">
         <strong>No order found!</strong>
@@ -46,9 +45,9 @@ const Orders: React.FC = () => {
     <div className="mx-auto mt-10 max-w-2xl p-4">
       <h2 className="mb-4 text-2xl font-semibold">Your Orders</h2>
 
-      {/* Map paginated orders to display as list */}
+      {/* Map the current page of orders to display as list */}
       <ul className="divide-y divide-gray-200">
-        {currentOrders.map((order: OrderType) => (
+        {orders.map((order: OrderType) => (
           <li key={order.id} className="flex items-center justify-between py-4">
             <div>
               <p className="text-lg font-medium">Order #{order.id}</p>
@@ -67,21 +66,23 @@ const Orders: React.FC = () => {
       </ul>
 
       {/* Pagination buttons */}
-      <div className="mt-6 flex justify-center">
-        <ReactPaginate
-          pageCount={pageCount}
-          pageRangeDisplayed={2}
-          marginPagesDisplayed={1}
-          onPageChange={handlePageClick}
-          containerClassName="flex space-x-2 text-sm"
-          pageClassName="border px-3 py-1 rounded hover:bg-gray-100"
-          activeClassName="bg-cyan-600 text-white border-cyan-600"
-          previousClassName="border px-3 py-1 rounded hover:bg-gray-100"
-          nextClassName="border px-3 py-1 rounded hover:bg-gray-100"
-          breakClassName="px-2 py-1"
-          previousLabel="←"
-          nextLabel="→"
-        />
+      <div className="mt-6 flex justify-center space-x-2 text-sm">
+        <button
+          type="button"
+          disabled={!data?.previous}
+          onClick={() => setCursor(data?.previous ?? null)}
+          className="rounded border px-3 py-1 hover:bg-gray-100 disabled:opacity-50"
+        >
+          ←
+        </button>
+        <button
+          type="button"
+          disabled={!data?.next}
+          onClick={() => setCursor(data?.next ?? null)}
+          className="rounded border px-3 py-1 hover:bg-gray-100 disabled:opacity-50"
+        >
+          →
+        </button>
       </div>
     </div>
   );
@@ -1,18 +1,21 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Link } from "react-router-dom";
 import { useAppDispatch } from "@/utils/hooks";
 import { setCart } from "@/store/slices/productSlice";
 import {
+  productApi,
   useGetCartItemsByUserQuery,
-  useUpdateCartItemMutation,
-  useDeleteCartItemMutation,
+  useBatchCartMutation,
   useClearCartMutation,
 } from "@/services/productApi";
 import CartSummary from "./CartSummary";
-import { CartItemType } from "@/utils/types";
+import { CartItemType, CartOperation } from "@/utils/types";
 import ReactPaginate from "react-paginate";
 
 const ITEMS_PER_PAGE = 8; // Number of items per page
+const BATCH_DELAY_MS = 400; // Quiet time before queued cart changes are sent
+
+type ItemAction = "increment" | "decrement" | "remove";
 
 const ShoppingCart = () => {
   const dispatch = useAppDispatch();
@@ -23,10 +26,13 @@ const ShoppingCart = () => {
     error,
     refetch,
   } = useGetCartItemsByUserQuery({});
-  const [updateCartItem] = useUpdateCartItemMutation();
-  const [deleteCartItem] = useDeleteCartItemMutation();
+  const [batchCart] = useBatchCartMutation();
   const [clearCart] = useClearCartMutation();
 
+  // Cart changes queued while the user is still clicking
+  const pendingOperations = useRef<CartOperation[]>([]);
+  const flushTimer = useRef<ReturnType<typeof setTimeout> | undefined>(undefined);
+
   const [currentPage, setCurrentPage] = useState(0);
 
   useEffect(() => {
@@ -53,23 +59,66 @@ const ShoppingCart = () => {
     setCurrentPage(selected);
   };
 
-  // Modify cart item quantity or remove
-  const modifyCartItem = async (itemId: number, action: string) => {
+  // Send every queued change in one batch request and show the returned cart
+  const flushOperations = async () => {
+    const operations = pendingOperations.current;
+    pendingOperations.current = [];
+    if (operations.length === 0) return;
+
     try {
-      if (action === "remove") {
-        await deleteCartItem(itemId).unwrap();
-      } else {
-        await updateCartItem({ id: itemId, action }).unwrap();
-      }
-      await refetch();
+      const snapshot = await batchCart(operations).unwrap();
+      dispatch(
+        productApi.util.upsertQueryData("getCartItemsByUser", {}, snapshot),
+      );
     } catch (err) {
       console.error("Error modifying cart item:", err);
       alert("Failed to modify cart item");
+      await refetch();
     }
   };
 
+  // Send anything still queued when leaving the page
+  useEffect(() => {
+    return () => {
+      clearTimeout(flushTimer.current);
+      flushOperations();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
+  // Modify cart item quantity or remove. The change is shown right away and
+  // queued; rapid clicks are sent together once the user pauses
+  const modifyCartItem = (itemId: number, action: ItemAction) => {
+    dispatch(
+      productApi.util.updateQueryData("getCartItemsByUser", {}, (draft) => {
+        const item = draft?.items?.find((i: CartItemType) => i.id === itemId);
+        if (!item) return;
+        const unitPrice = item.total_price / item.quantity;
+        const quantity =
+          action === "increment"
+            ? item.quantity + 1
+            : action === "decrement"
+              ? item.quantity - 1
+              : 0;
+        draft.total_price += unitPrice * (quantity - item.quantity);
+        if (quantity <= 0) {
+          draft.items = draft.items.filter((i: CartItemType) => i.id !== itemId);
+        } else {
+          item.quantity = quantity;
+          item.total_price = unitPrice * quantity;
+        }
+      }),
+    );
+
+    pendingOperations.current.push({ op: action, item: itemId });
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flushOperations, BATCH_DELAY_MS);
+  };
+
   // Clear the entire cart
   const handleClearCart = async () => {
+    clearTimeout(flushTimer.current);
+    pendingOperations.current = [];
     try {
       await clearCart({}).unwrap();
       await refetch();
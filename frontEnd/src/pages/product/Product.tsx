@@ -2,7 +2,10 @@ import { useEffect, useState } from "react";
 import { Radio, RadioGroup } from "@headlessui/react";
 import { useParams } from "react-router-dom";
 import { useAppSelector, useAppDispatch } from "@/utils/hooks";
-import { useCreateCartItemMutation } from "@/services/productApi";
+import {
+  useCreateCartItemMutation,
+  useGetProductByIdQuery,
+} from "@/services/productApi";
 import { setCart } from "@/store/slices/productSlice";
 import { Product as ProductType } from "@/utils/types";
 
@@ -32,9 +35,13 @@ const Product = () => {
   const products = useAppSelector(
     (state) => state.products.products,
   ) as ProductType[]; // Get products from the Redux store
-  const product = products.find((product) => product.id === productId) as
-    | ProductType
-    | undefined; // Find the product by id
+  const loadedProduct = products.find((product) => product.id === productId); // Find the product by id
+  // Products past the loaded catalog pages are fetched on their own
+  const { data: fetchedProduct, isLoading } = useGetProductByIdQuery(
+    productId as number,
+    { skip: productId === null || loadedProduct !== undefined },
+  );
+  const product = (loadedProduct ?? fetchedProduct) as ProductType | undefined;
   const [selectedColor, setSelectedColor] = useState<string | null>(null);
   const [selectedSize, setSelectedSize] = useState<string | null>(null);
 
@@ -73,6 +80,9 @@ const Product = () => {
     }
   };
 
+  if (!product && isLoading) {
+    return <div className="p-4 text-gray-600">Loading product...</div>;
+  }
   if (!product) {
     return <div className="p-4 text-red-500">Product not found</div>;
   }
@@ -16,6 +16,8 @@ const ProductCard: React.FC<ProductCardProps> = ({ product }) => {
       <Link key={product.id} to={`/products/${product.id}`}>
         <LazyImage
           src={imgSrc}
+          srcSet={product.images?.srcset.webp}
+          sizes="(min-width: 1280px) 25vw, (min-width: 640px) 50vw, 100vw"
           alt={product.name + " image"}
           className="aspect-square w-full rounded-lg bg-gray-200 object-cover group-hover:opacity-75 xl:aspect-7/8"
         />
@@ -1,5 +1,7 @@
 import { useState } from "react";
-import { useAppSelector } from "@/utils/hooks";
+import { useAppDispatch, useAppSelector } from "@/utils/hooks";
+import { useLazyGetProductsQuery } from "@/services/productApi";
+import { appendProductsPage } from "@/store/slices/productSlice";
 import { Product } from "@/utils/types";
 import ProductFilters from "@/components/filters/ProductFilters";
 import ProductGrid from "@/components/product/ProductGrid";
@@ -17,7 +19,21 @@ const ITEMS_PER_PAGE = 8;
  */
 const Products = () => {
   const products = useAppSelector((state) => state.products.products) as Product[];
+  const nextCursor = useAppSelector((state) => state.products.nextProductsCursor);
   const [currentPage, setCurrentPage] = useState(0);
+  const dispatch = useAppDispatch();
+  const [fetchProducts, { isFetching }] = useLazyGetProductsQuery();
+
+  // Fetch the next cursor page of the catalog into the store
+  const loadMoreProducts = async () => {
+    if (!nextCursor) return;
+    try {
+      const page = await fetchProducts({ cursor: nextCursor }).unwrap();
+      dispatch(appendProductsPage({ results: page.results, next: page.next }));
+    } catch (error) {
+      console.error("Error loading more products:", error);
+    }
+  };
 
   // Use custom hook for filter logic
   const {
@@ -96,6 +112,18 @@ const Products = () => {
                 currentPage={currentPage}
                 onPageChange={setCurrentPage}
               />
+              {nextCursor && (
+                <div className="mt-8 text-center">
+                  <button
+                    type="button"
+                    onClick={loadMoreProducts}
+                    disabled={isFetching}
+                    className="rounded-md bg-cyan-600 px-5 py-2 text-sm font-medium text-white shadow hover:bg-cyan-700 disabled:opacity-50"
+                  >
+                    {isFetching ? "Loading..." : "Load more products"}
+                  </button>
+                </div>
+              )}
             </div>
           </div>
         </section>
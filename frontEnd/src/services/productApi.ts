@@ -1,20 +1,35 @@
 import { getHeaderAuthorization } from "../utils/functions";
+import {
+  CartOperation,
+  CartType,
+  OrderQueryParams,
+  OrderType,
+  PaginatedResponse,
+  Product,
+  ProductQueryParams,
+} from "../utils/types";
 import baseApi from "./baseApi";
 
 export const productApi = baseApi.injectEndpoints({
   endpoints: (builder) => ({
-    // Fetch all products
-    getProducts: builder.query({
-      query: () => ({
-        url: "/api/products",
+    // Fetch a page of products. The response is cursor paginated:
+    // pass the `next` or `previous` URL from a page to fetch its neighbour.
+    // Filters and ordering are applied by the server and carried in the cursors
+    getProducts: builder.query<
+      PaginatedResponse<Product>,
+      { cursor?: string | null; pageSize?: number; filters?: ProductQueryParams }
+    >({
+      query: ({ cursor, pageSize, filters } = {}) => ({
+        url: cursor ?? "/api/products/",
         method: "GET",
+        params: cursor ? undefined : { page_size: pageSize, ...filters },
         headers: getHeaderAuthorization(),
       }),
     }),
     // Fetch a product by ID
-    getProductById: builder.query({
+    getProductById: builder.query<Product, number>({
       query: (id) => ({
-        url: `/api/products/${id}`,
+        url: `/api/products/${id}/`,
         method: "GET",
         headers: getHeaderAuthorization(),
       }),
@@ -72,11 +87,25 @@ export const productApi = baseApi.injectEndpoints({
       }),
       invalidatesTags: ["Cart"],
     }),
-    // Fetch orders for the current user
-    getOrdersByUser: builder.query({
-      query: () => ({
-        url: "/api/orders/me",
+    // Apply several cart operations in one request; returns the cart snapshot
+    batchCart: builder.mutation<CartType, CartOperation[]>({
+      query: (operations) => ({
+        url: "/api/cart/batch/",
+        method: "POST",
+        body: { operations },
+        headers: getHeaderAuthorization(),
+      }),
+    }),
+    // Fetch a page of the current user's orders, newest first. Like
+    // getProducts, pass the `next` or `previous` URL of a page as cursor.
+    getOrdersByUser: builder.query<
+      PaginatedResponse<OrderType>,
+      { cursor?: string | null; filters?: OrderQueryParams }
+    >({
+      query: ({ cursor, filters } = {}) => ({
+        url: cursor ?? "/api/orders/me/",
         method: "GET",
+        params: cursor ? undefined : filters,
         headers: getHeaderAuthorization(),
       }),
       providesTags: ["Orders"],
@@ -105,6 +134,7 @@ export const productApi = baseApi.injectEndpoints({
 // Export hooks for the defined endpoints
 export const {
   useGetProductsQuery,
+  useLazyGetProductsQuery,
   useGetProductByIdQuery,
   useGetCartItemsByUserQuery,
   useAddToCartMutation,
@@ -112,6 +142,7 @@ export const {
   useUpdateCartItemMutation,
   useDeleteCartItemMutation,
   useCreateCartItemMutation,
+  useBatchCartMutation,
   useGetOrdersByUserQuery,
   useGetOrderByIdQuery,
   useCreateOrderMutation,
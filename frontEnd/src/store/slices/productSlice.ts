@@ -6,12 +6,15 @@ import { Product } from "@/utils/types";
  */
 interface ProductsState {
   products: Product[];
+  // Cursor URL of the next catalog page, null once every page is loaded
+  nextProductsCursor: string | null;
   cart: any[]; // TODO: Define CartItem type
   orders: any[]; // TODO: Define Order type
 }
 
 const initialState: ProductsState = {
   products: [],
+  nextProductsCursor: null,
   cart: [],
   orders: [],
 };
@@ -26,6 +29,24 @@ const productsSlice = createSlice({
     setProducts: (state, action: PayloadAction<Product[]>) => {
       state.products = action.payload;
     },
+    // Start the catalog over from its first cursor page
+    setProductsPage: (
+      state,
+      action: PayloadAction<{ results: Product[]; next: string | null }>,
+    ) => {
+      state.products = action.payload.results;
+      state.nextProductsCursor = action.payload.next;
+    },
+    // Add the next cursor page; products already loaded are replaced
+    appendProductsPage: (
+      state,
+      action: PayloadAction<{ results: Product[]; next: string | null }>,
+    ) => {
+      const loaded = new Map(state.products.map((product) => [product.id, product]));
+      action.payload.results.forEach((product) => loaded.set(product.id, product));
+      state.products = Array.from(loaded.values());
+      state.nextProductsCursor = action.payload.next;
+    },
     setCart: (state, action: PayloadAction<any[]>) => {
       state.cart = action.payload;
     },
@@ -40,10 +61,18 @@ const productsSlice = createSlice({
       state.cart = [];
       state.orders = [];
       state.products = [];
+      state.nextProductsCursor = null;
     },
   },
 });
 
-export const { setProducts, setCart, setOrders, clearCart, resetStore } =
-  productsSlice.actions;
+export const {
+  setProducts,
+  setProductsPage,
+  appendProductsPage,
+  setCart,
+  setOrders,
+  clearCart,
+  resetStore,
+} = productsSlice.actions;
 export default productsSlice;
@@ -27,6 +27,7 @@ export interface CartItemType {
   product_id: number;
   product_name: string;
   product_image: string;
+  images?: ImageVariants | null;
   color: string;
   size: string;
   quantity: number;
@@ -42,6 +43,12 @@ export interface CartType {
   total_price: number;
 }
 
+// Operation accepted by the /api/cart/batch/ endpoint
+export type CartOperation =
+  | { op: "add"; product: number; quantity?: number; color?: string; size?: string }
+  | { op: "increment" | "decrement" | "remove"; item: number }
+  | { op: "set_quantity"; item: number; quantity: number };
+
 type ColorOption = {
   color: string;
   in_stock: boolean;
@@ -56,6 +63,16 @@ export type AuthHeaders = {
   Authorization: string;
 };
 
+// Resized variants of a product image; srcset strings list every
+// variant of a format with its width
+export interface ImageVariants {
+  original: string;
+  thumbnail: { webp: string; jpeg: string };
+  card: { webp: string; jpeg: string };
+  detail: { webp: string; jpeg: string };
+  srcset: { webp: string; jpeg: string };
+}
+
 export interface Product {
   id: number;
   name: string;
@@ -63,6 +80,7 @@ export interface Product {
   category: string;
   description: string;
   image: string;
+  images: ImageVariants | null;
   price: string | number;
   stock: number;
   colors: ColorOption[];
@@ -71,6 +89,30 @@ export interface Product {
   updated_at: string;
 }
 
+// Cursor paginated list response returned by the API
+export interface PaginatedResponse<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// Server-side filters and ordering accepted by /api/products/
+export interface ProductQueryParams {
+  category?: string;
+  brand?: string;
+  price_min?: number;
+  price_max?: number;
+  in_stock?: boolean;
+  ordering?: string;
+}
+
+// Filters accepted by /api/orders/me/; dates are YYYY-MM-DD
+export interface OrderQueryParams {
+  status?: string;
+  since?: string;
+  until?: string;
+}
+
 export interface Category {
   id: number;
   name: string;
@@ -87,6 +129,7 @@ export interface OrderSummaryType {
   shipping_address: string;
   payment_method: string;
   card?: { card_number: string; expiry: string };
+  item_count: number;
   total_price: number;
 }
 
@@ -99,6 +142,7 @@ export interface OrderType {
   payment_method: string;
   placed_at: string;
   status: string;
+  item_count: number;
   total_price: number;
   items: CartItemType[];
 }